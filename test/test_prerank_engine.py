@@ -0,0 +1,83 @@
+#!/bin/env python
+
+# regression tests of the preranked GSEA engine with cached null distributions (workflow/scripts/prerank_engine.py)
+# run with: python -m pytest test (the comparison with GSEApy is skipped if gseapy is not installed)
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workflow", "scripts"))
+
+from prerank_engine import NullCache, prerank, get_enrichment_scores, get_null_scores, normalize, PERMUTATIONS, SEED
+
+# synthetic ranked vector (descending scores) and 40 terms of 5 sizes, a quarter of them enriched among the top genes
+def get_synthetic_case(n_genes=500, n_terms=40, seed=3):
+    rng = np.random.default_rng(seed)
+    scores = np.sort(rng.normal(size=n_genes))[::-1].astype(np.float32)
+    ranks = {'gene_ids': np.arange(n_genes), 'genes': np.array(["G{}".format(i) for i in range(n_genes)]), 'scores': scores}
+    terms, gene_ids, indptr = [], [], [0]
+    for t in range(n_terms):
+        size = [10, 20, 30, 50, 80][t % 5]
+        genes = rng.choice(150, size, replace=False) if t % 4 == 0 else rng.choice(n_genes, size, replace=False)
+        terms.append("T{}".format(t))
+        gene_ids.extend(genes)
+        indptr.append(len(gene_ids))
+    index = {'terms': np.array(terms), 'indptr': np.array(indptr), 'gene_ids': np.array(gene_ids)}
+    return ranks, index
+
+def get_gene_sets(ranks, index):
+    return {term: list(ranks['genes'][index['gene_ids'][index['indptr'][i]:index['indptr'][i+1]]]) for i, term in enumerate(index['terms'])}
+
+def test_enrichment_scores_match_running_sum():
+    rng = np.random.default_rng(0)
+    weights = np.abs(np.sort(rng.normal(size=200))[::-1])
+    positions = np.sort(np.array([rng.choice(200, 15, replace=False) for _ in range(20)]), axis=1)
+    es, _ = get_enrichment_scores(positions, weights)
+    for row, term_positions in enumerate(positions):
+        hit = np.isin(np.arange(200), term_positions)
+        running = np.cumsum(np.where(hit, weights / weights[hit].sum(), -1 / (200 - 15)))
+        expected = running.max() if running.max() > -running.min() else running.min()
+        assert es[row] == pytest.approx(expected, abs=1e-12)
+
+# terms of equal size share one cached null: the FWER has to count each of them as a draw (as independent per-term nulls would)
+def test_fwer_counts_terms_sharing_a_null(tmp_path):
+    ranks, index = get_synthetic_case()
+    res = prerank(ranks, index, NullCache(str(tmp_path), ranks['scores'], PERMUTATIONS, SEED)).set_index('Term')
+
+    weights = np.abs(ranks['scores'].astype(np.float64))
+    sizes = np.diff(index['indptr'])
+    null_nes = []
+    for t, size in enumerate(sizes):
+        null = get_null_scores(weights, size, PERMUTATIONS, SEED + 1 + t)
+        null_nes.append(normalize(null, null))
+    null_nes = np.vstack(null_nes)
+    nes = res.loc[index['terms'], 'NES'].to_numpy()
+    expected = np.where(nes >= 0, (null_nes.max(axis=0)[None, :] >= nes[:, None]).mean(axis=1),
+                        (null_nes.min(axis=0)[None, :] <= nes[:, None]).mean(axis=1))
+    np.testing.assert_allclose(res.loc[index['terms'], 'FWER p-val'].to_numpy(), expected, atol=0.08)
+
+# same statistics as GSEApy's prerank within permutation noise (the random gene sets differ; both are seeded, i.e., deterministic):
+# over 30 seeds the largest deviations were 0.09 (nominal p-value) and 0.2 (FWER, steep in the NES), FDR (< 0.5) deviated by less than 0.15
+# in 27 of 30 seeds (ratio of tail fractions);
+# counting a shared null once per permutation (instead of once per term) deviated by 0.65 in FWER
+@pytest.mark.parametrize("seed", [3, 4, 5])
+def test_matches_gseapy(tmp_path, seed):
+    gp = pytest.importorskip("gseapy")
+    ranks, index = get_synthetic_case(seed=seed)
+    res = prerank(ranks, index, NullCache(str(tmp_path), ranks['scores'], PERMUTATIONS, SEED)).set_index('Term')
+
+    rnk = pd.DataFrame({'score': ranks['scores'].astype(np.float64)}, index=ranks['genes'])
+    expected = gp.prerank(rnk=rnk, gene_sets=get_gene_sets(ranks, index), min_size=1, max_size=100000, permutation_num=PERMUTATIONS,
+                          outdir=None, no_plot=True, seed=SEED, threads=1).res2d.set_index('Term')
+    expected = expected.loc[res.index, :]
+
+    np.testing.assert_allclose(res['ES'], expected['ES'].astype(float), atol=1e-4)
+    np.testing.assert_allclose(res['NES'], expected['NES'].astype(float), rtol=0.1, atol=0.05)
+    for column, tolerance in [('NOM p-val', 0.1), ('FWER p-val', 0.2)]:
+        np.testing.assert_allclose(res[column], expected[column].astype(float), atol=tolerance, err_msg=column)
+    # FDR of non-significant terms is dominated by permutation noise (ratio of tail fractions)
+    significant = expected['FDR q-val'].astype(float) < 0.5
+    np.testing.assert_allclose(res.loc[significant, 'FDR q-val'], expected.loc[significant, 'FDR q-val'].astype(float), atol=0.15)
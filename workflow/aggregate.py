@@ -1,108 +1,66 @@
 #!/usr/bin/env python3
 
 import os
+import argparse
 import subprocess
 import yaml
-import pandas as pd
+from scheduler import get_query_combinations, get_group_combinations, run_jobs
 
 # 加载配置文件
 config_path = os.path.abspath('test/config/example_enrichment_analysis_config.yaml')
 with open(config_path, 'r') as file:
     config = yaml.safe_load(file)
 
-result_path = os.path.abspath(config['result_path'])
-
-# 定义从组获取路径的函数
-def get_group_paths(group, tool, db, annot, regions_dict, genes_dict, rnk_dict):
-    feature_sets = list(annot.index[annot["group"] == group])
-
-    # 根据工具选择特定的 feature_sets
-    if tool in ["GREAT", "LOLA", "pycisTarget"]:
-        feature_sets = [fs for fs in feature_sets if fs in regions_dict.keys()]
-    elif tool in ["ORA_GSEApy", "RcisTarget"]:
-        feature_sets = [fs for fs in feature_sets if fs in genes_dict.keys()] + \
-                       [fs for fs in feature_sets if fs in regions_dict.keys()]
-    elif tool == "preranked_GSEApy":
-        feature_sets = [fs for fs in feature_sets if fs in rnk_dict.keys()]
-
-    # 生成文件路径
-    paths = [
-        os.path.join(result_path, fs, tool, db, f"{fs}_{db}.csv")
-        for fs in feature_sets
-    ]
-    return paths
-
-# 自动获取 group、tool 和 db 的函数
-def get_groups_tools_dbs(config):
-    annotation_path = os.path.abspath(config['annotation'])
-    annot = pd.read_csv(annotation_path, index_col='name')
-
-    groups = annot['group'].unique().tolist()
-    tools = list(config["column_names"].keys())
-    databases = list(config["local_databases"].keys())
-
-    return groups, tools, databases, annot
-
-# 从配置文件加载字典
-def load_dictionaries(config):
-    annot = pd.read_csv(config["annotation"], index_col='name')
-
-    genes = annot.loc[annot['features_path'].str.endswith('.txt'), :]
-    regions = annot.loc[annot['features_path'].str.endswith('.bed'), :]
-    genes_dict = genes.to_dict('index')
-    regions_dict = regions.to_dict('index')
-
-    rnk = annot.loc[annot['features_path'].str.endswith('.csv'),:]
-    rnk_dict = rnk.to_dict('index')
-
-    return regions_dict, genes_dict, rnk_dict
+result_path = os.path.join(os.path.abspath(config['result_path']), "enrichment_analysis")
+
+# 项目范围的多重检验校正（significance: BH/BY，scope: project）需要在聚合之前对所有结果一次完成
+significance = config.get("significance", None) or {}
+project_adjp_path = os.path.join(result_path, "project_adjusted_pvalues.npz") if significance.get("method", "tool") != "tool" and significance.get("scope", "query") == "project" else None
+
+# 构建一个 group/tool/db 组合的聚合任务（名称、命令、日志文件）及其输出目录
+def aggregate_job(conda_env, group, tool, db, feature_sets):
+    output_dir = os.path.join(result_path, group, tool, db)
+    enrichment_results = [os.path.join(result_path, fs, tool, db, f"{fs}_{db}.csv") for fs in feature_sets]
+    log_file = os.path.join("logs", f"aggregate_{group}_{tool}_{db}.log")
+
+    # 调用 scripts/aggregate.py
+    script_path = os.path.abspath("workflow/scripts/aggregate.py")
+    command = [
+        'conda', 'run', '--no-capture-output', '-p', conda_env,
+        'python', script_path,
+        '--enrichment_results', *enrichment_results,
+        '--results_all', os.path.join(output_dir, f"{group}_{db}_all.csv"),
+        '--results_sig', os.path.join(output_dir, f"{group}_{db}_sig.csv"),
+        '--plot_data', os.path.join(output_dir, f"{group}_{db}_plot_data.csv"),
+        '--matrices', os.path.join(output_dir, f"{group}_{db}_matrices.npz"),
+        '--terms', os.path.join(output_dir, f"{group}_{db}_terms.txt"),
+        '--feature_sets', os.path.join(output_dir, f"{group}_{db}_feature_sets.txt"),
+        '--group', group,
+        '--tool', tool,
+        '--db', db,
+        '--config', config_path
+    ] + (['--project_adjp', project_adjp_path] if project_adjp_path is not None else [])
+    return (f"Aggregation of group '{group}', tool '{tool}', and database '{db}'", command, log_file), output_dir
 
 # 主函数
 def main():
+    parser = argparse.ArgumentParser(description="Aggregate the enrichment results per group, tool and database.")
+    parser.add_argument('--cores', type=int, default=os.cpu_count(), help="Number of aggregations run in parallel.")
+    args = parser.parse_args()
+
     conda_env = os.environ.get('CONDA_PREFIX')
     if conda_env is None:
         raise RuntimeError("Conda environment not found. Ensure the script is run within a Snakemake conda environment.")
 
-    # 加载注释文件和字典
-    groups, tools, databases, annot = get_groups_tools_dbs(config)
-    regions_dict, genes_dict, rnk_dict = load_dictionaries(config)
-
-    for group in groups:
-        for tool in tools:
-            for db in databases:
-                enrichment_results = get_group_paths(group, tool, db, annot, regions_dict, genes_dict, rnk_dict)
-                if not enrichment_results:
-                    continue
-
-                results_all = os.path.join(result_path, "enrichment_analysis", group, tool, db, f"{group}_{db}_all.csv")
-                results_sig = os.path.join(result_path, "enrichment_analysis", group, tool, db, f"{group}_{db}_sig.csv")
-                log_file = os.path.join("logs", f"aggregate_{group}_{tool}_{db}.log")
-
-                os.makedirs(os.path.dirname(results_all), exist_ok=True)
-                os.makedirs(os.path.dirname(log_file), exist_ok=True)
-
-                # 调用 scripts/aggregate.py
-                script_path = os.path.abspath("workflow/scripts/aggregate.py")
-                command = [
-                    'conda', 'run', '--no-capture-output', '-p', conda_env,
-                    'python', script_path,
-                    '--enrichment_results', *enrichment_results,
-                    '--results_all', results_all,
-                    '--results_sig', results_sig,
-                    '--group', group,
-                    '--tool', tool,
-                    '--db', db,
-                    '--config', config_path
-                ]
-
-                with open(log_file, 'w') as log:
-                    result = subprocess.run(command, stdout=log, stderr=log, text=True)
+    if project_adjp_path is not None:
+        result_paths = [os.path.join(result_path, fs, tool, db, f"{fs}_{db}.csv") for fs, tool, db in get_query_combinations(config)]
+        subprocess.run(['conda', 'run', '--no-capture-output', '-p', conda_env, 'python', os.path.abspath("workflow/scripts/significance.py"),
+                        '--results', *result_paths, '--output', project_adjp_path, '--config', config_path], check=True)
 
-                if result.returncode != 0:
-                    print(f"Aggregation failed for group '{group}', tool '{tool}', and database '{db}'. Check the log file {log_file} for details.")
-                else:
-                    print(f"Aggregation completed successfully for group '{group}', tool '{tool}', and database '{db}'.")
-                    print(f"Results saved in:\n  - {results_all}\n  - {results_sig}")
+    # 只枚举有效的 group/tool/db 组合（至少包含一个与工具兼容的查询集）
+    combinations = [aggregate_job(conda_env, group, tool, db, feature_sets) for group, tool, db, feature_sets in get_group_combinations(config)]
+    run_jobs([job for job, _ in combinations], args.cores, [directory for _, directory in combinations])
+    print(f"Results saved in {result_path}/{{group}}/{{tool}}/{{db}}/")
 
 if __name__ == "__main__":
     main()
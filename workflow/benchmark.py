@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import ast
+import json
+import time
+import glob
+import argparse
+import platform
+import subprocess
+import yaml
+import pandas as pd
+
+# Get the absolute path of the current script
+current_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(current_dir)
+
+# Workflow stages and the rules (i.e., benchmark folders) they consist of
+STAGES = {
+    "prepare_databases": ["prepare_databases"],
+    "ORA": ["gene_ORA_GSEApy", "gene_ORA_GSEApy_multi_db", "region_ORA_weighted"],
+    "prerank": ["prepare_ranks_GSEApy", "gene_preranked_GSEApy"],
+    "aggregate": ["aggregate", "adjust_pvalues_project"],
+    "visualize": ["visualize"],
+    "GREAT": ["region_gene_association_GREAT", "region_enrichment_analysis_GREAT"],
+    "LOLA": ["region_enrichment_analysis_LOLA"],
+    "pycisTarget": ["region_motif_enrichment_analysis_pycisTarget"],
+    "RcisTarget": ["gene_motif_enrichment_analysis_RcisTarget"],
+}
+
+# Job scripts whose startup time (module-level imports, i.e., the floor of every job) is measured with --startup
+STARTUP_SCRIPTS = ["gene_ORA_GSEApy.py", "gene_ORA_multi_db.py", "gene_preranked_GSEApy.py", "region_ORA_weighted.py", "prepare_ranks_GSEApy.py", "aggregate.py"]
+
+# Module-level imports of a script, including lazy imports (see workflow/scripts/lazy_imports.py)
+def get_startup_code(script_path):
+    with open(script_path, 'r') as f:
+        tree = ast.parse(f.read())
+    statements = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+                  or (isinstance(node, ast.Assign) and isinstance(node.value, ast.Call) and getattr(node.value.func, 'id', None) == 'lazy_import')]
+    return "\n".join(ast.unparse(node) for node in statements)
+
+# Fastest of several fresh interpreters executing the module-level imports of a script (from the scripts directory)
+def measure_startup(code, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', code], cwd=os.path.join(current_dir, 'scripts'), capture_output=True, text=True)
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1]}
+        times.append(time.perf_counter() - start)
+    return {"min_s": round(min(times), 3), "median_s": round(sorted(times)[len(times) // 2], 3)}
+
+def run_startup_benchmark(repeats):
+    startup = {"interpreter": measure_startup("pass", repeats)}
+    for script in STARTUP_SCRIPTS:
+        startup[script] = measure_startup(get_startup_code(os.path.join(current_dir, 'scripts', script)), repeats)
+        print("{:<30} {}".format(script, startup[script].get("min_s", startup[script].get("error"))))
+    return startup
+
+# Generate the synthetic data and configuration of a scenario
+def generate_data(scenario_dir, parameters, seed):
+    command = [sys.executable, os.path.join(current_dir, 'scripts', 'generate_synthetic_data.py'),
+               '--output', scenario_dir,
+               '--config_template', os.path.join(repo_dir, 'config', 'config.yaml'),
+               '--seed', str(seed)]
+    for key, value in parameters.items():
+        command += [f'--{key}', str(value)]
+    subprocess.run(command, check=True)
+
+# Run the workflow on a generated scenario
+def run_workflow(scenario_dir, snakemake_args):
+    command = ['snakemake',
+               '--snakefile', os.path.join(current_dir, 'Snakefile'),
+               '--directory', scenario_dir,
+               '--configfile', os.path.join(scenario_dir, 'config', 'config.yaml'),
+               ] + snakemake_args
+    log_file = os.path.join(scenario_dir, 'benchmark_snakemake.log')
+    start = time.time()
+    with open(log_file, 'w') as log:
+        result = subprocess.run(command, stdout=log, stderr=log, text=True)
+    return result.returncode, time.time() - start
+
+# Summarize the Snakemake benchmark files per stage
+def collect_stages(scenario_dir):
+    stages = {}
+    for stage, rules in STAGES.items():
+        paths = [path for rule in rules for path in glob.glob(os.path.join(scenario_dir, 'benchmarks', rule, '*.tsv'))]
+        if len(paths) == 0:
+            continue
+        benchmarks = pd.concat([pd.read_csv(path, sep='\t').tail(1) for path in paths])
+        stages[stage] = {
+            "jobs": len(paths),
+            "total_s": round(float(benchmarks["s"].sum()), 3),
+            "mean_s": round(float(benchmarks["s"].mean()), 3),
+            "max_s": round(float(benchmarks["s"].max()), 3),
+            "cpu_time_s": round(float(benchmarks["cpu_time"].sum()), 3),
+            "max_rss_mb": round(float(benchmarks["max_rss"].max()), 3),
+        }
+    return stages
+
+# Compare a report against a baseline report and list stages that got slower than the tolerance allows
+def find_regressions(report, baseline, tolerance, min_seconds):
+    regressions = []
+    for scenario, result in report["scenarios"].items():
+        if scenario not in baseline["scenarios"]:
+            continue
+        for stage, stats in result["stages"].items():
+            reference = baseline["scenarios"][scenario]["stages"].get(stage)
+            if reference is None:
+                continue
+            for metric in ["total_s", "max_rss_mb"]:
+                if stats[metric] > reference[metric] * (1 + tolerance) and (metric != "total_s" or stats[metric] - reference[metric] > min_seconds):
+                    regressions.append(f"{scenario}/{stage}: {metric} {reference[metric]} -> {stats[metric]}")
+    return regressions
+
+def get_git_commit():
+    result = subprocess.run(['git', '-C', repo_dir, 'rev-parse', 'HEAD'], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the workflow stages on synthetic data at different scales.")
+    parser.add_argument("--scenarios", default=os.path.join(repo_dir, 'test', 'config', 'benchmark_scenarios.yaml'), help="YAML file with the benchmark scenarios.")
+    parser.add_argument("--select", nargs='*', default=None, help="Names of the scenarios to run (default: all).")
+    parser.add_argument("--output", default=os.path.join('.test', 'benchmark'), help="Output directory for the generated data, results and the report.")
+    parser.add_argument("--report", default=None, help="Path of the JSON report (default: <output>/benchmark_report.json).")
+    parser.add_argument("--baseline", default=None, help="JSON report of a previous run to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative increase of runtime and peak memory per stage compared to the baseline.")
+    parser.add_argument("--min_seconds", type=float, default=5, help="Runtime increases below this many seconds are not reported as regression.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the synthetic data.")
+    parser.add_argument("--snakemake_args", default="--cores 1 --use-conda", help="Additional arguments passed to Snakemake.")
+    parser.add_argument("--startup", action='store_true', help="Only measure the per-job startup time (module-level imports) of the job scripts.")
+    parser.add_argument("--repeats", type=int, default=5, help="Repetitions of each startup measurement (--startup).")
+    args = parser.parse_args()
+
+    if args.startup:
+        report = {
+            "git_commit": get_git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": sys.executable,
+            "startup": run_startup_benchmark(max(args.repeats, 1)),
+        }
+        report_path = args.report if args.report is not None else os.path.join(args.output, 'startup_report.json')
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Startup report saved in {report_path}")
+        return
+
+    with open(args.scenarios, 'r') as file:
+        scenarios = yaml.safe_load(file)
+    if args.select:
+        scenarios = {name: scenarios[name] for name in args.select}
+
+    report = {
+        "git_commit": get_git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "seed": args.seed,
+        "snakemake_args": args.snakemake_args,
+        "scenarios": {},
+    }
+
+    for name, parameters in scenarios.items():
+        scenario_dir = os.path.abspath(os.path.join(args.output, name))
+        print(f"Generating synthetic data for scenario '{name}'...")
+        generate_data(scenario_dir, parameters, args.seed)
+        print(f"Running workflow for scenario '{name}'...")
+        returncode, wall_time = run_workflow(scenario_dir, args.snakemake_args.split())
+        if returncode != 0:
+            print(f"Workflow failed for scenario '{name}'. Check the log file {os.path.join(scenario_dir, 'benchmark_snakemake.log')} for details.")
+        report["scenarios"][name] = {
+            "parameters": parameters,
+            "success": returncode == 0,
+            "wall_time_s": round(wall_time, 3),
+            "stages": collect_stages(scenario_dir),
+        }
+
+    report_path = args.report if args.report is not None else os.path.join(args.output, 'benchmark_report.json')
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Benchmark report saved in {report_path}")
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.tolerance, args.min_seconds)
+        if len(regressions) > 0:
+            print("Performance regressions compared to {}:\n  - {}".format(args.baseline, "\n  - ".join(regressions)))
+            sys.exit(1)
+        print("No performance regressions compared to {}.".format(args.baseline))
+
+    if not all(result["success"] for result in report["scenarios"].values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
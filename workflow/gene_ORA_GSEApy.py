@@ -2,7 +2,6 @@ import os
 import subprocess
 import yaml
 import pandas as pd
-import gseapy as gp
 
 # Load the configuration file
 config_path = os.path.abspath('test/config/example_enrichment_analysis_config.yaml')
@@ -57,6 +56,9 @@ def get_gene_path(gene_set):
 
 # Define the main function to run ORA analysis using GSEApy
 def run_ora_analysis(gene_set, database, conda_env):
+    # gseapy is only imported when an analysis is run (its import takes seconds)
+    import gseapy as gp
+
     # Get the paths for the gene set and database
     gene_path = get_gene_path(gene_set)
     database_path = os.path.abspath(database_dict[database])
@@ -2,11 +2,6 @@ import os
 import subprocess
 import yaml
 import pandas as pd
-from rpy2.robjects import r, pandas2ri
-from rpy2.robjects.packages import importr
-
-# Enable the conversion between R and pandas data frames
-pandas2ri.activate()
 
 # Load the configuration file
 config_path = os.path.abspath('test/config/example_enrichment_analysis_config.yaml')
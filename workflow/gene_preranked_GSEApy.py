@@ -1,6 +1,5 @@
 import os
 import pandas as pd
-import gseapy as gp
 import yaml
 
 # 加载配置文件
@@ -43,6 +42,9 @@ def get_database():
 
 # 定义进行 GSEA 分析的主函数
 def gene_preranked_GSEApy(gene_set, database):
+    # 仅在运行分析时导入 gseapy（导入需要数秒）
+    import gseapy as gp
+
     ranked_genes_path = get_gene_path(gene_set)
     database_path = os.path.abspath(os.path.join("resources", config["project_name"], f"{database}.gmt"))
     output_dir = os.path.abspath(os.path.join(result_path, gene_set, 'preranked_GSEApy', database))
@@ -1,7 +1,8 @@
 import os
+import argparse
 import subprocess
 import yaml
-import pandas as pd
+from scheduler import get_query_combinations, run_jobs
 
 # Load the configuration file
 config_path = os.path.abspath('test/config/example_enrichment_analysis_config.yaml')
@@ -25,68 +26,32 @@ def create_conda_env(env_name, env_file):
         print(f"An error occurred while creating the Conda environment: {e}")
         exit(1)
 
-# Main function to plot enrichment results
-def plot_enrichment_result(feature_set, tool, db, conda_env):
+# Build the plotting job (name, command, log file) of one feature set, tool and database combination
+def plot_enrichment_result_job(feature_set, tool, db, conda_env):
     r_script = 'workflow/scripts/enrichment_plot.R'
 
     # Log file path
     log_file = os.path.join(result_path, 'logs', f'plot_enrichment_result_{tool}_{feature_set}_{db}.log')
 
-    # Ensure the output directory exists
-    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-
-    # Print paths for debugging
-    print(f"Processing feature set: {feature_set}, tool: {tool}, database: {db}")
-
     # Construct the command to run the R script
     command = [
         'conda', 'run', '--no-capture-output', '--name', conda_env,
         'Rscript', r_script, feature_set, tool, db
     ]
-
-    # Run the R script
-    with open(log_file, 'w') as log:
-        result = subprocess.run(command, stdout=log, stderr=log, text=True)
-
-    if result.returncode != 0:
-        raise RuntimeError(f"Plotting enrichment result failed for feature set '{feature_set}', tool '{tool}', and database '{db}'. Check the log file {log_file} for details.")
-    else:
-        print(f"Plotting completed successfully for feature set '{feature_set}', tool '{tool}', and database '{db}'.")
-
-# Automatically retrieve feature_set, tool, and db
-def get_feature_sets_tools_dbs(config):
-    # Load annotation file to get feature_set and tool names
-    annotation_path = os.path.abspath(config['annotation'])
-    annot = pd.read_csv(annotation_path, index_col='name')
-
-    # Extract available feature_set
-    feature_sets = annot.index.unique().tolist()
-
-    # Extract available tools (tool) and databases (db)
-    tools = config["column_names"].keys()
-    databases = config["local_databases"].keys()
-
-    return feature_sets, tools, databases
+    return f"Plotting enrichment result of feature set '{feature_set}', tool '{tool}', and database '{db}'", command, log_file
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot the enrichment results of all queries.")
+    parser.add_argument('--cores', type=int, default=os.cpu_count(), help="Number of plots rendered in parallel.")
+    args = parser.parse_args()
+
     # Create Conda environment
     conda_env = 'visualization'
     env_file = os.path.abspath('workflow/envs/visualization.yaml')
     create_conda_env(conda_env, env_file)
 
-    # Automatically get available feature_set, tool, and db
-    feature_sets, tools, databases = get_feature_sets_tools_dbs(config)
-
-    print("feature_sets", feature_sets)
-    print("tools", tools)
-    print("databases", databases)
+    # Only the valid combinations: tools compatible with the query type (regions, genes or ranked genes) and their configured databases
+    combinations = get_query_combinations(config)
+    print(f"Plotting {len(combinations)} feature set, tool and database combinations")
 
-    # Loop through all combinations of feature_set, tool, and db
-    for feature_set in feature_sets:
-        for tool in tools:
-            for db in databases:
-                try:
-                    plot_enrichment_result(feature_set, tool, db, conda_env)
-                except RuntimeError as e:
-                    print(e)
-                    print(f"Skipping combination: feature set '{feature_set}', tool '{tool}', database '{db}'")
+    run_jobs([plot_enrichment_result_job(feature_set, tool, db, conda_env) for feature_set, tool, db in combinations], args.cores)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# on-demand rendering of the enrichment and group summary plots (e.g., after a run with lazy_plots: 1):
+# a plot is rendered from its result table or precomputed plot data on first request and cached next to it,
+# it is only re-rendered if its data is newer than the cached plot (or with --force)
+
+import os
+import argparse
+import yaml
+from scheduler import load_dictionaries, get_query_combinations, get_group_combinations, run_jobs
+
+# result table and enrichment plot of one query, tool and database
+def get_enrichment_plot_paths(result_path, feature_set, tool, db):
+    output_dir = os.path.join(result_path, feature_set, tool, db)
+    return os.path.join(output_dir, f"{feature_set}_{db}.csv"), [os.path.join(output_dir, f"{feature_set}_{db}.png")]
+
+# plot data and summary plots (bubble plot and heatmaps) of one group, tool and database
+def get_summary_plot_paths(result_path, group, tool, db):
+    output_dir = os.path.join(result_path, group, tool, db)
+    return os.path.join(output_dir, f"{group}_{db}_plot_data.csv"), [os.path.join(output_dir, f"{group}_{db}_summary.png"),
+                                                                      os.path.join(output_dir, f"{group}_{db}_adjp_heatmap.pdf"),
+                                                                      os.path.join(output_dir, f"{group}_{db}_effect_heatmap.pdf")]
+
+# cached plots exist and are not older than their data
+def is_cached(data_path, plot_paths):
+    return all(os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(data_path) for path in plot_paths)
+
+# rendering job (name, command, log file) of one enrichment plot
+def enrichment_plot_job(rscript, config, config_path, feature_set, tool, db):
+    command = rscript + [os.path.abspath('workflow/scripts/enrichment_plot.R'), feature_set, tool, db, os.path.abspath(config['result_path']), config_path]
+    log_file = os.path.join("logs", "render_plots", f"plot_enrichment_result_{tool}_{feature_set}_{db}.log")
+    return f"Enrichment plot of feature set '{feature_set}', tool '{tool}', and database '{db}'", command, log_file
+
+# rendering job (name, command, log file) of the summary plots of one group
+def summary_plot_job(rscript, config_path, plot_data_path, plot_paths, group, tool, db):
+    command = rscript + [os.path.abspath('workflow/scripts/overview_plot.R'), plot_data_path] + plot_paths + [tool, db, group, config_path]
+    log_file = os.path.join("logs", "render_plots", f"visualize_{group}_{tool}_{db}.log")
+    return f"Summary plots of group '{group}', tool '{tool}', and database '{db}'", command, log_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Render requested enrichment and summary plots on demand, reusing cached plots whose data did not change.")
+    parser.add_argument('--config', default='test/config/example_enrichment_analysis_config.yaml', help="Path to the config file of the run.")
+    parser.add_argument('--plots', choices=['all', 'enrichment', 'summary'], default='all', help="Which plots to render.")
+    parser.add_argument('--feature_set', nargs='+', default=None, help="Only enrichment plots of these queries (no summary plots).")
+    parser.add_argument('--group', nargs='+', default=None, help="Only summary plots of these groups (and enrichment plots of their queries).")
+    parser.add_argument('--tool', nargs='+', default=None, help="Only plots of these tools.")
+    parser.add_argument('--db', nargs='+', default=None, help="Only plots of these databases.")
+    parser.add_argument('--force', action='store_true', help="Re-render cached plots.")
+    parser.add_argument('--conda_env', default='visualization', help="Conda environment with R and the plotting packages ('' to use Rscript of the current environment).")
+    parser.add_argument('--cores', type=int, default=os.cpu_count(), help="Number of plots rendered in parallel.")
+    args = parser.parse_args()
+
+    config_path = os.path.abspath(args.config)
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file)
+    result_path = os.path.join(os.path.abspath(config['result_path']), "enrichment_analysis")
+    rscript = ['conda', 'run', '--no-capture-output', '--name', args.conda_env, 'Rscript'] if args.conda_env != '' else ['Rscript']
+
+    def selected(group, tool, db):
+        return ((args.group is None or group in args.group) and (args.tool is None or tool in args.tool) and (args.db is None or db in args.db))
+
+    # requested plots: (job, data, plots)
+    requests = []
+    if args.plots in ['all', 'enrichment']:
+        annot = load_dictionaries(config)[0]
+        for feature_set, tool, db in get_query_combinations(config):
+            if selected(annot.loc[feature_set, 'group'], tool, db) and (args.feature_set is None or feature_set in args.feature_set):
+                data_path, plot_paths = get_enrichment_plot_paths(result_path, feature_set, tool, db)
+                requests.append((enrichment_plot_job(rscript, config, config_path, feature_set, tool, db), data_path, plot_paths))
+    if args.plots in ['all', 'summary'] and args.feature_set is None:
+        for group, tool, db, _ in get_group_combinations(config):
+            if selected(group, tool, db):
+                data_path, plot_paths = get_summary_plot_paths(result_path, group, tool, db)
+                requests.append((summary_plot_job(rscript, config_path, data_path, plot_paths, group, tool, db), data_path, plot_paths))
+
+    # render only plots with (computed) data that are not cached yet or outdated
+    jobs, missing, cached = [], 0, 0
+    for job, data_path, plot_paths in requests:
+        if not os.path.exists(data_path):
+            print(f"{job[0]} skipped: {data_path} not computed yet.")
+            missing += 1
+        elif not args.force and is_cached(data_path, plot_paths):
+            cached += 1
+        else:
+            jobs.append(job)
+    print(f"{len(requests)} requested plots: {cached} cached, {missing} without data, {len(jobs)} to render.")
+
+    if len(jobs) > 0:
+        results = run_jobs(jobs, args.cores)
+        if any(returncode != 0 for _, returncode, _ in results):
+            exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,36 @@
 
+# adjust the p-values of all results per tool across the project in one pass (significance scope: project)
+rule adjust_pvalues_project:
+    input:
+        results = get_result_paths,
+    output:
+        project_adjp = os.path.join(result_path, "project_adjusted_pvalues.npz"),
+    params:
+        partition=config.get("partition"),
+    threads: 1
+    resources:
+        mem_mb=config.get("mem", "16000"),
+    conda:
+        "../envs/gene_enrichment_analysis.yaml",
+    log:
+        "logs/rules/adjust_pvalues_project.log"
+    benchmark:
+        benchmark_paths["adjust_pvalues_project"]
+    script:
+        "../scripts/significance.py"
+
 # aggregate all results of the same group per database
 rule aggregate:
     input:
         enrichment_results = get_group_paths,
+        project_adjp = get_project_adjp_path,
     output:
         results_all = os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_all.csv'),
         results_sig = os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_sig.csv'),
+        plot_data = os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_plot_data.csv'),
+        matrices = os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_matrices.npz'),
+        terms = os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_terms.txt'),
+        feature_sets = os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_feature_sets.txt'),
     params:
         partition=config.get("partition"),
     threads: config.get("threads", 1)
@@ -15,13 +40,15 @@ rule aggregate:
         "../envs/gene_enrichment_analysis.yaml",
     log:
         "logs/rules/aggregate_{group}_{tool}_{db}.log"
+    benchmark:
+        benchmark_paths["aggregate"]
     script:
         "../scripts/aggregate.py"
         
-# visualize all results of the same group per database
+# visualize all results of the same group per database from the precomputed plot data
 rule visualize:
     input:
-        results_all = os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_all.csv'),
+        plot_data = os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_plot_data.csv'),
     output:
         summary_plot = report(os.path.join(result_path,'{group}','{tool}','{db}','{group}_{db}_summary.png'),
                              caption="../report/summary_plot.rst", 
@@ -61,5 +88,29 @@ rule visualize:
         "../envs/visualization.yaml",
     log:
         "logs/rules/visualize_{group}_{tool}_{db}.log"
+    benchmark:
+        benchmark_paths["visualize"]
+    script:
+        "../scripts/overview_plot.R"
+
+# load all per feature set results into one queryable index (SQLite) across groups, tools and databases
+rule result_index:
+    input:
+        results = get_result_paths,
+        project_adjp = get_project_adjp_path,
+    output:
+        result_index = os.path.join(result_path, "result_index.sqlite"),
+        term_dictionary = os.path.join(result_path, "term_dictionary.csv"),
+    params:
+        partition=config.get("partition"),
+    threads: 1
+    resources:
+        mem_mb=config.get("mem", "16000"),
+    conda:
+        "../envs/gene_enrichment_analysis.yaml",
+    log:
+        "logs/rules/result_index.log"
+    benchmark:
+        benchmark_paths["result_index"]
     script:
-        "../scripts/overview_plot.R"
\ No newline at end of file
+        "../scripts/result_index.py"
@@ -16,6 +16,12 @@ def get_pycistarget_db_path(wildcards):
 def get_rcistarget_db_path(wildcards):
     return rcistarget_db_dict[wildcards.database]
 
+# get gene normalization table (empty if disabled)
+def get_normalization_table_path(wildcards):
+    if int(config.get("gene_normalization", {}).get("enabled", 0)):
+        return os.path.join("resources", config["project_name"], "gene_normalization_{}.csv".format(config["genome"]))
+    return []
+
 ### for genomic region enrichment
 # region set
 def get_region_path(wildcards):
@@ -35,6 +41,20 @@ def get_background_region_path(wildcards):
     else:
         print("Background region set not found")
 
+# prepared (normalized, filtered and sorted) region set, see rule prepare_regions
+def get_prepared_region_path(wildcards):
+    return os.path.join("resources", config["project_name"], "regions", "{}.bed".format(wildcards.region_set))
+
+# prepared background region set
+def get_prepared_background_region_path(wildcards):
+    background_name = regions_dict[wildcards.region_set]['background_name'] if wildcards.region_set in regions_dict.keys() else wildcards.region_set
+    return os.path.join("resources", config["project_name"], "regions", "{}.bed".format(background_name))
+
+# optional maximal number of regions of a query region set (annotation column max_regions, 0 = all regions)
+def get_max_regions(wildcards):
+    max_regions = regions_dict.get(wildcards.region_set, {}).get('max_regions', 0)
+    return int(max_regions) if pd.notna(max_regions) and max_regions != "" else 0
+
 ### for ORA GSEA
 # gene set
 def get_gene_path(wildcards):
@@ -54,10 +74,233 @@ def get_background_gene_path(wildcards):
     else:
         print("Background gene set not found")
 
+# region-gene associations of the background region set (region-weighted ORA)
+def get_background_association_path(wildcards):
+    return os.path.join(result_path, regions_dict[wildcards.gene_set]['background_name'],'GREAT','region_gene_associations.csv')
+
 ### for preranked GSEA
 def get_rnk_path(wildcards):
     return os.path.join(rnk_dict[wildcards.gene_set]['features_path'])
 
+### resources & job batching
+# get per tool resource estimate (mem_mb, threads or runtime), falling back to the global resources
+def get_resource(tool, resource, default=None):
+    if default is None:
+        default = {"mem_mb": config.get("mem", "16000"), "threads": config.get("threads", 1), "runtime": 60}[resource]
+    return config.get("tool_resources", {}).get(tool, {}).get(resource, default)
+
+# get job group name to pack jobs of the same tool into one cluster submission (None if batching is disabled)
+def get_job_group_name(tool):
+    if int(config.get("job_batching", {}).get(tool, 0)) > 1:
+        return "{}_batch".format(tool)
+    return None
+
+# let each tool's job group span the configured number of jobs (same as --group-components, which takes precedence);
+# Snakemake >=8 keeps them in the group settings of the workflow, Snakemake 7 as a plain dict on the workflow
+def update_group_components():
+    batch_components = {get_job_group_name(tool): int(n_jobs) for tool, n_jobs in config.get("job_batching", {}).items() if get_job_group_name(tool) is not None}
+    if len(batch_components) == 0:
+        return
+    if hasattr(workflow, "group_settings"):
+        workflow.group_settings.group_components = {**batch_components, **workflow.group_settings.group_components}
+    else:
+        workflow.group_components = {**batch_components, **workflow.group_components}
+
+# get job group (group directive) of a tool's rules: Snakemake >=8 replaces the group settings of the workflow after parsing the Snakefile
+# (with the ones of the command line), so the group sizes are merged in when the jobs are assigned to their groups, i.e., right before
+# the DAG lets the groups span multiple jobs
+def get_job_group(tool):
+    group = get_job_group_name(tool)
+    if group is None or not hasattr(workflow, "group_settings"):
+        return group
+    def assign_job_group(wildcards):
+        update_group_components()
+        return group
+    return assign_job_group
+
+### learned resource profiles
+# inputs of the jobs scheduled in this run (rule, wildcards and input files), keyed by their benchmark file;
+# their size features are only computed after the run, when inputs produced during the run (e.g., GREAT genes) exist
+job_inputs = dict()
+
+# benchmark file recording runtime and peak memory (max_rss) of a job
+def get_benchmark_path(rule_name, *wildcard_names):
+    return os.path.join("benchmarks", rule_name, "_".join("{"+name+"}" for name in wildcard_names)+".tsv")
+
+benchmark_paths = {
+    "region_enrichment_analysis_LOLA": get_benchmark_path("region_enrichment_analysis_LOLA", "region_set", "database"),
+    "region_enrichment_analysis_GREAT": get_benchmark_path("region_enrichment_analysis_GREAT", "region_set", "database"),
+    "region_gene_association_GREAT": get_benchmark_path("region_gene_association_GREAT", "region_set"),
+    "region_motif_enrichment_analysis_pycisTarget": get_benchmark_path("region_motif_enrichment_analysis_pycisTarget", "region_set", "database"),
+    "gene_ORA_GSEApy": get_benchmark_path("gene_ORA_GSEApy", "gene_set", "db"),
+    "gene_ORA_GSEApy_multi_db": get_benchmark_path("gene_ORA_GSEApy_multi_db", "gene_set"),
+    "region_ORA_weighted": get_benchmark_path("region_ORA_weighted", "gene_set"),
+    "gene_preranked_GSEApy": get_benchmark_path("gene_preranked_GSEApy", "gene_set", "db"),
+    "gene_motif_enrichment_analysis_RcisTarget": get_benchmark_path("gene_motif_enrichment_analysis_RcisTarget", "gene_set", "database"),
+    # not profiled, only timed (e.g., by the benchmark suite)
+    "prepare_databases": get_benchmark_path("prepare_databases", "database"),
+    "prepare_regions": get_benchmark_path("prepare_regions", "region_set"),
+    "prepare_ranks_GSEApy": get_benchmark_path("prepare_ranks_GSEApy", "gene_set"),
+    "aggregate": get_benchmark_path("aggregate", "group", "tool", "db"),
+    "visualize": get_benchmark_path("visualize", "group", "tool", "db"),
+    "result_index": os.path.join("benchmarks", "result_index", "result_index.tsv"),
+    "adjust_pvalues_project": os.path.join("benchmarks", "adjust_pvalues_project", "adjust_pvalues_project.tsv"),
+}
+
+# number of lines (i.e., regions, genes or ranked genes) of a query file, None if it does not exist (yet); only existing files are cached
+line_counts = dict()
+def count_lines(path):
+    if path not in line_counts:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            line_counts[path] = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+    return line_counts[path]
+
+# size of a database file or directory (e.g., LOLA databases) in MB
+@functools.lru_cache(maxsize=None)
+def get_path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, dirs, files in os.walk(path) for f in files)/1e6
+    return os.path.getsize(path)/1e6
+
+# query and database files of a job
+def get_job_inputs(wildcards, input):
+    return {"wildcards": wildcards,
+            "query": input[0],
+            "databases": [database for database in input.get("databases", [input.get("database", input.get("ctx_db"))]) if database is not None],
+           }
+
+# input size features of a job: number of query features (None if the query does not exist yet) and (total) database size in MB
+def get_job_features(inputs):
+    wildcards = inputs["wildcards"]
+    db_mb = 0.0
+    for database in inputs["databases"]:
+        # prepared databases might not exist yet, use the user provided database instead
+        if not os.path.exists(database):
+            database = database_dict.get(wildcards.get("database", wildcards.get("db", os.path.splitext(os.path.basename(database))[0])))
+        if database is not None and os.path.exists(database):
+            db_mb += get_path_size(database)
+    query = inputs["query"]
+    # prepared ranks and region sets might not exist yet, use the user provided files instead
+    if query.endswith(".npz") and wildcards.get("gene_set") in rnk_dict.keys():
+        query = get_rnk_path(wildcards)
+    elif not os.path.exists(query) and "region_set" in wildcards.keys():
+        query = get_region_path(wildcards)
+    return {"n_features": count_lines(query),
+            "db_mb": db_mb,
+           }
+
+# load recorded jobs of a rule from the resource history
+@functools.lru_cache(maxsize=None)
+def load_resource_history(rule_name):
+    if not os.path.exists(resource_history_path):
+        return None
+    history = pd.read_csv(resource_history_path)
+    history = history.loc[history["rule"]==rule_name,:].dropna(subset=["s", "max_rss"])
+    if history.shape[0] < config.get("resource_profiles", {}).get("min_jobs", 5):
+        return None
+    return history
+
+# linear model of a recorded quantity on the input size features, with an upper quantile of its residuals as margin
+@functools.lru_cache(maxsize=None)
+def fit_resource_model(rule_name, quantity):
+    history = load_resource_history(rule_name)
+    if history is None:
+        return None
+    X = np.column_stack([np.ones(history.shape[0]), history["n_features"], history["db_mb"]])
+    y = history[quantity].to_numpy(dtype=float)
+    coef = np.linalg.lstsq(X, y, rcond=None)[0]
+    margin = max(np.quantile(y - X @ coef, 0.95), 0)
+    return coef, margin
+
+# resource callable predicting mem_mb, threads or runtime of a job from previous runs, falling back to the per tool estimate
+def get_profiled_resource(rule_name, tool, resource, default=None):
+    fallback = get_resource(tool, resource, default)
+    benchmark_path = benchmark_paths[rule_name]
+
+    def predict(wildcards, input, attempt):
+        inputs = get_job_inputs(wildcards, input)
+        job_inputs[benchmark_path.format(**dict(wildcards.items()))] = (rule_name, inputs)
+
+        if not int(config.get("resource_profiles", {}).get("predict", 0)):
+            return int(fallback) * attempt if resource=="mem_mb" else fallback
+
+        # queries produced during the run (e.g., genes of region sets) are not known yet, use the estimate
+        history = load_resource_history(rule_name)
+        features = get_job_features(inputs) if history is not None else None
+        if history is None or features["n_features"] is None:
+            return int(fallback) * attempt if resource=="mem_mb" else fallback
+
+        safety_factor = config.get("resource_profiles", {}).get("safety_factor", 1.5)
+        x = np.array([1, features["n_features"], features["db_mb"]])
+        if resource=="mem_mb":
+            coef, margin = fit_resource_model(rule_name, "max_rss")
+            return max(int(np.ceil((x @ coef + margin) * safety_factor)), 500) * attempt
+        if resource=="runtime":
+            coef, margin = fit_resource_model(rule_name, "s")
+            return max(int(np.ceil((x @ coef + margin) * safety_factor / 60)), 1)
+        # threads: observed CPU utilization, capped by the configured threads
+        utilization = (history["cpu_time"] / history["s"].clip(lower=1)).quantile(0.9)
+        return int(min(max(np.ceil(utilization), 1), int(fallback)))
+
+    return predict
+
+# append the recorded benchmarks of this run together with the jobs' input size features to the resource history
+# (computed from the inputs now, after they were produced; a query that still does not exist had no features, e.g., no genes found)
+def update_resource_history():
+    records = []
+    for benchmark_path, (rule_name, inputs) in job_inputs.items():
+        if not os.path.exists(benchmark_path) or os.path.getmtime(benchmark_path) < workflow_start_time:
+            continue
+        benchmark = pd.read_csv(benchmark_path, sep='\t')
+        features = get_job_features(inputs)
+        features["n_features"] = features["n_features"] or 0
+        records.append({"rule": rule_name,
+                        "job": os.path.basename(benchmark_path).replace(".tsv", ""),
+                        "s": benchmark["s"].iloc[-1],
+                        "max_rss": benchmark["max_rss"].iloc[-1],
+                        "cpu_time": benchmark["cpu_time"].iloc[-1],
+                        **features,
+                       })
+    if len(records)==0:
+        return
+    os.makedirs(os.path.dirname(resource_history_path), exist_ok=True)
+    pd.DataFrame(records).to_csv(resource_history_path, mode='a', index=False, header=not os.path.exists(resource_history_path))
+
+### profiling
+# roll up the recorded profiling spans of the run per tool, database and span
+def summarize_profiling():
+    if not int(config.get("profiling", 0)) or not os.path.exists(profiling_dir):
+        return
+    subprocess.run([sys.executable, os.path.join(workflow.basedir, "scripts", "summarize_profiling.py"),
+                    "--profiling_dir", profiling_dir,
+                    "--output", os.path.join(profiling_dir, "profiling_summary.csv"),
+                   ])
+
+### multiple testing correction
+# project-wide adjusted p-values, only required with significance method BH/BY and scope project (see scripts/significance.py)
+def get_project_adjp_path(wildcards):
+    significance = config.get("significance", None) or {}
+    if significance.get("method", "tool") != "tool" and significance.get("scope", "query") == "project":
+        return os.path.join(result_path, "project_adjusted_pvalues.npz")
+    return []
+
+### for the project-wide result index
+# all per feature set result files of this run
+def get_result_paths(wildcards):
+    gene_sets = list(genes_dict.keys()) + list(regions_dict.keys())
+    paths = []
+    for tool, feature_sets, dbs in [("LOLA", regions_dict.keys(), lola_db_dict.keys()),
+                                    ("GREAT", regions_dict.keys(), database_dict.keys()),
+                                    ("pycisTarget", regions_dict.keys(), pycistarget_db_dict.keys()),
+                                    ("ORA_GSEApy", gene_sets, database_dict.keys()),
+                                    ("RcisTarget", gene_sets, rcistarget_db_dict.keys()),
+                                    ("preranked_GSEApy", rnk_dict.keys(), database_dict.keys()),
+                                   ]:
+        paths += expand(os.path.join(result_path,'{feature_set}','{tool}','{db}','{feature_set}_{db}.csv'), feature_set=feature_sets, tool=tool, db=dbs)
+    return paths
+
 ### for group summary & visualization
 def get_group_paths(wildcards):
     feature_sets = list(annot.index[annot["group"]==wildcards.group])
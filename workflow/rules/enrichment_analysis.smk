@@ -2,47 +2,55 @@
 # performs region enrichment analysis using LOLA
 rule region_enrichment_analysis_LOLA:
     input:
-        regions = get_region_path,
-        background = get_background_region_path,
+        regions = get_prepared_region_path,
+        background = get_prepared_background_region_path,
         database = get_lola_db_path,
     output:
         result = os.path.join(result_path,'{region_set}','LOLA','{database}','{region_set}_{database}.csv'),
     params:
         partition=config.get("partition"),
-    threads: config.get("threads", 1)
+    threads: get_profiled_resource("region_enrichment_analysis_LOLA", "LOLA", "threads")
     resources:
-        mem_mb=config.get("mem", "16000"),
+        mem_mb=get_profiled_resource("region_enrichment_analysis_LOLA", "LOLA", "mem_mb"),
+        runtime=get_profiled_resource("region_enrichment_analysis_LOLA", "LOLA", "runtime"),
+    group: get_job_group("LOLA")
     conda:
         "../envs/region_enrichment_analysis.yaml",
     log:
         "logs/rules/region_enrichment_analysis_LOLA_{region_set}_{database}.log"
+    benchmark:
+        benchmark_paths["region_enrichment_analysis_LOLA"]
     script:
         "../scripts/region_enrichment_analysis_LOLA.R"
 
 # performs region enrichment analysis using GREAT
 rule region_enrichment_analysis_GREAT:
     input:
-        regions = get_region_path,
-        background = get_background_region_path,
+        regions = get_prepared_region_path,
+        background = get_prepared_background_region_path,
         database = os.path.join("resources", config["project_name"], "{database}.gmt"),
     output:
         result = os.path.join(result_path,'{region_set}','GREAT','{database}','{region_set}_{database}.csv'),
     params:
         partition = config.get("partition"),
-    threads: config.get("threads", 1)
+    threads: get_profiled_resource("region_enrichment_analysis_GREAT", "GREAT", "threads")
     resources:
-        mem_mb=config.get("mem", "16000"),
+        mem_mb=get_profiled_resource("region_enrichment_analysis_GREAT", "GREAT", "mem_mb"),
+        runtime=get_profiled_resource("region_enrichment_analysis_GREAT", "GREAT", "runtime"),
+    group: get_job_group("GREAT")
     conda:
         "../envs/region_enrichment_analysis.yaml",
     log:
         "logs/rules/region_enrichment_analysis_GREAT_{region_set}_{database}.log"
+    benchmark:
+        benchmark_paths["region_enrichment_analysis_GREAT"]
     script:
         "../scripts/region_enrichment_analysis_GREAT.R"
 
 # region-gene association using GREAT for downstream gene-base analysis of genomic regions
 rule region_gene_association_GREAT:
     input:
-        regions = get_region_path,
+        regions = get_prepared_region_path,
         database = os.path.join("resources", config["project_name"],"{}.gmt".format(next(iter(database_dict)))), #get_first_database,
     output:
         genes = os.path.join(result_path,'{region_set}','GREAT','genes.txt'),
@@ -50,20 +58,24 @@ rule region_gene_association_GREAT:
         associations_plot = os.path.join(result_path,'{region_set}','GREAT','region_gene_associations.pdf'),
     params:
         partition = config.get("partition"),
-    threads: config.get("threads", 1)
+    threads: get_profiled_resource("region_gene_association_GREAT", "GREAT", "threads")
     resources:
-        mem_mb=config.get("mem", "16000"),
+        mem_mb=get_profiled_resource("region_gene_association_GREAT", "GREAT", "mem_mb"),
+        runtime=get_profiled_resource("region_gene_association_GREAT", "GREAT", "runtime"),
+    group: get_job_group("GREAT")
     conda:
         "../envs/region_enrichment_analysis.yaml",
     log:
         "logs/rules/region_gene_association_GREAT_{region_set}.log"
+    benchmark:
+        benchmark_paths["region_gene_association_GREAT"]
     script:
         "../scripts/region_gene_association_GREAT.R"
 
 # performs region TFBS motif enrichment analysis using pycisTarget
 rule region_motif_enrichment_analysis_pycisTarget:
     input:
-        regions = get_region_path,
+        regions = get_prepared_region_path,
         ctx_db = get_pycistarget_db_path,
         motif2tf = config["pycistarget_parameters"]["path_to_motif_annotations"],
     output:
@@ -80,13 +92,17 @@ rule region_motif_enrichment_analysis_pycisTarget:
         orthologous_identity_threshold = config["pycistarget_parameters"]["orthologous_identity_threshold"],
         species = 'homo_sapiens' if config["genome"] in ["hg19", "hg38"] else 'mus_musculus' if config["genome"] in ["mm9", "mm11"] else None,
         partition = config.get("partition"),
-    threads: 10 * config.get("threads", 1)
+    threads: get_profiled_resource("region_motif_enrichment_analysis_pycisTarget", "pycisTarget", "threads", 10 * config.get("threads", 1))
     resources:
-        mem_mb=config.get("mem", "16000"),
+        mem_mb=get_profiled_resource("region_motif_enrichment_analysis_pycisTarget", "pycisTarget", "mem_mb"),
+        runtime=get_profiled_resource("region_motif_enrichment_analysis_pycisTarget", "pycisTarget", "runtime"),
+    group: get_job_group("pycisTarget")
     conda:
         "../envs/pycisTarget.yaml",
     log:
         "logs/rules/region_enrichment_analysis_pycisTarget_{region_set}_{database}.log"
+    benchmark:
+        benchmark_paths["region_motif_enrichment_analysis_pycisTarget"]
     shell:
         """
         {{
@@ -108,6 +124,11 @@ rule region_motif_enrichment_analysis_pycisTarget:
                 --output_mode 'hdf5' \
                 --write_html
         }} || {{
+            status=$?
+            # terminated by a signal (e.g., preemption: SIGTERM 143, SIGKILL 137): fail the job so that it is rerun instead of yielding empty results
+            if [ $status -gt 128 ]; then
+                echo "pycisTarget was terminated (exit status $status)"; exit $status;
+            fi
             echo "An error occurred during the region TFBS motif enrichment analysis using pycisTarget"; touch {output.motif_hdf5} {output.motif_html}; exit 0;
         }}
         """
@@ -123,6 +144,7 @@ rule process_results_pycisTarget:
     threads: config.get("threads", 1)
     resources:
         mem_mb=config.get("mem", "16000"),
+    group: get_job_group("pycisTarget")
     conda:
         "../envs/pycisTarget.yaml",
     log:
@@ -135,39 +157,133 @@ rule gene_ORA_GSEApy:
     input:
         query_genes=get_gene_path,
         background_genes=get_background_gene_path,
-        database = os.path.join("resources", config["project_name"], "{db}.gmt"),
+        database = os.path.join("resources", config["project_name"], "normalized", "{db}.gmt"),
+        normalization_table = get_normalization_table_path,
     output:
         result_file = os.path.join(result_path,'{gene_set}','ORA_GSEApy','{db}','{gene_set}_{db}.csv'),
     params:
         database = lambda w: "{}".format(w.db),
         partition=config.get("partition"),
-    threads: config.get("threads", 1)
+    threads: get_profiled_resource("gene_ORA_GSEApy", "ORA_GSEApy", "threads")
     resources:
-        mem_mb=config.get("mem", "16000"),
+        mem_mb=get_profiled_resource("gene_ORA_GSEApy", "ORA_GSEApy", "mem_mb"),
+        runtime=get_profiled_resource("gene_ORA_GSEApy", "ORA_GSEApy", "runtime"),
+    group: get_job_group("ORA_GSEApy")
     conda:
         "../envs/gene_enrichment_analysis.yaml",
     log:
         "logs/rules/gene_ORA_GSEApy_{gene_set}_{db}.log"
+    benchmark:
+        benchmark_paths["gene_ORA_GSEApy"]
     script:
         "../scripts/gene_ORA_GSEApy.py"
 
+# performs gene ORA against all databases in one job per query using a combined term index (config: ora_multi_db)
+if int(config.get("ora_multi_db", 0)):
+    ruleorder: gene_ORA_GSEApy_multi_db > gene_ORA_GSEApy
+
+    rule gene_ORA_GSEApy_multi_db:
+        input:
+            query_genes=get_gene_path,
+            background_genes=get_background_gene_path,
+            databases = expand(os.path.join("resources", config["project_name"], "{db}.npz"), db=database_dict.keys()),
+            normalization_table = get_normalization_table_path,
+        output:
+            result_files = expand(os.path.join(result_path,'{{gene_set}}','ORA_GSEApy','{db}','{{gene_set}}_{db}.csv'), db=database_dict.keys()),
+        params:
+            databases = list(database_dict.keys()),
+            partition=config.get("partition"),
+        threads: get_profiled_resource("gene_ORA_GSEApy_multi_db", "ORA_GSEApy", "threads")
+        resources:
+            mem_mb=get_profiled_resource("gene_ORA_GSEApy_multi_db", "ORA_GSEApy", "mem_mb"),
+            runtime=get_profiled_resource("gene_ORA_GSEApy_multi_db", "ORA_GSEApy", "runtime"),
+        group: get_job_group("ORA_GSEApy")
+        conda:
+            "../envs/gene_enrichment_analysis.yaml",
+        log:
+            "logs/rules/gene_ORA_GSEApy_multi_db_{gene_set}.log"
+        benchmark:
+            benchmark_paths["gene_ORA_GSEApy_multi_db"]
+        script:
+            "../scripts/gene_ORA_multi_db.py"
+
+# performs region-weighted ORA of region sets against all databases in one job, weighting genes by their associated regions (config: ora_weighted)
+if int(config.get("ora_weighted", 0)) and len(regions_dict) > 0:
+    ruleorder: region_ORA_weighted > gene_ORA_GSEApy
+    if int(config.get("ora_multi_db", 0)):
+        ruleorder: region_ORA_weighted > gene_ORA_GSEApy_multi_db
+
+    rule region_ORA_weighted:
+        input:
+            associations = os.path.join(result_path,'{gene_set}','GREAT','region_gene_associations.csv'),
+            background_associations = get_background_association_path,
+            databases = expand(os.path.join("resources", config["project_name"], "{db}.npz"), db=database_dict.keys()),
+            normalization_table = get_normalization_table_path,
+        output:
+            result_files = expand(os.path.join(result_path,'{{gene_set}}','ORA_GSEApy','{db}','{{gene_set}}_{db}.csv'), db=database_dict.keys()),
+        wildcard_constraints:
+            gene_set = "|".join(re.escape(region_set) for region_set in regions_dict.keys()),
+        params:
+            databases = list(database_dict.keys()),
+            partition=config.get("partition"),
+        threads: get_profiled_resource("region_ORA_weighted", "ORA_GSEApy", "threads")
+        resources:
+            mem_mb=get_profiled_resource("region_ORA_weighted", "ORA_GSEApy", "mem_mb"),
+            runtime=get_profiled_resource("region_ORA_weighted", "ORA_GSEApy", "runtime"),
+        group: get_job_group("ORA_GSEApy")
+        conda:
+            "../envs/gene_enrichment_analysis.yaml",
+        log:
+            "logs/rules/region_ORA_weighted_{gene_set}.log"
+        benchmark:
+            benchmark_paths["region_ORA_weighted"]
+        script:
+            "../scripts/region_ORA_weighted.py"
+
+# normalize, deduplicate and rank each gene-score file once for all databases
+rule prepare_ranks_GSEApy:
+    input:
+        ranks = get_rnk_path,
+        normalization_table = get_normalization_table_path,
+    output:
+        ranks = os.path.join(result_path,'{gene_set}','preranked_GSEApy','{gene_set}_ranks.npz'),
+    params:
+        partition=config.get("partition"),
+    threads: 1
+    resources:
+        mem_mb=get_resource("preranked_GSEApy", "mem_mb"),
+    conda:
+        "../envs/gene_enrichment_analysis.yaml",
+    log:
+        "logs/rules/prepare_ranks_GSEApy_{gene_set}.log"
+    benchmark:
+        benchmark_paths["prepare_ranks_GSEApy"]
+    script:
+        "../scripts/prepare_ranks_GSEApy.py"
+
 # performs gene preranked GSEA and generate plots using GSEApy
 rule gene_preranked_GSEApy:
     input:
-        query_genes=get_rnk_path,
-        database = os.path.join("resources", config["project_name"], "{db}.gmt"),
+        ranks = os.path.join(result_path,'{gene_set}','preranked_GSEApy','{gene_set}_ranks.npz'),
+        database = os.path.join("resources", config["project_name"], "normalized", "{db}.gmt"),
+        database_index = os.path.join("resources", config["project_name"], "{db}.npz"),
     output:
         result_file = os.path.join(result_path,'{gene_set}','preranked_GSEApy','{db}','{gene_set}_{db}.csv'),
     params:
         database = lambda w: "{}".format(w.db),
+        null_cache = os.path.join("resources", config["project_name"], "prerank_null_cache"),
         partition=config.get("partition"),
-    threads: config.get("threads", 1)
+    threads: get_profiled_resource("gene_preranked_GSEApy", "preranked_GSEApy", "threads")
     resources:
-        mem_mb=config.get("mem", "16000"),
+        mem_mb=get_profiled_resource("gene_preranked_GSEApy", "preranked_GSEApy", "mem_mb"),
+        runtime=get_profiled_resource("gene_preranked_GSEApy", "preranked_GSEApy", "runtime"),
+    group: get_job_group("preranked_GSEApy")
     conda:
         "../envs/gene_enrichment_analysis.yaml",
     log:
         "logs/rules/gene_preranked_GSEApy_{gene_set}_{db}.log"
+    benchmark:
+        benchmark_paths["gene_preranked_GSEApy"]
     script:
         "../scripts/gene_preranked_GSEApy.py"
 
@@ -182,13 +298,17 @@ rule gene_motif_enrichment_analysis_RcisTarget:
         result = os.path.join(result_path,'{gene_set}','RcisTarget','{database}','{gene_set}_{database}.csv'),
     params:
         partition=config.get("partition"),
-    threads: config.get("threads", 1)
+    threads: get_profiled_resource("gene_motif_enrichment_analysis_RcisTarget", "RcisTarget", "threads")
     resources:
-        mem_mb=config.get("mem", "16000"),
+        mem_mb=get_profiled_resource("gene_motif_enrichment_analysis_RcisTarget", "RcisTarget", "mem_mb"),
+        runtime=get_profiled_resource("gene_motif_enrichment_analysis_RcisTarget", "RcisTarget", "runtime"),
+    group: get_job_group("RcisTarget")
     conda:
         "../envs/RcisTarget.yaml",
     log:
         "logs/rules/gene_motif_enrichment_analysis_RcisTarget_{gene_set}_{database}.log"
+    benchmark:
+        benchmark_paths["gene_motif_enrichment_analysis_RcisTarget"]
     script:
         "../scripts/gene_enrichment_analysis_RcisTarget.R"
 
@@ -208,9 +328,11 @@ rule plot_enrichment_result:
                               }),
     params:
         partition=config.get("partition"),
-    threads: config.get("threads", 1)
+    threads: get_resource("plot_enrichment_result", "threads")
     resources:
-        mem_mb=config.get("mem", "16000"),
+        mem_mb=get_resource("plot_enrichment_result", "mem_mb"),
+        runtime=get_resource("plot_enrichment_result", "runtime"),
+    group: get_job_group("plot_enrichment_result")
     conda:
         "../envs/visualization.yaml",
     log:
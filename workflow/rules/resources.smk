@@ -1,10 +1,60 @@
 
-# load, convert and save local provided GMT & JSON databases to local resource folder
+# build the gene symbol normalization table (alias -> official symbol & Entrez gene ID, optional orthologs) once per genome
+rule gene_normalization_table:
+    output:
+        normalization_table = os.path.join("resources", config["project_name"], "gene_normalization_{}.csv".format(config["genome"])),
+    params:
+        genome = config["genome"],
+        orthologs = config.get("gene_normalization", {}).get("orthologs", ""),
+        partition = config.get("partition"),
+    threads: config.get("threads", 1)
+    resources:
+        mem_mb=config.get("mem", "16000"),
+    conda:
+        "../envs/region_enrichment_analysis.yaml",
+    log:
+        os.path.join("logs","rules","gene_normalization_table.log"),
+    script:
+        "../scripts/gene_normalization_table.R"
+
+# normalize (chromosome names), filter (canonical chromosomes), sort and optionally merge and subsample (annotation: max_regions)
+# each query and background region set once
+rule prepare_regions:
+    input:
+        regions = get_region_path,
+    output:
+        regions = os.path.join("resources", config["project_name"], "regions", "{region_set}.bed"),
+        summary = os.path.join(result_path, "{region_set}", "regions_summary.json"),
+    params:
+        genome = config["genome"],
+        merge = config.get("region_preprocessing", {}).get("merge", 0),
+        max_regions = get_max_regions,
+        seed = config.get("region_preprocessing", {}).get("seed", 42),
+        partition = config.get("partition"),
+    threads: 1
+    resources:
+        mem_mb=config.get("mem", "16000"),
+    conda:
+        "../envs/gene_enrichment_analysis.yaml",
+    log:
+        os.path.join("logs","rules","prepare_regions_{region_set}.log"),
+    benchmark:
+        benchmark_paths["prepare_regions"]
+    script:
+        "../scripts/prepare_regions.py"
+
+# load, convert, normalize and save local provided GMT & JSON databases to local resource folder
+# (GMT with original symbols e.g., for GREAT, GMT with normalized symbols for GSEApy and sparse term index)
 rule prepare_databases:
     input:
-        get_db_path,
+        database = get_db_path,
+        normalization_table = get_normalization_table_path,
     output:
         db_file = os.path.join("resources", config["project_name"],"{database}.gmt"),
+        db_normalized = os.path.join("resources", config["project_name"],"normalized","{database}.gmt"),
+        db_index = os.path.join("resources", config["project_name"],"{database}.npz"),
+    wildcard_constraints:
+        database = "[^/]+",
     params:
         partition = config.get("partition"),
     threads: config.get("threads", 1)
@@ -14,6 +64,8 @@ rule prepare_databases:
         "../envs/gene_enrichment_analysis.yaml",
     log:
         os.path.join("logs","rules","prepare_databases_{database}.log"),
+    benchmark:
+        benchmark_paths["prepare_databases"]
     script:
         "../scripts/prepare_databases_GSEApy.py"
 
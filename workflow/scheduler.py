@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# shared helpers of the standalone drivers (aggregate.py, visualize.py, plot_enrichment_result.py):
+# enumeration of the valid query/group x tool x database combinations (same compatibility rules as the Snakemake workflow)
+# and an asyncio subprocess scheduler running the jobs with bounded concurrency, streaming their output into log files
+
+import os
+import asyncio
+import pandas as pd
+
+# tools per query type: region sets (.bed), gene sets (.txt) and preranked gene-score tables (.csv)
+REGION_TOOLS = ["LOLA", "GREAT", "pycisTarget", "ORA_GSEApy", "RcisTarget"]
+GENE_TOOLS = ["ORA_GSEApy", "RcisTarget"]
+RANKED_TOOLS = ["preranked_GSEApy"]
+
+# query dictionaries of the annotation per query type
+def load_dictionaries(config):
+    annot = pd.read_csv(config["annotation"], index_col='name')
+
+    genes = annot.loc[annot['features_path'].str.endswith('.txt'), :]
+    regions = annot.loc[annot['features_path'].str.endswith('.bed'), :]
+    rnk = annot.loc[annot['features_path'].str.endswith('.csv'), :]
+
+    return annot, regions.to_dict('index'), genes.to_dict('index'), rnk.to_dict('index')
+
+# configured (non-empty) databases per tool
+def get_tool_databases(config):
+    local_databases = [db for db, path in config["local_databases"].items() if path != ""]
+    return {
+        "ORA_GSEApy": local_databases,
+        "preranked_GSEApy": local_databases,
+        "GREAT": local_databases,
+        "LOLA": [db for db, path in config["lola_databases"].items() if path != ""],
+        "pycisTarget": [db for db, path in config["pycistarget_parameters"]["databases"].items() if path != ""],
+        "RcisTarget": [db for db, path in config["rcistarget_parameters"]["databases"].items() if path != ""],
+    }
+
+# tools a query can be analyzed with
+def get_query_tools(feature_set, regions_dict, genes_dict, rnk_dict):
+    if feature_set in regions_dict:
+        return REGION_TOOLS
+    if feature_set in genes_dict:
+        return GENE_TOOLS
+    if feature_set in rnk_dict:
+        return RANKED_TOOLS
+    return []
+
+# queries of a group that can be analyzed with a tool (in the order of the Snakemake workflow's get_group_paths)
+def get_group_feature_sets(group, tool, annot, regions_dict, genes_dict, rnk_dict):
+    feature_sets = list(annot.index[annot["group"] == group])
+    if tool in ["GREAT", "LOLA", "pycisTarget"]:
+        return [fs for fs in feature_sets if fs in regions_dict]
+    if tool in ["ORA_GSEApy", "RcisTarget"]:
+        return [fs for fs in feature_sets if fs in genes_dict] + [fs for fs in feature_sets if fs in regions_dict]
+    if tool == "preranked_GSEApy":
+        return [fs for fs in feature_sets if fs in rnk_dict]
+    return []
+
+# all valid query x tool x database combinations
+def get_query_combinations(config):
+    annot, regions_dict, genes_dict, rnk_dict = load_dictionaries(config)
+    tool_databases = get_tool_databases(config)
+    return [(feature_set, tool, db)
+            for feature_set in annot.index.unique()
+            for tool in get_query_tools(feature_set, regions_dict, genes_dict, rnk_dict)
+            for db in tool_databases[tool]]
+
+# all valid group x tool x database combinations (i.e., with at least one query) with their queries
+def get_group_combinations(config):
+    annot, regions_dict, genes_dict, rnk_dict = load_dictionaries(config)
+    tool_databases = get_tool_databases(config)
+    combinations = []
+    for group in annot['group'].unique():
+        for tool, databases in tool_databases.items():
+            feature_sets = get_group_feature_sets(group, tool, annot, regions_dict, genes_dict, rnk_dict)
+            if len(feature_sets) == 0:
+                continue
+            combinations.extend((group, tool, db, feature_sets) for db in databases)
+    return combinations
+
+# run one job, streaming its (merged) stdout and stderr line by line into its log file
+async def run_job(name, command, log_file, semaphore):
+    async with semaphore:
+        with open(log_file, 'wb') as log:
+            try:
+                process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+            except OSError as e:
+                # e.g., executable not found, fail only this job
+                log.write(f"{e}\n".encode())
+                return name, 127, log_file
+            async for line in process.stdout:
+                log.write(line)
+        returncode = await process.wait()
+    return name, returncode, log_file
+
+# run jobs (name, command, log file) with at most max_jobs concurrent processes, reporting each job when it finishes
+async def run_jobs_async(jobs, max_jobs):
+    semaphore = asyncio.Semaphore(max(max_jobs, 1))
+    results = []
+    for task in asyncio.as_completed([run_job(name, command, log_file, semaphore) for name, command, log_file in jobs]):
+        name, returncode, log_file = await task
+        if returncode != 0:
+            print(f"{name} failed. Check the log file {log_file} for details.")
+        else:
+            print(f"{name} completed successfully.")
+        results.append((name, returncode, log_file))
+    return results
+
+def run_jobs(jobs, max_jobs=os.cpu_count(), directories=()):
+    # create all output and log directories once up front
+    for directory in set(directories) | {os.path.dirname(log_file) for _, _, log_file in jobs}:
+        os.makedirs(directory, exist_ok=True)
+    results = asyncio.run(run_jobs_async(jobs, max_jobs))
+    failed = sum(returncode != 0 for _, returncode, _ in results)
+    print(f"{len(results) - failed} of {len(results)} jobs completed successfully.")
+    return results
@@ -5,50 +5,110 @@ import sys
 import yaml
 import pandas as pd
 import argparse
+from instrumentation import Profiler
+from plot_data import make_plot_data
+from result_matrices import make_result_matrices, save_result_matrices
+from significance import get_settings, get_threshold, get_significance_mask, adjust_results, ProjectPvalues
 
-# 解析命令行参数
-parser = argparse.ArgumentParser(description="Aggregate enrichment results.")
-parser.add_argument('--enrichment_results', nargs='+', required=True, help="List of enrichment result files.")
-parser.add_argument('--results_all', required=True, help="Path to save all combined results.")
-parser.add_argument('--results_sig', required=True, help="Path to save significant results.")
-parser.add_argument('--group', required=True, help="Group name.")
-parser.add_argument('--tool', required=True, help="Tool name.")
-parser.add_argument('--db', required=True, help="Database name.")
-parser.add_argument('--config', required=True, help="Path to the config file.")
-args = parser.parse_args()
-
-# 加载配置文件
-with open(args.config, 'r') as file:
-    config_data = yaml.safe_load(file)
+if "snakemake" in globals():
+    # 作为 Snakemake 规则脚本运行
+    args = argparse.Namespace(enrichment_results=list(snakemake.input["enrichment_results"]),
+                              results_all=snakemake.output["results_all"],
+                              results_sig=snakemake.output["results_sig"],
+                              plot_data=snakemake.output["plot_data"],
+                              matrices=snakemake.output["matrices"],
+                              terms=snakemake.output["terms"],
+                              feature_sets=snakemake.output["feature_sets"],
+                              group=snakemake.wildcards["group"],
+                              tool=snakemake.wildcards["tool"],
+                              db=snakemake.wildcards["db"],
+                              project_adjp=snakemake.input.get("project_adjp", None) or None,
+                             )
+    config_data = snakemake.config
+else:
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description="Aggregate enrichment results.")
+    parser.add_argument('--enrichment_results', nargs='+', required=True, help="List of enrichment result files.")
+    parser.add_argument('--results_all', required=True, help="Path to save all combined results.")
+    parser.add_argument('--results_sig', required=True, help="Path to save significant results.")
+    parser.add_argument('--plot_data', required=True, help="Path to save the precomputed summary plot data.")
+    parser.add_argument('--matrices', required=True, help="Path to save the sparse term x feature set matrices (NPZ).")
+    parser.add_argument('--terms', required=True, help="Path to save the term index of the matrices.")
+    parser.add_argument('--feature_sets', required=True, help="Path to save the feature set index of the matrices.")
+    parser.add_argument('--group', required=True, help="Group name.")
+    parser.add_argument('--tool', required=True, help="Tool name.")
+    parser.add_argument('--db', required=True, help="Database name.")
+    parser.add_argument('--config', required=True, help="Path to the config file.")
+    parser.add_argument('--project_adjp', default=None, help="Path to the project-wide adjusted p-values (NPZ, significance scope: project).")
+    args = parser.parse_args()
+
+    # 加载配置文件
+    with open(args.config, 'r') as file:
+        config_data = yaml.safe_load(file)
 
 term_col = config_data["column_names"][args.tool]["term"]
 adjp_col = config_data["column_names"][args.tool]["adj_pvalue"]
-adjp_th = config_data["adjp_th"][args.tool]
+effect_col = config_data["column_names"][args.tool]["effect_size"]
+overlap_col = config_data["column_names"][args.tool]["overlap"]
+adjp_th = get_threshold(config_data, args.tool)
+method, scope = get_settings(config_data)
+
+profiler = Profiler("aggregate", "{}_{}".format(args.group, args.tool), args.db)
+
+# 项目范围的校正 p 值（significance scope: project），按结果文件的行顺序
+project_pvalues = ProjectPvalues(args.project_adjp) if method != "tool" and scope == "project" else None
 
 # 加载所有的结果文件
 results_list = []
-for result_path in args.enrichment_results:
-    if os.path.exists(result_path) and os.path.getsize(result_path) > 0:
-        tmp_name = os.path.basename(result_path).replace(f"_{args.db}.csv", "")
-        tmp_res = pd.read_csv(result_path, index_col=0)
-        tmp_res['name'] = tmp_name
-        results_list.append(tmp_res)
+with profiler.span("load", n_files=len(args.enrichment_results)):
+    for result_path in args.enrichment_results:
+        if os.path.exists(result_path) and os.path.getsize(result_path) > 0:
+            tmp_name = os.path.basename(result_path).replace(f"_{args.db}.csv", "")
+            tmp_res = pd.read_csv(result_path, index_col=0)
+            tmp_res['name'] = tmp_name
+            if project_pvalues is not None:
+                tmp_res['project_adjp'] = project_pvalues.get(result_path)
+            results_list.append(tmp_res)
 
 # 如果没有有效的结果文件，创建空文件并退出
 if not results_list:
     pd.DataFrame().to_csv(args.results_all)
     pd.DataFrame().to_csv(args.results_sig)
+    open(args.plot_data, 'w').close()
+    save_result_matrices(make_result_matrices(pd.DataFrame(columns=list(dict.fromkeys([term_col, adjp_col, effect_col, overlap_col, 'name']))), args.tool, config_data),
+                         args.matrices, args.terms, args.feature_sets)
     sys.exit(0)
 
 # 将所有结果文件合并为一个 DataFrame
-result_df = pd.concat(results_list, axis=0)
-result_df.to_csv(args.results_all)  # 保存所有的合并结果
+with profiler.span("concat"):
+    result_df = pd.concat(results_list, axis=0)
 
-# 根据显著性水平过滤结果
-if args.tool in ["pycisTarget", "RcisTarget"]:
-    sig_terms = result_df.loc[result_df[adjp_col] >= adjp_th, term_col].unique()
-else:
-    sig_terms = result_df.loc[result_df[adjp_col] <= adjp_th, term_col].unique()
+# 统一的多重检验校正（所有查询集一次完成，每个查询集为一个 family）
+with profiler.span("adjust"):
+    result_df = adjust_results(result_df, args.tool, config_data, family_col='name', project_col='project_adjp')
+
+with profiler.span("write all"):
+    result_df.to_csv(args.results_all)  # 保存所有的合并结果
+
+# 根据显著性水平过滤结果（单个掩码，motif 工具为 NES >= 阈值）
+with profiler.span("filter"):
+    sig_terms = result_df.loc[get_significance_mask(pd.to_numeric(result_df[adjp_col], errors='coerce'), args.tool, adjp_th), term_col].unique()
+    result_sig_df = result_df.loc[result_df[term_col].isin(sig_terms), :]
+with profiler.span("write sig"):
+    result_sig_df.to_csv(args.results_sig)  # 保存显著性过滤后的结果
+
+# 稀疏的 term x feature set 矩阵（校正 p 值、效应量、重叠），供绘图、聚类和跨组比较直接使用
+with profiler.span("matrices"):
+    matrices = make_result_matrices(result_df, args.tool, config_data)
+with profiler.span("write matrices"):
+    save_result_matrices(matrices, args.matrices, args.terms, args.feature_sets)
+
+# 预先计算汇总图的数据（前 top_n 个条目、变换并截断的数值、聚类顺序），仅在有多个查询集时绘图
+if result_df['name'].nunique() < 2:
+    open(args.plot_data, 'w').close()
+    sys.exit(0)
 
-result_sig_df = result_df.loc[result_df[term_col].isin(sig_terms), :]
-result_sig_df.to_csv(args.results_sig)  # 保存显著性过滤后的结果
+with profiler.span("plot data"):
+    plot_df = make_plot_data(result_df, args.tool, config_data, matrices)
+with profiler.span("write plot data"):
+    plot_df.to_csv(args.plot_data, index=False)
@@ -1,13 +1,17 @@
 #!/bin/env python
 
-# load libraries
-import pandas as pd
+# load libraries (heavy libraries are imported on first use, i.e., not at all for empty gene lists)
 import json
 # import pickle
 import os
-import numpy as np
-import gseapy as gp
 import sys
+from instrumentation import Profiler
+from lazy_imports import lazy_import
+from gene_normalization import GeneNormalizer
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+gp = lazy_import("gseapy")
 
 # # utils for manual odds ratio calculation -> not used anymore
 # def overlap_converter(overlap_str, bg_n, gene_list_n):
@@ -27,6 +31,7 @@ import sys
 query_genes_path = snakemake.input['query_genes']
 background_genes_path = snakemake.input['background_genes']
 database_path = snakemake.input['database']
+normalization_table_path = snakemake.input.get('normalization_table', None) or None
 
 # output
 result_path = snakemake.output['result_file']
@@ -34,6 +39,9 @@ result_path = snakemake.output['result_file']
 # parameters
 db = snakemake.params["database"]
 
+# opt-in profiling spans
+profiler = Profiler("ORA_GSEApy", snakemake.wildcards["gene_set"], db)
+
 dir_results = os.path.dirname(result_path)
 
 if not os.path.exists(dir_results):
@@ -51,18 +59,19 @@ else:
         f.write('no genes found')
     quit()
 
-# load background genes
-bg_file = open(background_genes_path, "r")
-background = bg_file.read()
-background = background.split('\n')
-background.remove('')
-bg_file.close()
-
 # move on if query-genes are empty
 if len(gene_list)==0:
     open(result_path, mode='a').close()
     sys.exit(0)
 
+# load background genes
+with profiler.span("background load"):
+    bg_file = open(background_genes_path, "r")
+    background = bg_file.read()
+    background = background.split('\n')
+    background.remove('')
+    bg_file.close()
+
 # load database .pkl file
 # with open(enrichr_databases, 'rb') as f:
 #     db_dict = pickle.load(f)
@@ -70,12 +79,14 @@ if len(gene_list)==0:
 #     db_dict = json.load(json_file)
 
 # load database GMT file
-db_dict = gp.parser.read_gmt(database_path)
+with profiler.span("GMT load"):
+    db_dict = gp.parser.read_gmt(database_path)
     
-# convert gene lists and database to upper case
-gene_list=[str(x).upper() for x in list(gene_list)]
-background=[str(x).upper() for x in list(background)]
-db_dict = {key: [ele.upper() for ele in db_dict[key] ] for key in db_dict}
+# normalize gene lists the same way as the prepared database (upper case and optionally official symbols)
+with profiler.span("gene normalization"):
+    normalizer = GeneNormalizer(normalization_table_path)
+    gene_list = normalizer.normalize_symbols(gene_list)
+    background = normalizer.normalize_symbols(background)
     
 # count number of background genes for odds-ratio calculation
 # bg_n = len(background)
@@ -86,19 +97,20 @@ if len(background)==0:
     background = 20000
 
 # perform ORA (hypergeometric test) in database using GSEApy (barplots are generated automatically)
-try:
-    res = gp.enrich(gene_list=gene_list,
-                     gene_sets=db_dict,
-                     background=background,
-                     outdir=None,#os.path.join(dir_results),
-                     top_term=25,
-                     cutoff=0.05,
-                     format='png',
-                     verbose=True,
-                    ).res2d
-except ValueError:
-    print("Result is empty")
-    res = pd.DataFrame()
+with profiler.span("test", n_genes=len(gene_list), n_terms=len(db_dict)):
+    try:
+        res = gp.enrich(gene_list=gene_list,
+                         gene_sets=db_dict,
+                         background=background,
+                         outdir=None,#os.path.join(dir_results),
+                         top_term=25,
+                         cutoff=0.05,
+                         format='png',
+                         verbose=True,
+                        ).res2d
+    except ValueError:
+        print("Result is empty")
+        res = pd.DataFrame()
 
 # move on if result is empty
 if res.shape[0]==0:
@@ -119,5 +131,6 @@ column_names = [col.replace("-","_") for col in column_names]
 res.columns = column_names
 
 # separate export
-res.to_csv(result_path)
+with profiler.span("write"):
+    res.to_csv(result_path)
 
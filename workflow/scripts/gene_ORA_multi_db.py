@@ -0,0 +1,135 @@
+#!/bin/env python
+
+# load libraries (heavy libraries are imported on first use, i.e., not at all for empty gene lists)
+import os
+from instrumentation import Profiler
+from lazy_imports import lazy_import
+from significance import adjust_pvalues
+from hypergeometric import get_kernel
+from gene_normalization import GeneNormalizer, read_gene_list, load_database_index
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+sparse = lazy_import("scipy.sparse")
+
+# ORA of one query against all databases at once (prepared database indexes), writing one result per database;
+# used by the Snakemake rule and by the workers of task_queue.py (with a shared normalizer and cached database indexes)
+def ora_multi_db(query_genes_path, background_genes_path, database_paths, dbs, result_paths, profiler, normalization_table_path=None,
+                 normalizer=None, load_index=load_database_index):
+    for result_path in result_paths:
+        os.makedirs(os.path.dirname(result_path), exist_ok=True)
+
+    # check if genes file exists & load or handle exception
+    if not os.path.exists(query_genes_path):
+        for result_path in result_paths:
+            with open(os.path.join(os.path.dirname(result_path),"no_genes_found.txt"), 'w') as f:
+                f.write('no genes found')
+        return
+
+    # move on if query-genes are empty (before loading any library)
+    query_genes = read_gene_list(query_genes_path)
+    if len(query_genes)==0:
+        for result_path in result_paths:
+            open(result_path, mode='a').close()
+        return
+
+    # load and normalize query and background genes the same way as the prepared databases (upper case and optionally official symbols)
+    with profiler.span("gene normalization"):
+        normalizer = normalizer if normalizer is not None else GeneNormalizer(normalization_table_path)
+        query_symbols, query_ids = normalizer.normalize(query_genes)
+        background_symbols, background_ids = normalizer.normalize(read_gene_list(background_genes_path))
+
+    # move on if query-genes are empty
+    if len(query_ids)==0:
+        for result_path in result_paths:
+            open(result_path, mode='a').close()
+        return
+
+    # load the prepared sparse term indexes of all databases into one term index tagged by their source database
+    with profiler.span("index load", n_databases=len(dbs)):
+        indexes = [load_index(database_path) for database_path in database_paths]
+        terms = np.concatenate([index['terms'] for index in indexes])
+        term_db = np.repeat(dbs, [len(index['terms']) for index in indexes])
+        offsets = np.cumsum([0] + [len(index['gene_ids']) for index in indexes])
+        indptr = np.concatenate([[0]] + [index['indptr'][1:] + offset for index, offset in zip(indexes, offsets)])
+
+    # gene index (all gene IDs) with their symbols and sparse term x gene incidence matrix
+    with profiler.span("index"):
+        symbol_map = pd.concat([pd.Series(index['symbols'], index=index['genes']) for index in indexes]
+                               + [pd.Series(query_symbols, index=query_ids), pd.Series(background_symbols, index=background_ids)])
+        symbol_map = symbol_map[~symbol_map.index.duplicated()]
+        gene_ids = np.unique(symbol_map.index.to_numpy())
+        genes = symbol_map.reindex(gene_ids).to_numpy()
+        # gene positions mapped per database from the (possibly shared, read-only) index arrays, without concatenating their gene IDs first
+        indices = np.concatenate([np.searchsorted(gene_ids, index['gene_ids']) for index in indexes])
+        incidence = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(len(terms), len(gene_ids)))
+
+    # same conventions as GSEApy's enrich: if background-genes are provided, restrict query and terms to the background,
+    # otherwise use 20,000 genes as heuristic (this exception only occurs if background region set exceeds 500,000 regions)
+    with profiler.span("test", n_genes=len(query_ids), n_terms=len(terms)):
+        query_mask = np.zeros(len(gene_ids), dtype=np.int32)
+        query_mask[np.searchsorted(gene_ids, query_ids)] = 1
+        if len(background_ids) > 0:
+            background_mask = np.zeros(len(gene_ids), dtype=np.int32)
+            background_mask[np.searchsorted(gene_ids, background_ids)] = 1
+            incidence = incidence.multiply(background_mask).tocsr()
+            incidence.eliminate_zeros()
+            query_mask *= background_mask
+            bg_n = int(background_mask.sum())
+        else:
+            bg_n = 20000
+
+        # overlap (x), term size (m) and query size (k) of all terms at once
+        x = incidence @ query_mask
+        m = np.diff(incidence.indptr)
+        k = int(query_mask.sum())
+        # hypergeometric p-values and odds ratios (Haldane-Anscombe correction as enrich()) of all terms at once
+        kernel = get_kernel(bg_n)
+        pvalues = kernel.sf(x, m, k)
+        odds_ratio = kernel.odds_ratio(x, m, k)
+        with np.errstate(divide='ignore'):
+            combined_score = -np.log(pvalues) * odds_ratio
+
+    # write one result per database, with multiple-testing correction per database (only terms with at least one hit are tested)
+    with profiler.span("write"):
+        query_hits = incidence.multiply(query_mask).tocsr()
+        query_hits.eliminate_zeros()
+        for db, result_path in zip(dbs, result_paths):
+            tested = np.flatnonzero((term_db == db) & (x > 0))
+            if len(tested)==0:
+                open(result_path, mode='a').close()
+                continue
+
+            res = pd.DataFrame({
+                'Gene_set': db,
+                'Term': [terms[i] for i in tested],
+                'Overlap': ["{}/{}".format(x[i], m[i]) for i in tested],
+                'P_value': pvalues[tested],
+                'Adjusted_P_value': adjust_pvalues(pvalues[tested], 'BH'),
+                'Odds_Ratio': odds_ratio[tested],
+                'Combined_Score': combined_score[tested],
+                'Genes': [";".join(genes[j] for j in query_hits.indices[query_hits.indptr[i]:query_hits.indptr[i+1]]) for i in tested],
+            }).sort_values('Adjusted_P_value', kind='stable').reset_index(drop=True)
+
+            # separate export
+            res.to_csv(result_path)
+
+if "snakemake" in globals():
+    # configs
+
+    # input
+    query_genes_path = snakemake.input['query_genes']
+    background_genes_path = snakemake.input['background_genes']
+    database_paths = list(snakemake.input['databases'])
+    normalization_table_path = snakemake.input.get('normalization_table', None) or None
+
+    # output
+    result_paths = list(snakemake.output['result_files'])
+
+    # parameters
+    dbs = snakemake.params["databases"]
+
+    # opt-in profiling spans
+    profiler = Profiler("ORA_GSEApy", snakemake.wildcards["gene_set"], "multi_db")
+
+    ora_multi_db(query_genes_path, background_genes_path, database_paths, dbs, result_paths, profiler, normalization_table_path)
@@ -0,0 +1,70 @@
+#!/bin/env python
+
+# vectorized gene symbol normalization using the precomputed per genome table (alias -> official symbol & Entrez gene ID)
+# built by gene_normalization_table.R; without a table, genes are only upper-cased.
+# genes that can not be mapped keep their upper-cased symbol and get a stable negative ID derived from it (63-bit hash),
+# so that integer gene IDs are consistent across queries, backgrounds and databases.
+
+import hashlib
+from lazy_imports import lazy_import
+from shared_store import load_shared
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# stable negative IDs for unmapped symbols (Entrez gene IDs are positive), distinct symbols sharing an ID raise an error
+# instead of silently merging genes (expected collisions of 63-bit hashes are negligible, e.g., ~1e-10 for 60,000 symbols)
+# (each distinct symbol is hashed once, e.g., genes occurring in many terms of a database)
+def get_unmapped_ids(symbols):
+    codes, unique = pd.factorize(np.asarray(symbols, dtype=object))
+    hashes = np.fromiter((int.from_bytes(hashlib.blake2b(symbol.encode(), digest_size=8).digest(), 'little') & 0x7fffffffffffffff
+                          for symbol in unique), dtype=np.int64, count=len(unique))
+    unique_ids = -hashes - 1
+    collisions = pd.Series(unique_ids).duplicated(keep=False).to_numpy()
+    if collisions.any():
+        order = np.argsort(unique_ids[collisions], kind='stable')
+        raise ValueError("Gene ID collision of unmapped symbols: {}.".format(", ".join(np.asarray(unique[collisions])[order])))
+    return unique_ids[codes]
+
+class GeneNormalizer:
+    def __init__(self, table_path=None):
+        self.aliases = None
+        if table_path:
+            table = pd.read_csv(table_path, dtype={'alias': str, 'symbol': str, 'gene_id': np.int64}, keep_default_na=False)
+            self.aliases = pd.Index(table['alias'])
+            self.symbols = table['symbol'].to_numpy(dtype=object)
+            self.ids = table['gene_id'].to_numpy()
+
+    # normalized (upper-case, official) symbols and integer gene IDs of a list of genes
+    def normalize(self, genes):
+        upper = pd.Index(genes, dtype=object).astype(str).str.strip().str.upper().to_numpy(dtype=object)
+        symbols = upper.copy()
+        ids = np.zeros(len(upper), dtype=np.int64)
+        mapped = np.zeros(len(upper), dtype=bool)
+
+        if self.aliases is not None and len(upper) > 0:
+            positions = self.aliases.get_indexer(upper)
+            mapped = positions >= 0
+            symbols[mapped] = self.symbols[positions[mapped]]
+            ids[mapped] = self.ids[positions[mapped]]
+
+        ids[~mapped] = get_unmapped_ids(upper[~mapped])
+        return symbols, ids
+
+    # normalized symbols as list without duplicates (keeping the first occurrence)
+    def normalize_symbols(self, genes):
+        symbols, _ = self.normalize(genes)
+        return list(pd.unique(symbols))
+
+# read a line based gene list (e.g., query or background genes)
+def read_gene_list(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() != ""]
+
+# load the sparse term index of a prepared database (written by prepare_databases_GSEApy.py),
+# attached read-only from the node-local shared memory store if enabled (see shared_store.py)
+def load_database_index(path):
+    def load():
+        with np.load(path, allow_pickle=False) as index:
+            return {key: index[key] for key in ['terms', 'indptr', 'gene_ids', 'genes', 'symbols']}
+    return load_shared(path, load)
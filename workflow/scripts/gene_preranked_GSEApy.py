@@ -1,83 +1,104 @@
 #!/bin/env python
 
-# load libraries
-import pandas as pd
+# load libraries (heavy libraries are imported on first use, i.e., gseapy not at all with cached null distributions or empty rankings)
 import json
 # import pickle
 import os
-import numpy as np
-import gseapy as gp
-import sys
-
-
-# configs
-
-# input
-query_genes_path = snakemake.input['query_genes']
-database_path = snakemake.input['database']
-
-# output
-result_path = snakemake.output['result_file']
-
-# parameters
-db = snakemake.params["database"]
-
-dir_results = os.path.dirname(result_path)
-
-if not os.path.exists(dir_results):
-    os.mkdir(dir_results)
-
-# load gene-score file
-genes = pd.read_csv(query_genes_path, index_col=0)
-
-# # load database JSON file
-# with open(database_path) as json_file:
-#     db_dict = json.load(json_file)
-
-# load database GMT file
-db_dict = gp.parser.read_gmt(database_path)
-
-# convert all genes to upper case
-genes.index = [str(x).upper() for x in list(genes.index)]
-db_dict = {key: [ele.upper() for ele in db_dict[key] ] for key in db_dict}
-
-# remove duplicates: only retain largest absolute value
-# sort by absolute value of "score" column (i.e., first column)
-genes = genes.iloc[abs(genes.iloc[:, 0]).argsort()[::-1]]
-# drop duplicates based on index
-genes = genes[~genes.index.duplicated(keep='first')]
-# replace +inf with max value and -inf with min value
-score_col = genes.columns[0]
-genes[score_col] = genes[score_col].replace([np.inf, -np.inf], [genes[score_col][genes[score_col] != np.inf].max(), genes[score_col][genes[score_col] != -np.inf].min()])
-
-# run prerank GSEA of database with GSEApy
-res = gp.prerank(rnk=genes,
-                 gene_sets=db_dict,
-                 #threads=4,
-                 min_size=1, # Minimum allowed number of genes from gene set also the data set. Default: 15.
-                 max_size=100000, # Maximum allowed number of genes from gene set also the data set. Defaults: 500.
-                 permutation_num=1000, # Number of permutations. Reduce number to speed up testing;  Default: 1000. Minimial possible nominal p-value is about 1/nperm.
-                 outdir=os.path.join(dir_results),
-                 graph_num = 25, # Plot graphs for top sets of each phenotype.
-                 format='png',
-                 seed=42,
-                 verbose=True,
-                ).res2d
-
-# move on if result is empty
-if res.shape[0]==0:
-    open(result_path, mode='a').close()
-    sys.exit(0)
-
-# annotate used gene set
-res['Gene_set'] = db
-
-# make column names language agnostic (i.e., R compatible)
-column_names = list(res.columns.values)
-column_names = [col.replace(" %","") for col in column_names]
-column_names = [col.replace(" ","_") for col in column_names]
-column_names = [col.replace("-","_") for col in column_names]
-res.columns = column_names
-
-# separate export
-res.to_csv(result_path)
+from instrumentation import Profiler
+from lazy_imports import lazy_import
+from prepare_ranks_GSEApy import load_prepared_arrays, get_rank_frame
+from gene_normalization import load_database_index
+from prerank_engine import NullCache, prerank, format_result, PERMUTATIONS, SEED
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+gp = lazy_import("gseapy")
+
+
+# preranked GSEA of one prepared ranked vector against one database, with GSEApy or the null distribution cache (config: prerank_null_cache);
+# used by the Snakemake rule and by the workers of task_queue.py (with cached database indexes)
+def preranked_gsea(query_genes_path, database_path, database_index_path, result_path, db, profiler, null_cache_path, null_cache_config,
+                   load_index=load_database_index):
+    permutation_num = PERMUTATIONS
+    seed = SEED
+
+    dir_results = os.path.dirname(result_path)
+
+    if not os.path.exists(dir_results):
+        os.makedirs(dir_results, exist_ok=True)
+
+    # load prepared (normalized, deduplicated and ranked) gene-score vector
+    with profiler.span("rank load"):
+        ranks = load_prepared_arrays(query_genes_path)
+
+    # move on if the ranking is empty (before loading gseapy)
+    if len(ranks['scores'])==0:
+        open(result_path, mode='a').close()
+        return
+
+    # preranked GSEA with cached null distributions per gene set size (config: prerank_null_cache), no GSEApy plots
+    if int(null_cache_config.get("enabled", 0)):
+        with profiler.span("index load"):
+            index = load_index(database_index_path)
+
+        with profiler.span("test", n_genes=len(ranks['scores']), n_terms=len(index['terms'])):
+            cache = NullCache(null_cache_path, ranks['scores'], permutation_num, seed, float(null_cache_config.get("size_resolution", 0)))
+            res = prerank(ranks, index, cache, min_size=1, max_size=100000)
+        print("null distribution cache {}: {} size buckets reused, {} computed".format(cache.directory, cache.hits, cache.misses))
+    else:
+        genes = get_rank_frame(ranks)
+
+        # # load database JSON file
+        # with open(database_path) as json_file:
+        #     db_dict = json.load(json_file)
+
+        # load database GMT file
+        with profiler.span("GMT load"):
+            db_dict = gp.parser.read_gmt(database_path)
+
+        # run prerank GSEA of database with GSEApy
+        with profiler.span("test", n_genes=genes.shape[0], n_terms=len(db_dict)):
+            res = gp.prerank(rnk=genes,
+                             gene_sets=db_dict,
+                             #threads=4,
+                             min_size=1, # Minimum allowed number of genes from gene set also the data set. Default: 15.
+                             max_size=100000, # Maximum allowed number of genes from gene set also the data set. Defaults: 500.
+                             permutation_num=permutation_num, # Number of permutations. Reduce number to speed up testing;  Default: 1000. Minimial possible nominal p-value is about 1/nperm.
+                             outdir=os.path.join(dir_results),
+                             graph_num = 25, # Plot graphs for top sets of each phenotype.
+                             format='png',
+                             seed=seed,
+                             verbose=True,
+                            ).res2d
+
+    # move on if result is empty
+    if res.shape[0]==0:
+        open(result_path, mode='a').close()
+        return
+
+    # annotate used gene set and make column names language agnostic (i.e., R compatible)
+    res = format_result(res, db)
+
+    # separate export
+    with profiler.span("write"):
+        res.to_csv(result_path)
+
+if "snakemake" in globals():
+    # configs
+
+    # input
+    query_genes_path = snakemake.input['ranks']
+    database_path = snakemake.input['database']
+    database_index_path = snakemake.input['database_index']
+
+    # output
+    result_path = snakemake.output['result_file']
+
+    # parameters
+    db = snakemake.params["database"]
+    null_cache_config = snakemake.config.get("prerank_null_cache", None) or {}
+
+    # opt-in profiling spans
+    profiler = Profiler("preranked_GSEApy", snakemake.wildcards["gene_set"], db)
+
+    preranked_gsea(query_genes_path, database_path, database_index_path, result_path, db, profiler, snakemake.params["null_cache"], null_cache_config)
@@ -0,0 +1,155 @@
+#!/bin/env python
+import os
+import math
+import random
+import argparse
+import yaml
+
+# approximate hg38 chromosome sizes used to place synthetic regions
+CHROM_SIZES = {
+    'chr1': 248956422, 'chr2': 242193529, 'chr3': 198295559, 'chr4': 190214555, 'chr5': 181538259,
+    'chr6': 170805979, 'chr7': 159345973, 'chr8': 145138636, 'chr9': 138394717, 'chr10': 133797422,
+    'chr11': 135086622, 'chr12': 133275309, 'chr13': 114364328, 'chr14': 107043718, 'chr15': 101991189,
+    'chr16': 90338345, 'chr17': 83257441, 'chr18': 80373285, 'chr19': 58617616, 'chr20': 64444167,
+    'chr21': 46709983, 'chr22': 50818468, 'chrX': 156040895,
+}
+
+# write regions as BED file sorted by chromosome and start
+def write_bed(path, regions):
+    with open(path, 'w') as f:
+        for chrom, start, end, score in sorted(regions, key=lambda r: (r[0], r[1])):
+            f.write(f"{chrom}\t{start}\t{end}\t.\t{score}\n")
+
+# write one gene per line
+def write_genes(path, genes):
+    with open(path, 'w') as f:
+        f.write("\n".join(genes) + "\n")
+
+# uniformly placed background regions proportional to chromosome size
+def make_background(rng, n_regions, width):
+    chroms = list(CHROM_SIZES.keys())
+    weights = [CHROM_SIZES[c] for c in chroms]
+    regions = []
+    for chrom in rng.choices(chroms, weights=weights, k=n_regions):
+        start = rng.randrange(0, CHROM_SIZES[chrom] - width)
+        regions.append((chrom, start, start + width, rng.randint(0, 1000)))
+    return regions
+
+# GMT database with log-uniformly distributed term sizes
+def write_gmt(path, rng, universe, n_terms, min_size, max_size, prefix):
+    with open(path, 'w') as f:
+        for i in range(n_terms):
+            size = int(math.exp(rng.uniform(math.log(min_size), math.log(min(max_size, len(universe))))))
+            f.write(f"{prefix}_TERM_{i}\t\t" + "\t".join(rng.sample(universe, size)) + "\n")
+
+# LOLA region database: one collection with region files sampled from the background
+def write_lola_db(path, rng, background, n_region_sets, set_size):
+    collection = os.path.join(path, 'synthetic')
+    os.makedirs(os.path.join(collection, 'regions'), exist_ok=True)
+    with open(os.path.join(collection, 'collection.txt'), 'w') as f:
+        f.write("collector\tdate\tsource\tdescription\nsynthetic\t\t\tsynthetic benchmark collection\n")
+    with open(os.path.join(collection, 'index.txt'), 'w') as f:
+        f.write("filename\tdescription\n")
+        for i in range(n_region_sets):
+            filename = f"region_set_{i}.bed"
+            write_bed(os.path.join(collection, 'regions', filename), rng.sample(background, min(set_size, len(background))))
+            f.write(f"{filename}\tsynthetic_region_set_{i}\n")
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Generate synthetic region sets, gene sets, ranked gene sets and databases for benchmarking.")
+    parser.add_argument("--output", required=True, help="Output directory (becomes the Snakemake working directory).")
+    parser.add_argument("--config_template", required=True, help="Configuration file used as template (e.g., config/config.yaml).")
+    parser.add_argument("--n_region_sets", type=int, default=2, help="Number of query region sets.")
+    parser.add_argument("--n_regions", type=int, default=1000, help="Number of regions per query region set.")
+    parser.add_argument("--n_background", type=int, default=10000, help="Number of background regions.")
+    parser.add_argument("--region_width", type=int, default=500, help="Width of the synthetic regions.")
+    parser.add_argument("--n_gene_sets", type=int, default=2, help="Number of query gene sets.")
+    parser.add_argument("--n_genes", type=int, default=500, help="Number of genes per query gene set.")
+    parser.add_argument("--n_rank_files", type=int, default=1, help="Number of ranked gene sets.")
+    parser.add_argument("--gene_universe", default="", help="Optional file with one gene symbol per line (e.g., for GREAT-mapped genes); synthetic names otherwise.")
+    parser.add_argument("--n_universe", type=int, default=20000, help="Number of synthetic background genes.")
+    parser.add_argument("--n_databases", type=int, default=1, help="Number of GMT databases.")
+    parser.add_argument("--n_terms", type=int, default=100, help="Number of terms per GMT database.")
+    parser.add_argument("--min_term_size", type=int, default=5, help="Minimal term size.")
+    parser.add_argument("--max_term_size", type=int, default=500, help="Maximal term size.")
+    parser.add_argument("--n_lola_region_sets", type=int, default=0, help="Number of region sets of a synthetic LOLA database (0 = no LOLA).")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    data_dir = os.path.join(args.output, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(os.path.join(args.output, 'config'), exist_ok=True)
+
+    # gene universe
+    if args.gene_universe != "":
+        with open(args.gene_universe) as f:
+            universe = sorted(set(line.strip() for line in f if line.strip() != ""))
+    else:
+        universe = [f"SYN{i}" for i in range(args.n_universe)]
+    write_genes(os.path.join(data_dir, 'background_genes.txt'), universe)
+
+    annotation = []
+
+    # region sets sampled from a common background
+    if args.n_region_sets > 0:
+        background = make_background(rng, args.n_background, args.region_width)
+        background_path = os.path.join(data_dir, 'background_regions.bed')
+        write_bed(background_path, background)
+        for i in range(args.n_region_sets):
+            path = os.path.join(data_dir, f'region_set_{i}.bed')
+            write_bed(path, rng.sample(background, min(args.n_regions, len(background))))
+            annotation.append((f'region_set_{i}', path, 'background_regions', background_path, 'synthetic_regions'))
+
+    # gene sets
+    for i in range(args.n_gene_sets):
+        path = os.path.join(data_dir, f'gene_set_{i}.txt')
+        write_genes(path, rng.sample(universe, min(args.n_genes, len(universe))))
+        annotation.append((f'gene_set_{i}', path, 'background_genes', os.path.join(data_dir, 'background_genes.txt'), 'synthetic_genes'))
+
+    # ranked gene sets
+    for i in range(args.n_rank_files):
+        path = os.path.join(data_dir, f'ranked_genes_{i}.csv')
+        with open(path, 'w') as f:
+            f.write("symbol,score\n")
+            for gene in universe:
+                f.write(f"{gene},{rng.gauss(0, 2):.6f}\n")
+        annotation.append((f'ranked_genes_{i}', path, '', '', 'synthetic_genes'))
+
+    # databases
+    databases = {}
+    for i in range(args.n_databases):
+        path = os.path.join(data_dir, f'synthetic_db_{i}.gmt')
+        write_gmt(path, rng, universe, args.n_terms, args.min_term_size, args.max_term_size, f"SYNTHETIC_DB_{i}")
+        databases[f'synthetic_db_{i}'] = os.path.abspath(path)
+
+    lola_databases = {}
+    if args.n_lola_region_sets > 0 and args.n_region_sets > 0:
+        lola_path = os.path.join(data_dir, 'LOLA')
+        write_lola_db(lola_path, rng, background, args.n_lola_region_sets, args.n_regions)
+        lola_databases['synthetic_LOLA'] = os.path.abspath(lola_path)
+
+    # annotation file with absolute paths
+    annotation_path = os.path.join(args.output, 'config', 'annotation.csv')
+    with open(annotation_path, 'w') as f:
+        f.write("name,features_path,background_name,background_path,group\n")
+        for name, path, bg_name, bg_path, group in annotation:
+            f.write(f"{name},{os.path.abspath(path)},{bg_name},{os.path.abspath(bg_path) if bg_path else ''},{group}\n")
+
+    # configuration derived from the template, without cisTarget databases (no synthetic rankings)
+    with open(args.config_template) as f:
+        config = yaml.safe_load(f)
+    config['annotation'] = os.path.abspath(annotation_path)
+    config['result_path'] = os.path.abspath(os.path.join(args.output, 'results'))
+    config['project_name'] = 'benchmark'
+    config['genome'] = 'hg38'
+    config['local_databases'] = databases
+    config['lola_databases'] = lola_databases if len(lola_databases) > 0 else {'LOLA': ""}
+    config['pycistarget_parameters']['databases'] = {'pycisTarget': ""}
+    config['rcistarget_parameters']['databases'] = {'RcisTarget': ""}
+    with open(os.path.join(args.output, 'config', 'config.yaml'), 'w') as f:
+        yaml.dump(config, f, indent=4, sort_keys=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/bin/env python
+
+# shared hypergeometric kernel of the Python enrichment engines (ORA_GSEApy multi-database and region-weighted ORA):
+# all terms of a query are tested against the same population size N, so log-factorials are tabulated once up to N and the tails of
+# all (overlap, term size) tables are evaluated at once as sums of exp(log pmf), instead of per table.
+# each tail is summed from its starting value away from the mode, i.e., over decreasing terms: it is truncated once the remaining terms are
+# provably below double precision. Tails right of the mode are summed directly (small p-values stay exact),
+# the others as complement of the opposite tail.
+
+import functools
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+special = lazy_import("scipy.special")
+
+# number of summed terms per batch
+BATCH_SIZE = 5000000
+
+# relative precision of the truncated tails
+TOLERANCE = 1e-20
+
+class HypergeometricKernel:
+    def __init__(self, N):
+        self.N = int(N)
+        self.log_factorials = special.gammaln(np.arange(self.N + 1, dtype=np.float64) + 1)
+
+    # log pmf of overlaps i (arrays of equal length as K and n)
+    def log_pmf(self, i, K, n):
+        lf = self.log_factorials
+        N = self.N
+        return (lf[K] - lf[i] - lf[K - i]) + (lf[N - K] - lf[n - i] - lf[N - K - n + i]) - (lf[N] - lf[n] - lf[N - n])
+
+    # sums of pmf(start + step * j) for j < lengths (lengths >= 1) of many tables at once, in batches of at most BATCH_SIZE terms
+    def tail_sums(self, start, step, lengths, K, n):
+        sums = np.zeros(len(start))
+        batches = np.cumsum(lengths) // BATCH_SIZE
+        for batch in np.unique(batches):
+            rows = np.flatnonzero(batches == batch)
+            offsets = np.concatenate([[0], np.cumsum(lengths[rows])[:-1]])
+            j = np.arange(lengths[rows].sum()) - np.repeat(offsets, lengths[rows])
+            log_pmf = self.log_pmf(np.repeat(start[rows], lengths[rows]) + step * j, np.repeat(K[rows], lengths[rows]), np.repeat(n[rows], lengths[rows]))
+            # log-sum-exp per table
+            peak = np.maximum.reduceat(log_pmf, offsets)
+            sums[rows] = np.exp(peak) * np.add.reduceat(np.exp(log_pmf - np.repeat(peak, lengths[rows])), offsets)
+        return sums
+
+    # survival function P(X >= x) of all tables (overlap x, term size K, query size n) at once (same as scipy.stats.hypergeom.sf(x - 1, N, K, n)),
+    # invalid tables (sizes outside the population) are NaN
+    def sf(self, x, K, n):
+        x, K, n = (np.array(a, dtype=np.int64) for a in np.broadcast_arrays(x, K, n))
+        N = self.N
+        result = np.full(len(x), np.nan)
+        valid = (K >= 0) & (K <= N) & (n >= 0) & (n <= N)
+        lower, upper = np.maximum(0, n + K - N), np.minimum(K, n)
+        result[valid & (x <= lower)] = 1
+        result[valid & (x > upper)] = 0
+
+        inner = np.flatnonzero(valid & (x > lower) & (x <= upper))
+        x, K, n, lower, upper = x[inner], K[inner], n[inner], lower[inner], upper[inner]
+        mode = ((n + 1) * (K + 1)) // (N + 2)
+        right = x > mode
+
+        # upper tail from x upwards (x right of the mode), otherwise the complement of the lower tail from x - 1 downwards
+        start = np.where(right, x, x - 1)
+        step = np.where(right, 1, -1)
+        lengths = np.where(right, upper - x + 1, x - lower)
+        # truncation: the remaining terms are below TOLERANCE x the first term, bounded by a geometric series (ratio of consecutive terms
+        # at the start, the ratios decrease away from the mode) or by Hoeffding's inequality for the hypergeometric distribution
+        i = start.astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(right, (K - i) * (n - i) / ((i + 1) * (N - K - n + i + 1)), i * (N - K - n + i) / ((K - i + 1) * (n - i + 1)))
+            geometric = np.ceil(np.log(TOLERANCE * (1 - ratio)) / np.log(ratio)) + 1
+        geometric = np.where((ratio < 1) & np.isfinite(geometric), geometric, np.inf)
+        width = np.sqrt(np.minimum.reduce([n, K, N - n, N - K]) * (-np.log(TOLERANCE) - np.minimum(self.log_pmf(start, K, n), 0)) / 2)
+        mean = n * K / N
+        hoeffding = np.ceil(np.where(right, mean + width - i, i - mean + width)) + 1
+        lengths = np.minimum(lengths, np.maximum(np.minimum(geometric, hoeffding), 1)).astype(np.int64)
+
+        sums = np.zeros(len(inner))
+        for direction in [1, -1]:
+            rows = np.flatnonzero(step == direction)
+            if len(rows) > 0:
+                sums[rows] = self.tail_sums(start[rows], direction, lengths[rows], K[rows], n[rows])
+        result[inner] = np.clip(np.where(right, sums, 1 - sums), 0, 1)
+        return result
+
+    # odds ratios of all tables with Haldane-Anscombe correction (0.5 added to every cell, same as GSEApy's enrich)
+    def odds_ratio(self, x, K, n):
+        a, b, c, d = x, K - x, n - x, self.N - K - n + x
+        return ((a + 0.5) * (d + 0.5)) / ((b + 0.5) * (c + 0.5))
+
+# kernel of a population size, reused across queries of the same size (e.g., queries sharing a background in task_queue.py workers)
+@functools.lru_cache(maxsize=8)
+def get_kernel(N):
+    return HypergeometricKernel(N)
@@ -0,0 +1,64 @@
+#!/bin/env python
+
+# opt-in profiling of named spans (e.g., GMT load, test, write) within a job
+# enabled by the Snakefile (config: profiling) via the environment variable below, pointing to the profiling directory
+# each job writes one JSON line per span to {profiling_dir}/{tool}/{job}_{db}.jsonl, rolled up by summarize_profiling.py
+
+import os
+import sys
+import json
+import time
+import resource
+import contextlib
+
+PROFILING_ENV = "ENRICHMENT_ANALYSIS_PROFILING"
+
+# peak resident memory of this process so far in MB
+def get_peak_memory():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KB on Linux
+    return max_rss / 1e6 if sys.platform == "darwin" else max_rss / 1e3
+
+class Profiler:
+    def __init__(self, tool, job, db=""):
+        self.tool = tool
+        self.job = job
+        self.db = db
+        self.path = None
+
+        profiling_dir = os.environ.get(PROFILING_ENV, "")
+        if profiling_dir != "":
+            self.path = os.path.join(profiling_dir, tool, "{}_{}.jsonl".format(job, db) if db else "{}.jsonl".format(job))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # start fresh, a rerun of the job replaces its spans
+            open(self.path, 'w').close()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    # time a named span and record it together with the peak memory
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.time()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record = {"tool": self.tool,
+                      "db": self.db,
+                      "job": self.job,
+                      "span": name,
+                      "start": start,
+                      "s": time.perf_counter() - start_wall,
+                      "cpu_s": time.process_time() - start_cpu,
+                      "max_rss_mb": get_peak_memory(),
+                      **fields,
+                     }
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
@@ -0,0 +1,21 @@
+#!/bin/env python
+
+# lazy imports for the job scripts: a module is only executed on first attribute access (importlib's LazyLoader),
+# so that jobs exiting early (e.g., on empty gene lists) do not pay the import time of heavy libraries (gseapy, pandas, scipy)
+# usage: pd = lazy_import("pandas") instead of import pandas as pd; measure with: python workflow/benchmark.py --startup
+
+import sys
+import importlib.util
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named '{}'".format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
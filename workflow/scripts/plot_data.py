@@ -0,0 +1,106 @@
+#!/bin/env python
+
+# precomputed plot data of the group summaries (written by aggregate.py, rendered by overview_plot.R)
+# top terms x feature sets with transformed and capped adjusted p-values and effect-sizes, in clustered order
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import linkage, leaves_list, optimal_leaf_ordering
+from scipy.cluster.vq import kmeans2
+from result_matrices import make_result_matrices, to_dense
+from significance import MOTIF_TOOLS, get_threshold, get_significance_mask
+
+# number of principal components used for the approximate ordering of large matrices
+MAX_COMPONENTS = 20
+
+# hierarchical clustering order (complete linkage on euclidean distances, as hclust(dist(x))) with optimal leaf ordering
+# for up to max_n rows; larger matrices are ordered approximately with bounded memory (no n x n distance matrix):
+# the rows are projected onto their leading principal components and grouped by k-means,
+# the clusters are ordered by hierarchical clustering of their centroids and the rows within each cluster recursively
+def get_cluster_order(matrix, max_n=1000, seed=42):
+    n = matrix.shape[0]
+    if n < 3:
+        return np.arange(n)
+    if n <= max_n:
+        tree = linkage(matrix, method='complete', metric='euclidean')
+        return leaves_list(optimal_leaf_ordering(tree, matrix))
+
+    # reduce dimensions
+    centered = matrix - matrix.mean(axis=0)
+    components = np.linalg.svd(centered, full_matrices=False)[2][:MAX_COMPONENTS]
+    reduced = centered @ components.T
+    if not np.any(reduced):
+        # no structure (i.e., identical rows)
+        return np.arange(n)
+
+    # k-means with at most max_n clusters, so that their centroids can be clustered exactly
+    k = min(int(np.ceil(np.sqrt(n))), max_n)
+    centroids, labels = kmeans2(reduced, k, minit='++', seed=seed)
+    clusters = np.unique(labels)
+    if len(clusters) == 1:
+        return np.argsort(reduced[:, 0], kind='stable')
+
+    order = []
+    for cluster in clusters[get_cluster_order(centroids[clusters], max_n, seed)]:
+        members = np.flatnonzero(labels == cluster)
+        order.append(members[get_cluster_order(matrix[members], max_n, seed)])
+    return np.concatenate(order)
+
+# long format plot data: one row per term and feature set, ordered by the clustering of terms (and feature sets)
+# the matrices of the top terms are sliced from the aggregated term x feature set matrices (built if not provided)
+def make_plot_data(result_df, tool, config, matrices=None):
+    term_col = config["column_names"][tool]["term"]
+    adjp_col = config["column_names"][tool]["adj_pvalue"]
+    adjp_th = get_threshold(config, tool)
+    top_n = int(config["top_terms_n"])
+    effect_cap = config["nes_cap"] if tool == "preranked_GSEApy" else config["or_cap"]
+    cluster_flag = bool(int(config["cluster_summary"]))
+    cluster_max_terms = int(config.get("cluster_max_terms", 1000))
+
+    # remove empty terms
+    result_df = result_df.loc[result_df[term_col].notna() & (result_df[term_col] != ""), :]
+    feature_sets = result_df['name'].unique()
+
+    # determine top_n most significant terms per feature set (not necessarily statistically significant!)
+    ranked_df = result_df.sort_values(adjp_col, ascending=tool not in MOTIF_TOOLS, kind='stable')
+    top_terms = ranked_df.groupby('name', sort=False).head(top_n)[term_col].unique()
+
+    # adjusted p-value and effect-size (odds-ratio or normalized enrichment scores) matrices of only the top terms
+    if matrices is None:
+        matrices = make_result_matrices(result_df, tool, config)
+    rows = pd.Index(matrices['terms']).get_indexer(top_terms)
+    adjp_df = pd.DataFrame(to_dense(matrices, 'adjp', rows), index=top_terms, columns=matrices['feature_sets']).reindex(columns=feature_sets)
+    effect_df = pd.DataFrame(to_dense(matrices, 'effect', rows), index=top_terms, columns=matrices['feature_sets']).reindex(columns=feature_sets)
+
+    # fill NA for effect_df with 1 or 0 (i.e., neutral enrichment) and for adjp_df with 1 (i.e., no significance)
+    effect_df = effect_df.fillna(0 if tool == "preranked_GSEApy" or tool in MOTIF_TOOLS else 1)
+    adjp_df = adjp_df.fillna(0 if tool in MOTIF_TOOLS else 1)
+
+    # statistical significance annotation
+    significant_df = get_significance_mask(adjp_df, tool, adjp_th)
+
+    # log2 transform odds ratios
+    if tool != "preranked_GSEApy" and tool not in MOTIF_TOOLS:
+        with np.errstate(divide='ignore'):
+            effect_df = np.log2(effect_df)
+
+    # cap effect-sizes abs(log2(or)) < or_cap OR abs(NES) < nes_cap, log10 transform adjp & cap -log10(adjpvalue) < adjp_cap
+    if tool not in MOTIF_TOOLS:
+        effect_df = effect_df.clip(lower=-effect_cap, upper=effect_cap)
+        with np.errstate(divide='ignore'):
+            adjp_df = (-np.log10(adjp_df)).clip(upper=config["adjp_cap"])
+
+    # cluster terms (and feature sets) by their effect-sizes
+    row_order = get_cluster_order(effect_df.to_numpy(dtype=float), cluster_max_terms)
+    col_order = get_cluster_order(effect_df.to_numpy(dtype=float).T, cluster_max_terms) if cluster_flag else np.arange(effect_df.shape[1])
+
+    terms = effect_df.index[row_order]
+    feature_sets = effect_df.columns[col_order]
+    plot_df = pd.DataFrame({
+        'terms': np.repeat(terms, len(feature_sets)),
+        'feature_set': np.tile(feature_sets, len(terms)),
+        'effect': effect_df.loc[terms, feature_sets].to_numpy().ravel(),
+        'adjp': adjp_df.loc[terms, feature_sets].to_numpy().ravel(),
+        'significant': significant_df.loc[terms, feature_sets].to_numpy().ravel().astype(int),
+    })
+    return plot_df
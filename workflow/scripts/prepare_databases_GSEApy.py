@@ -1,22 +1,38 @@
 #!/bin/env python
 import json
-import gseapy as gp
 import os
 import shutil
 import argparse
+import numpy as np
+import pandas as pd
+from gene_normalization import GeneNormalizer
 
-def main():
-    # Parse command line arguments
-    parser = argparse.ArgumentParser(description="Prepare databases for GSEApy.")
-    parser.add_argument("--input", required=True, help="Path to the input database file (GMT or JSON).")
-    parser.add_argument("--output", required=True, help="Path to the output GMT file.")
-    parser.add_argument("--database", required=True, help="Name of the database.")
-    args = parser.parse_args()
-
-    db_path = args.input
-    results_path = args.output
-    db = args.database
+# load GMT or JSON database as lists of terms, descriptions and genes
+def load_database(db_path):
+    terms, descriptions, genes = [], [], []
+    if db_path.lower().endswith('.gmt'):
+        with open(db_path, 'r') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 2 or fields[0] == "":
+                    continue
+                terms.append(fields[0])
+                descriptions.append(fields[1])
+                genes.append([gene for gene in fields[2:] if gene != ""])
+    elif db_path.lower().endswith('.json'):
+        # JSON load
+        with open(db_path, 'r') as f:
+            data = json.load(f)
+        for key, values in data.items():
+            terms.append(key)
+            descriptions.append("")
+            genes.append(list(values))
+    else:
+        raise ValueError("Please provide a GMT (*.gmt) or JSON (*.json) database file.")
+    return terms, descriptions, genes
 
+# original symbols as GMT (e.g., for GREAT, which maps symbols to Entrez gene IDs with its own case-sensitive orgdb lookup)
+def save_original_database(db_path, results_path):
     # if GMT, just copy
     if db_path.lower().endswith('.gmt'):
         shutil.copy(db_path, results_path)
@@ -29,7 +45,59 @@ def main():
             for key, values in data.items():
                 f.write(f"{key}\t\t" + "\t".join(values) + "\n")
     else:
-        print("Error: Please provide a GMT (*.gmt) or JSON (*.json) database file.")
+        raise ValueError("Please provide a GMT (*.gmt) or JSON (*.json) database file.")
+
+def prepare_database(db_path, results_path, normalized_path, index_path, normalization_table=None):
+    terms, descriptions, genes = load_database(db_path)
+    save_original_database(db_path, results_path)
+
+    # normalize all genes at once (upper case, aliases & orthologs to official symbols) and remove duplicates within each term
+    normalizer = GeneNormalizer(normalization_table)
+    symbols, ids = normalizer.normalize([gene for term_genes in genes for gene in term_genes])
+    entries = pd.DataFrame({'term': np.repeat(np.arange(len(terms)), [len(term_genes) for term_genes in genes]),
+                            'symbol': symbols,
+                            'gene_id': ids,
+                           }).drop_duplicates(subset=['term', 'gene_id'])
+
+    # save as separate GMT with normalized symbols (GSEApy rules, queries are normalized the same way)
+    term_symbols = entries.groupby('term', sort=False)['symbol'].apply(list).to_dict()
+    os.makedirs(os.path.dirname(os.path.abspath(normalized_path)), exist_ok=True)
+    with open(normalized_path, 'w') as f:
+        for i, (term, description) in enumerate(zip(terms, descriptions)):
+            f.write(f"{term}\t{description}\t" + "\t".join(term_symbols.get(i, [])) + "\n")
+
+    # save sparse term index (CSR: genes of term i are gene_ids[indptr[i]:indptr[i+1]]) with the symbol of each gene ID
+    genes_df = entries.drop_duplicates(subset='gene_id').sort_values('gene_id')
+    np.savez(index_path,
+             terms=np.array(terms, dtype=str),
+             indptr=np.concatenate([[0], np.cumsum(np.bincount(entries['term'], minlength=len(terms)))]).astype(np.int64),
+             gene_ids=entries['gene_id'].to_numpy(dtype=np.int64),
+             genes=genes_df['gene_id'].to_numpy(dtype=np.int64),
+             symbols=genes_df['symbol'].to_numpy(dtype=str),
+            )
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Prepare databases for GSEApy.")
+    parser.add_argument("--input", required=True, help="Path to the input database file (GMT or JSON).")
+    parser.add_argument("--output", required=True, help="Path to the output GMT file.")
+    parser.add_argument("--normalized_output", default=None, help="Path to the output GMT file with normalized symbols; default: normalized/ next to the output.")
+    parser.add_argument("--index", default=None, help="Path to the output sparse term index (NPZ); default: output with .npz extension.")
+    parser.add_argument("--database", required=True, help="Name of the database.")
+    parser.add_argument("--normalization_table", default=None, help="Optional gene normalization table (alias,symbol,gene_id).")
+    args = parser.parse_args()
+
+    normalized_path = args.normalized_output if args.normalized_output is not None else os.path.join(os.path.dirname(args.output), "normalized", os.path.basename(args.output))
+    index_path = args.index if args.index is not None else os.path.splitext(args.output)[0] + ".npz"
+    prepare_database(args.input, args.output, normalized_path, index_path, args.normalization_table)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "snakemake" in globals():
+        prepare_database(snakemake.input["database"],
+                         snakemake.output["db_file"],
+                         snakemake.output["db_normalized"],
+                         snakemake.output["db_index"],
+                         snakemake.input.get("normalization_table", None) or None,
+                        )
+    else:
+        main()
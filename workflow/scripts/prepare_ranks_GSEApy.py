@@ -0,0 +1,73 @@
+#!/bin/env python
+import os
+import argparse
+from lazy_imports import lazy_import
+from gene_normalization import GeneNormalizer
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# load a gene-score file (genes in the first column, scores in the second column)
+def load_ranks(rnk_path):
+    ranks = pd.read_csv(rnk_path, index_col=0)
+    return ranks.index.to_numpy(dtype=str), ranks.iloc[:, 0].to_numpy(dtype=np.float64), str(ranks.columns[0])
+
+# normalize, deduplicate and sort a ranked gene list once, so that every prerank job (one per database) can use it directly
+def prepare_ranks(rnk_path, results_path, normalization_table=None):
+    genes, scores, score_name = load_ranks(rnk_path)
+
+    # normalize genes the same way as the prepared databases (upper case and optionally official symbols)
+    symbols, ids = GeneNormalizer(normalization_table).normalize(genes)
+
+    # remove duplicates: only retain largest absolute value (stable, i.e., first occurrence on ties)
+    order = np.argsort(-np.abs(scores), kind='stable')
+    _, first = np.unique(ids[order], return_index=True)
+    keep = order[np.sort(first)]
+    symbols, ids, scores = symbols[keep], ids[keep], scores[keep]
+
+    # replace +inf with max value and -inf with min value
+    finite = scores[np.isfinite(scores)]
+    if len(finite) > 0:
+        scores[scores == np.inf] = finite.max()
+        scores[scores == -np.inf] = finite.min()
+
+    # save as ranked vector (descending score)
+    order = np.argsort(-scores, kind='stable')
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    np.savez(results_path,
+             genes=symbols[order].astype(str),
+             gene_ids=ids[order].astype(np.int64),
+             scores=scores[order].astype(np.float32),
+             score_name=np.array(score_name),
+            )
+
+# load a prepared ranked vector (written by prepare_ranks_GSEApy.py) as single column data frame indexed by gene
+def load_prepared_ranks(path):
+    return get_rank_frame(load_prepared_arrays(path))
+
+# arrays of a prepared ranked vector (genes, gene_ids, scores and score_name)
+def load_prepared_arrays(path):
+    with np.load(path, allow_pickle=False) as ranks:
+        return {key: ranks[key] for key in ranks.files}
+
+def get_rank_frame(ranks):
+    return pd.DataFrame({str(ranks['score_name']): ranks['scores']}, index=pd.Index(ranks['genes'], dtype=object))
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Prepare ranked gene lists for preranked GSEApy.")
+    parser.add_argument("--input", required=True, help="Path to the input gene-score file (CSV).")
+    parser.add_argument("--output", required=True, help="Path to the output ranked vector (NPZ).")
+    parser.add_argument("--normalization_table", default=None, help="Optional gene normalization table (alias,symbol,gene_id).")
+    args = parser.parse_args()
+
+    prepare_ranks(args.input, args.output, args.normalization_table)
+
+if __name__ == "__main__":
+    if "snakemake" in globals():
+        prepare_ranks(snakemake.input["ranks"],
+                      snakemake.output["ranks"],
+                      snakemake.input.get("normalization_table", None) or None,
+                     )
+    else:
+        main()
@@ -0,0 +1,170 @@
+#!/bin/env python
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+# canonical chromosomes (UCSC names) per genome
+AUTOSOMES = {"hg19": 22, "hg38": 22, "mm9": 19, "mm10": 19}
+
+# number of (genome-wide) score quantile bins for stratified subsampling
+SCORE_BINS = 5
+
+def get_canonical_chromosomes(genome):
+    if genome not in AUTOSOMES:
+        raise ValueError("Unsupported genome version: {}".format(genome))
+    return ["chr{}".format(i) for i in range(1, AUTOSOMES[genome] + 1)] + ["chrX", "chrY", "chrM"]
+
+# UCSC style chromosome names, e.g., 1 -> chr1, MT/chrMT -> chrM, CHRX -> chrX
+def normalize_chromosomes(chroms):
+    names = pd.Series(chroms, dtype=str).str.strip()
+    names = names.str.replace(r'^chr', '', case=False, regex=True)
+    names = names.where(~names.str.upper().isin(["M", "MT"]), "M")
+    names = names.where(~names.str.upper().isin(["X", "Y"]), names.str.upper())
+    return ("chr" + names).to_numpy(dtype=object)
+
+# number of header lines (comments, track and browser lines) at the beginning of a BED file and number of columns of the first region
+def inspect_bed(bed_path):
+    n = 0
+    with open(bed_path) as f:
+        for line in f:
+            if not (line.startswith('#') or line.startswith('track') or line.startswith('browser') or line.strip() == ""):
+                return n, len(line.rstrip('\n').split('\t'))
+            n += 1
+    return n, 0
+
+# parse a BED file in chunks (chromosome, start, end and score if present), skipping header, track and browser lines and invalid regions
+def read_bed(bed_path, chunksize=1000000):
+    chunks, n_invalid = [], 0
+    n_header, n_columns = inspect_bed(bed_path)
+    if n_columns < 3:
+        return pd.DataFrame({'chrom': [], 'start': [], 'end': [], 'score': []}), n_invalid
+    for chunk in pd.read_csv(bed_path, sep='\t', header=None, usecols=[0, 1, 2, 4] if n_columns >= 5 else [0, 1, 2], dtype=str, comment='#',
+                             skiprows=n_header, chunksize=chunksize):
+        starts = pd.to_numeric(chunk[1], errors='coerce')
+        ends = pd.to_numeric(chunk[2], errors='coerce')
+        valid = starts.notna() & ends.notna() & (starts >= 0) & (ends > starts)
+        n_invalid += int((~valid).sum())
+        chunks.append(pd.DataFrame({'chrom': normalize_chromosomes(chunk.loc[valid, 0]),
+                                    'start': starts[valid].to_numpy(dtype=np.int64),
+                                    'end': ends[valid].to_numpy(dtype=np.int64),
+                                    'score': pd.to_numeric(chunk.loc[valid, 4], errors='coerce').to_numpy(dtype=float) if 4 in chunk.columns else np.nan,
+                                   }))
+    regions = pd.concat(chunks, ignore_index=True) if len(chunks) > 0 else pd.DataFrame({'chrom': [], 'start': [], 'end': [], 'score': []})
+    return regions, n_invalid
+
+# merge overlapping and book-ended intervals of one (sorted) chromosome, keeping the maximal score
+def merge_intervals(starts, ends, scores):
+    if len(starts) == 0:
+        return starts, ends, scores
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] > np.maximum.accumulate(ends)[:-1]
+    first = np.flatnonzero(new)
+    return starts[first], np.maximum.reduceat(ends, first), np.fmax.reduceat(scores, first)
+
+# reproducible stratified subsample of max_regions regions: strata are chromosomes and, if the regions have scores, score quantile bins;
+# each stratum contributes proportionally to its size (largest remainder method), regions within a stratum are drawn uniformly
+def get_stratified_subsample(chroms, scores, max_regions, seed=42):
+    n = len(chroms)
+    if max_regions <= 0 or n <= max_regions:
+        return np.arange(n)
+
+    strata = pd.Series(chroms).astype(str)
+    if np.isfinite(scores).any():
+        ranks = pd.Series(scores).rank(method='first', na_option='bottom').to_numpy()
+        strata = strata + "_" + pd.Series(np.ceil(ranks / n * SCORE_BINS).astype(int)).astype(str)
+    codes, names = pd.factorize(strata, sort=True)
+    sizes = np.bincount(codes)
+
+    quotas = sizes * max_regions / n
+    allocation = np.floor(quotas).astype(int)
+    remainder = max_regions - allocation.sum()
+    allocation[np.argsort(-(quotas - allocation), kind='stable')[:remainder]] += 1
+
+    rng = np.random.default_rng(seed)
+    members = np.argsort(codes, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    selected = [rng.choice(members[offsets[i]:offsets[i+1]], size=allocation[i], replace=False) for i in range(len(names)) if allocation[i] > 0]
+    return np.sort(np.concatenate(selected))
+
+# normalize, filter, sort, (optionally) merge and subsample a region set once for all region-based tools
+def prepare_regions(bed_path, results_path, genome, merge=False, max_regions=0, seed=42, summary_path=None):
+    regions, n_invalid = read_bed(bed_path)
+    n_regions = regions.shape[0]
+
+    # drop non-canonical contigs (e.g., unplaced scaffolds, alternative haplotypes)
+    chromosomes = get_canonical_chromosomes(genome)
+    canonical = regions['chrom'].isin(chromosomes)
+    n_dropped = int((~canonical).sum())
+    regions = regions.loc[canonical, :]
+
+    # sort (chromosome order of the genome, start, end) and merge per chromosome
+    intervals = {}
+    for chrom, chrom_regions in regions.groupby('chrom', sort=False):
+        starts = chrom_regions['start'].to_numpy()
+        ends = chrom_regions['end'].to_numpy()
+        scores = chrom_regions['score'].to_numpy(dtype=float)
+        order = np.lexsort((ends, starts))
+        starts, ends, scores = starts[order], ends[order], scores[order]
+        if merge:
+            starts, ends, scores = merge_intervals(starts, ends, scores)
+        intervals[chrom] = (starts, ends, scores)
+    chroms = [chrom for chrom in chromosomes if chrom in intervals]
+
+    prepared = pd.DataFrame({'chrom': np.repeat(chroms, [len(intervals[chrom][0]) for chrom in chroms]),
+                             'start': np.concatenate([intervals[chrom][0] for chrom in chroms] + [np.zeros(0, dtype=np.int64)]),
+                             'end': np.concatenate([intervals[chrom][1] for chrom in chroms] + [np.zeros(0, dtype=np.int64)]),
+                             'score': np.concatenate([intervals[chrom][2] for chrom in chroms] + [np.zeros(0)]),
+                            })
+    n_prepared = prepared.shape[0]
+
+    # optional stratified subsample of huge region sets (sorted order is kept)
+    prepared = prepared.iloc[get_stratified_subsample(prepared['chrom'].to_numpy(), prepared['score'].to_numpy(), max_regions, seed), :]
+
+    summary = {"input": os.path.abspath(bed_path), "genome": genome, "regions": n_regions + n_invalid, "invalid": n_invalid,
+               "non_canonical": n_dropped, "merged": bool(merge), "prepared": n_prepared,
+               "max_regions": int(max_regions), "seed": int(seed), "used": prepared.shape[0],
+               "subsampled": bool(prepared.shape[0] < n_prepared), "stratified_by_score": bool(np.isfinite(prepared['score']).any()),
+               "regions_file": os.path.abspath(results_path),
+              }
+    print(json.dumps(summary))
+    if prepared.shape[0] == 0:
+        raise ValueError("No valid regions on canonical {} chromosomes in {}.".format(genome, bed_path))
+
+    # normalized BED (chromosome, start, end) for the region tools
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    prepared.loc[:, ['chrom', 'start', 'end']].to_csv(results_path, sep='\t', header=False, index=False)
+
+    # record of the preprocessing (and the subsample used) to be kept with the results
+    if summary_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=4)
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Prepare region sets: normalize chromosome names, drop non-canonical contigs, sort and optionally merge.")
+    parser.add_argument("--input", required=True, help="Path to the input region set (BED).")
+    parser.add_argument("--output", required=True, help="Path to the output normalized region set (BED).")
+    parser.add_argument("--genome", required=True, help="Genome (hg19, hg38, mm9 or mm10).")
+    parser.add_argument("--merge", action='store_true', help="Merge overlapping and book-ended regions.")
+    parser.add_argument("--max_regions", type=int, default=0, help="Stratified subsample of at most this many regions (0 = all regions).")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the subsample.")
+    parser.add_argument("--summary", default=None, help="Path to the preprocessing summary (JSON).")
+    args = parser.parse_args()
+
+    prepare_regions(args.input, args.output, args.genome, args.merge, args.max_regions, args.seed, args.summary)
+
+if __name__ == "__main__":
+    if "snakemake" in globals():
+        prepare_regions(snakemake.input["regions"],
+                        snakemake.output["regions"],
+                        snakemake.params["genome"],
+                        bool(int(snakemake.params["merge"])),
+                        int(snakemake.params["max_regions"]),
+                        int(snakemake.params["seed"]),
+                        snakemake.output["summary"],
+                       )
+    else:
+        main()
@@ -0,0 +1,220 @@
+#!/bin/env python
+
+# preranked GSEA with a cache of null distributions (config: prerank_null_cache)
+# same statistics as GSEApy's prerank (weighted Kolmogorov-Smirnov running sum with weight 1, gene set permutation, NES, nominal p-value,
+# FDR and FWER, terms sharing a null count as independent draws of it), but the null distribution of the enrichment score (ES) only depends on the ranked scores and the gene set size:
+# it is computed once per (ranked vector, size bucket, permutations, seed) and cached on disk, so that gene sets of equal size share
+# their null within and across databases (and runs), i.e., the cost scales with the number of distinct gene set sizes instead of terms.
+
+import os
+import hashlib
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# ES weight of the ranked scores (GSEApy default)
+WEIGHT = 1
+
+# permutations and seed of the workflow's preranked GSEA (as GSEApy's prerank is run)
+PERMUTATIONS = 1000
+SEED = 42
+
+# number of random gene sets per batch is limited to this many sampled values
+BATCH_SIZE = 5000000
+
+# representative size of a gene set size: exact (resolution 0) or the center of its geometric bucket of relative width resolution
+def get_size_bucket(size, resolution=0):
+    if resolution <= 0 or size <= 1:
+        return int(size)
+    step = np.log1p(resolution)
+    return max(int(round(np.exp(round(np.log(size) / step) * step))), 1)
+
+# ES of many gene sets of equal size at once: positions (sets x size) are the sorted ranks of their genes (0 = largest score),
+# weights the absolute (weighted) scores of the ranked vector; returns ES and the index of the hit at which it is attained
+def get_enrichment_scores(positions, weights):
+    n_genes = len(weights)
+    size = positions.shape[1]
+    hit_weights = weights[positions]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hits = np.cumsum(hit_weights, axis=1) / hit_weights.sum(axis=1, keepdims=True)
+    hits = np.nan_to_num(hits)
+    misses = (positions - np.arange(size)) / max(n_genes - size, 1)
+
+    # running sum after each hit (maximum) and right before each hit (minimum), it starts and ends at 0
+    after = hits - misses
+    with np.errstate(divide='ignore', invalid='ignore'):
+        before = after - np.nan_to_num(hit_weights / hit_weights.sum(axis=1, keepdims=True))
+    peak_max, peak_min = after.argmax(axis=1), before.argmin(axis=1)
+    rows = np.arange(positions.shape[0])
+    es_max, es_min = np.maximum(after[rows, peak_max], 0), np.minimum(before[rows, peak_min], 0)
+    positive = es_max > -es_min
+    return np.where(positive, es_max, es_min), np.where(positive, peak_max, peak_min)
+
+# null ES of random gene sets of one size (reproducible per seed and size, independent of the other sizes)
+def get_null_scores(weights, size, n_perm, seed):
+    rng = np.random.default_rng([seed, size])
+    n_genes = len(weights)
+    batch = max(BATCH_SIZE // max(n_genes, 1), 1)
+    null = []
+    for start in range(0, n_perm, batch):
+        n = min(batch, n_perm - start)
+        positions = np.sort(rng.random((n, n_genes)).argpartition(size - 1, axis=1)[:, :size], axis=1)
+        null.append(get_enrichment_scores(positions, weights)[0])
+    return np.concatenate(null)
+
+# disk cache of null ES distributions of one ranked vector, keyed by the hash of its scores, permutations and seed (one file per size bucket)
+class NullCache:
+    def __init__(self, directory, scores, n_perm, seed, resolution=0):
+        self.weights = np.abs(scores.astype(np.float64)) ** WEIGHT
+        self.n_perm = n_perm
+        self.seed = seed
+        self.resolution = resolution
+        self.hits = 0
+        self.misses = 0
+        scores_hash = hashlib.sha1(np.ascontiguousarray(scores, dtype=np.float32).tobytes()).hexdigest()[:20]
+        self.directory = os.path.join(directory, "{}_w{}_p{}_s{}".format(scores_hash, WEIGHT, n_perm, seed))
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, size):
+        bucket = get_size_bucket(size, self.resolution)
+        path = os.path.join(self.directory, "size_{}.npy".format(bucket))
+        if os.path.exists(path):
+            self.hits += 1
+            return np.load(path)
+        self.misses += 1
+        null = get_null_scores(self.weights, min(bucket, len(self.weights)), self.n_perm, self.seed)
+        # atomic write, concurrent jobs (e.g., other databases of the same ranked vector) may compute the same size
+        tmp_path = "{}.{}.tmp.npy".format(path[:-len(".npy")], os.getpid())
+        np.save(tmp_path, null)
+        os.replace(tmp_path, path)
+        return null
+
+# normalized ES: positive/negative ES are divided by the mean of the positive/negative null ES (of the same size)
+def normalize(scores, null):
+    pos_mean = null[null >= 0].mean() if (null >= 0).any() else np.nan
+    neg_mean = np.abs(null[null < 0].mean()) if (null < 0).any() else np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(scores >= 0, scores / pos_mean, scores / neg_mean)
+
+# weighted number of values >= threshold (upper=True) or <= threshold of sorted values with cumulative weights
+def weighted_tail(values, cumulative_weights, thresholds, upper=True):
+    total = cumulative_weights[-1] if len(cumulative_weights) > 0 else 0
+    cumulative_weights = np.concatenate([[0], cumulative_weights])
+    if upper:
+        return total - cumulative_weights[np.searchsorted(values, thresholds, side='left')]
+    return cumulative_weights[np.searchsorted(values, thresholds, side='right')]
+
+# preranked GSEA of all terms of a prepared database index (see load_database_index) on a prepared ranked vector (see prepare_ranks_GSEApy.py)
+# using the null cache of the ranked vector; result columns are the ones of GSEApy's prerank (res2d)
+def prerank(ranks, index, cache, min_size=1, max_size=100000):
+    gene_ids, symbols = ranks['gene_ids'], ranks['genes']
+    n_genes = len(gene_ids)
+    resolution = cache.resolution
+
+    # ranks of the genes of each term (CSR), restricted to the ranked genes and sorted
+    order = np.argsort(gene_ids, kind='stable')
+    found = np.searchsorted(gene_ids[order], index['gene_ids'])
+    found[found == n_genes] = 0
+    matched = gene_ids[order][found] == index['gene_ids'] if n_genes > 0 else np.zeros(len(index['gene_ids']), dtype=bool)
+    term_of_entry = np.repeat(np.arange(len(index['terms'])), np.diff(index['indptr']))[matched]
+    positions = order[found[matched]]
+    entries = np.lexsort((positions, term_of_entry))
+    term_of_entry, positions = term_of_entry[entries], positions[entries]
+    sizes = np.bincount(term_of_entry, minlength=len(index['terms']))
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+
+    tested = np.flatnonzero((sizes >= min_size) & (sizes <= max_size) & (sizes < n_genes))
+    if len(tested) == 0:
+        return pd.DataFrame()
+
+    # observed ES of all terms of equal size at once and the (cached) null of their size bucket
+    es, peaks = np.zeros(len(tested)), np.zeros(len(tested), dtype=np.int64)
+    buckets = np.array([get_size_bucket(size, resolution) for size in sizes[tested]])
+    nulls = {}
+    weights = cache.weights
+    for size in np.unique(sizes[tested]):
+        rows = np.flatnonzero(sizes[tested] == size)
+        term_positions = positions[offsets[tested[rows]][:, None] + np.arange(size)]
+        es[rows], peaks[rows] = get_enrichment_scores(term_positions, weights)
+        bucket = get_size_bucket(size, resolution)
+        if bucket not in nulls:
+            nulls[bucket] = cache.get(size)
+
+    # nominal p-values and NES per term, null NES per size bucket
+    nes, pvalues = np.zeros(len(tested)), np.zeros(len(tested))
+    null_nes = {}
+    for bucket, null in nulls.items():
+        rows = np.flatnonzero(buckets == bucket)
+        null_sorted = np.sort(null)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pvalues[rows] = np.where(es[rows] >= 0,
+                                     (len(null) - np.searchsorted(null_sorted, es[rows], side='left')) / (null >= 0).sum(),
+                                     np.searchsorted(null_sorted, es[rows], side='right') / (null < 0).sum())
+        nes[rows] = normalize(es[rows], null)
+        null_nes[bucket] = normalize(null, null)
+
+    # FDR: null NES of all tested terms pooled (terms of the same size bucket share their null, i.e., weighted by their number of terms)
+    bucket_list = list(null_nes)
+    n_terms = np.array([(buckets == bucket).sum() for bucket in bucket_list])
+    pooled = np.concatenate([null_nes[bucket] for bucket in bucket_list])
+    pooled_weights = np.repeat(n_terms, [len(null_nes[bucket]) for bucket in bucket_list]).astype(np.float64)
+    valid = ~np.isnan(pooled)
+    pooled, pooled_weights = pooled[valid], pooled_weights[valid]
+    pooled_order = np.argsort(pooled, kind='stable')
+    pooled, cumulative = pooled[pooled_order], np.cumsum(pooled_weights[pooled_order])
+    observed = np.sort(nes[~np.isnan(nes)])
+    observed_weights = np.cumsum(np.ones(len(observed)))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fdr_pos = ((weighted_tail(pooled, cumulative, nes) / weighted_tail(pooled, cumulative, 0.0))
+                   / (weighted_tail(observed, observed_weights, nes) / weighted_tail(observed, observed_weights, 0.0)))
+        # negative NES: values < 0 (<= the largest negative value)
+        fdr_neg = ((weighted_tail(pooled, cumulative, nes, upper=False) / weighted_tail(pooled, cumulative, np.nextafter(0.0, -1.0), upper=False))
+                   / (weighted_tail(observed, observed_weights, nes, upper=False) / weighted_tail(observed, observed_weights, np.nextafter(0.0, -1.0), upper=False)))
+    fdr = np.minimum(np.where(nes >= 0, fdr_pos, fdr_neg), 1)
+
+    # FWER: probability that the most extreme null NES of all tested terms is at least as extreme as the NES; the terms of a size bucket
+    # share one cached null, i.e., their null NES are treated as independent draws of it: 1 - prod_b P(null NES_b < NES)^(terms of b)
+    # (negative NES: > NES), instead of counting a shared null once per permutation
+    log_none = np.zeros(len(nes))
+    for bucket, n_bucket in zip(bucket_list, n_terms):
+        null_sorted = np.sort(null_nes[bucket][~np.isnan(null_nes[bucket])])
+        if len(null_sorted) == 0:
+            continue
+        below = np.where(nes >= 0, np.searchsorted(null_sorted, nes, side='left'), len(null_sorted) - np.searchsorted(null_sorted, nes, side='right'))
+        with np.errstate(divide='ignore'):
+            log_none += n_bucket * np.log(below / len(null_sorted))
+    fwer = np.where(np.isnan(nes), np.nan, np.maximum(-np.expm1(log_none), 0))
+
+    # leading edge: hits up to the peak (positive ES) or from the peak on (negative ES)
+    tags, gene_fractions, lead_genes = [], [], []
+    for i, term in enumerate(tested):
+        term_positions = positions[offsets[term]:offsets[term + 1]]
+        lead = term_positions[:peaks[i] + 1] if es[i] >= 0 else term_positions[peaks[i]:]
+        rank = term_positions[peaks[i]] + 1 if es[i] >= 0 else n_genes - term_positions[peaks[i]]
+        tags.append("{}/{}".format(len(lead), len(term_positions)))
+        gene_fractions.append("{:.2%}".format(rank / n_genes))
+        lead_genes.append(";".join(symbols[lead]))
+
+    res = pd.DataFrame({
+        'Name': 'prerank',
+        'Term': index['terms'][tested],
+        'ES': es,
+        'NES': nes,
+        'NOM p-val': pvalues,
+        'FDR q-val': fdr,
+        'FWER p-val': fwer,
+        'Tag %': tags,
+        'Gene %': gene_fractions,
+        'Lead_genes': lead_genes,
+    })
+    res = res.iloc[np.lexsort((-np.abs(res['NES'].to_numpy()), res['FDR q-val'].to_numpy()))].reset_index(drop=True)
+    return res
+
+# result table of one database as saved by the workflow: annotated gene set and language agnostic (i.e., R compatible) column names
+def format_result(res, db):
+    res = res.copy()
+    res['Gene_set'] = db
+    res.columns = [col.replace(" %", "").replace(" ", "_").replace("-", "_") for col in res.columns]
+    return res
@@ -0,0 +1,157 @@
+#!/bin/env python
+
+# region-weighted over-representation analysis of region sets (config: ora_weighted)
+# instead of counting each GREAT-mapped gene once, every region-gene association counts, i.e., genes are weighted by their number of
+# associated query (and background) regions from region_gene_associations.csv. The hypergeometric test is performed on association units:
+# population = background associations, successes = background associations of the term's genes, draws = query associations.
+# all databases are tested at once using their prepared sparse term indexes (same result columns as ORA_GSEApy)
+
+# load libraries (heavy libraries are imported on first use, i.e., not at all without associated genes)
+import os
+import sys
+from instrumentation import Profiler
+from lazy_imports import lazy_import
+from significance import adjust_pvalues
+from hypergeometric import get_kernel
+from gene_normalization import GeneNormalizer, load_database_index
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+sparse = lazy_import("scipy.sparse")
+
+# number of associated regions per gene (annotated genes of each region are separated by |)
+def get_region_hits(associations_path):
+    if not os.path.exists(associations_path) or os.path.getsize(associations_path) == 0:
+        return pd.Series(dtype=np.int64)
+    associations = pd.read_csv(associations_path, usecols=lambda column: column == 'annotated_genes', dtype=str)
+    if 'annotated_genes' not in associations.columns:
+        return pd.Series(dtype=np.int64)
+    genes = associations['annotated_genes'].dropna().str.split(r'[|,;]').explode().str.strip()
+    return genes[genes != ""].value_counts()
+
+# region hits per normalized gene ID (aliases of the same gene are summed) and the symbol of each gene ID
+def normalize_hits(hits, normalizer):
+    symbols, ids = normalizer.normalize(hits.index.to_numpy())
+    weights = pd.Series(hits.to_numpy(dtype=np.int64), index=ids).groupby(level=0).sum()
+    return weights, pd.Series(symbols, index=ids)
+
+# weighted ORA of one region set against all databases at once (prepared database indexes), writing one result per database;
+# used by the Snakemake rule and by the workers of task_queue.py (with a shared normalizer and cached database indexes)
+def ora_weighted(associations_path, background_associations_path, database_paths, dbs, result_paths, profiler, normalization_table_path=None,
+                 normalizer=None, load_index=load_database_index):
+    for result_path in result_paths:
+        os.makedirs(os.path.dirname(result_path), exist_ok=True)
+
+    # move on if no regions are associated with genes (before loading any library)
+    if not os.path.exists(associations_path) or os.path.getsize(associations_path) == 0:
+        for result_path in result_paths:
+            open(result_path, mode='a').close()
+        return
+
+    # region hits per gene of the query and background region sets
+    with profiler.span("association load"):
+        normalizer = normalizer if normalizer is not None else GeneNormalizer(normalization_table_path)
+        query_weights, query_symbols = normalize_hits(get_region_hits(associations_path), normalizer)
+        background_weights, background_symbols = normalize_hits(get_region_hits(background_associations_path), normalizer)
+
+    # move on if no genes are associated with the query regions
+    if len(query_weights)==0:
+        for result_path in result_paths:
+            open(result_path, mode='a').close()
+        return
+
+    # load the prepared sparse term indexes of all databases into one term index tagged by their source database
+    with profiler.span("index load", n_databases=len(dbs)):
+        indexes = [load_index(database_path) for database_path in database_paths]
+        terms = np.concatenate([index['terms'] for index in indexes])
+        term_db = np.repeat(dbs, [len(index['terms']) for index in indexes])
+        offsets = np.cumsum([0] + [len(index['gene_ids']) for index in indexes])
+        indptr = np.concatenate([[0]] + [index['indptr'][1:] + offset for index, offset in zip(indexes, offsets)])
+
+    # gene index (all gene IDs) with their symbols and sparse term x gene incidence matrix
+    with profiler.span("index"):
+        symbol_map = pd.concat([pd.Series(index['symbols'], index=index['genes']) for index in indexes] + [query_symbols, background_symbols])
+        symbol_map = symbol_map[~symbol_map.index.duplicated()]
+        gene_ids = np.unique(symbol_map.index.to_numpy())
+        genes = symbol_map.reindex(gene_ids).to_numpy()
+        indices = np.concatenate([np.searchsorted(gene_ids, index['gene_ids']) for index in indexes])
+        incidence = sparse.csr_matrix((np.ones(len(indices), dtype=np.int64), indices, indptr), shape=(len(terms), len(gene_ids)))
+
+    # weights (associated regions) per gene: the universe are the genes associated with background regions (query genes are restricted to it);
+    # without background associations (e.g., background region set exceeds 500,000 regions) all database genes count once as heuristic,
+    # and so do the query genes (unweighted test, the units of the table have to agree)
+    with profiler.span("test", n_genes=len(query_weights), n_terms=len(terms)):
+        query_w = np.zeros(len(gene_ids), dtype=np.int64)
+        query_w[np.searchsorted(gene_ids, query_weights.index.to_numpy())] = query_weights.to_numpy()
+        background_w = np.zeros(len(gene_ids), dtype=np.int64)
+        if len(background_weights) > 0:
+            background_w[np.searchsorted(gene_ids, background_weights.index.to_numpy())] = background_weights.to_numpy()
+            query_w[background_w == 0] = 0
+        else:
+            print("No background region-gene associations, falling back to the unweighted test (genes count once) with all database genes as background.", file=sys.stderr)
+            background_w[np.unique(indices)] = 1
+            query_w = (query_w > 0).astype(np.int64)
+        # query regions are part of the background regions, guard against inconsistent inputs
+        background_w = np.maximum(background_w, query_w)
+        query_mask = (query_w > 0).astype(np.int64)
+        universe_mask = (background_w > 0).astype(np.int64)
+
+        # weighted overlap (X), term weight (K), query weight (n) and population (N) in association units, and gene counts of the overlap (x) and term (m)
+        X = incidence @ query_w
+        K = incidence @ background_w
+        n = int(query_w.sum())
+        N = int(background_w.sum())
+        x = incidence @ query_mask
+        m = incidence @ universe_mask
+
+        # hypergeometric p-values and odds ratios (in association units, Haldane-Anscombe correction as enrich()) of all terms at once
+        kernel = get_kernel(N)
+        pvalues = kernel.sf(X, K, n)
+        odds_ratio = kernel.odds_ratio(X, K, n)
+        with np.errstate(divide='ignore'):
+            combined_score = -np.log(pvalues) * odds_ratio
+
+    # write one result per database, with multiple-testing correction per database (only terms with at least one hit are tested)
+    with profiler.span("write"):
+        query_hits = incidence.multiply(query_mask).tocsr()
+        query_hits.eliminate_zeros()
+        for db, result_path in zip(dbs, result_paths):
+            tested = np.flatnonzero((term_db == db) & (X > 0))
+            if len(tested)==0:
+                open(result_path, mode='a').close()
+                continue
+
+            res = pd.DataFrame({
+                'Gene_set': db,
+                'Term': [terms[i] for i in tested],
+                'Overlap': ["{}/{}".format(x[i], m[i]) for i in tested],
+                'Region_Overlap': ["{}/{}".format(X[i], K[i]) for i in tested],
+                'P_value': pvalues[tested],
+                'Adjusted_P_value': adjust_pvalues(pvalues[tested], 'BH'),
+                'Odds_Ratio': odds_ratio[tested],
+                'Combined_Score': combined_score[tested],
+                'Genes': [";".join(genes[j] for j in query_hits.indices[query_hits.indptr[i]:query_hits.indptr[i+1]]) for i in tested],
+            }).sort_values('Adjusted_P_value', kind='stable').reset_index(drop=True)
+
+            # separate export
+            res.to_csv(result_path)
+
+if "snakemake" in globals():
+    # configs
+
+    # input
+    associations_path = snakemake.input['associations']
+    background_associations_path = snakemake.input['background_associations']
+    database_paths = list(snakemake.input['databases'])
+    normalization_table_path = snakemake.input.get('normalization_table', None) or None
+
+    # output
+    result_paths = list(snakemake.output['result_files'])
+
+    # parameters
+    dbs = snakemake.params["databases"]
+
+    # opt-in profiling spans
+    profiler = Profiler("ORA_GSEApy", snakemake.wildcards["gene_set"], "weighted")
+
+    ora_weighted(associations_path, background_associations_path, database_paths, dbs, result_paths, profiler, normalization_table_path)
@@ -0,0 +1,216 @@
+#!/bin/env python
+import os
+import sys
+import sqlite3
+import argparse
+import yaml
+import pandas as pd
+from significance import MOTIF_TOOLS, get_settings, get_threshold, get_significance_mask, adjust_results, ProjectPvalues
+from term_dictionary import TermDictionary, normalize_terms
+
+# standardized columns of the result index, taken from the tool specific column names of the config
+INDEX_COLUMNS = ["term", "p_value", "adj_pvalue", "effect_size", "overlap"]
+
+SCHEMA = """
+CREATE TABLE results (
+    feature_set TEXT NOT NULL,
+    "group" TEXT,
+    tool TEXT NOT NULL,
+    db TEXT NOT NULL,
+    term TEXT,
+    term_id INTEGER,
+    p_value REAL,
+    adj_pvalue REAL,
+    effect_size REAL,
+    overlap TEXT,
+    significant INTEGER
+);
+CREATE TABLE terms (
+    term_id INTEGER PRIMARY KEY,
+    name TEXT
+);
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    feature_set TEXT,
+    tool TEXT,
+    db TEXT,
+    n_results INTEGER
+);
+"""
+
+INDEXES = """
+CREATE INDEX idx_results_term ON results (term);
+CREATE INDEX idx_results_term_id ON results (term_id, tool);
+CREATE INDEX idx_results_feature_set ON results (feature_set);
+CREATE INDEX idx_results_tool_db ON results (tool, db);
+CREATE INDEX idx_results_db ON results (db);
+CREATE INDEX idx_results_adj_pvalue ON results (adj_pvalue);
+"""
+
+# feature set, tool and database of a result file: {result_path}/{feature_set}/{tool}/{db}/{feature_set}_{db}.csv
+def parse_result_path(path):
+    db_dir = os.path.dirname(path)
+    tool_dir = os.path.dirname(db_dir)
+    return os.path.basename(os.path.dirname(tool_dir)), os.path.basename(tool_dir), os.path.basename(db_dir)
+
+# standardized results of one result file, with the adjusted p-values of the configured significance method and harmonized term IDs
+def load_result(path, feature_set, tool, db, config, groups, project_pvalues=None, term_dictionary=None):
+    res = pd.read_csv(path, index_col=0)
+    if project_pvalues is not None and tool not in MOTIF_TOOLS:
+        res['project_adjp'] = project_pvalues.get(path)
+    res = adjust_results(res, tool, config, project_col='project_adjp')
+    columns = config["column_names"][tool]
+    records = pd.DataFrame({column: res[columns[column]] if columns[column] in res.columns else None for column in INDEX_COLUMNS}, index=res.index)
+    for column in ["p_value", "adj_pvalue", "effect_size"]:
+        records[column] = pd.to_numeric(records[column], errors='coerce')
+
+    significant = get_significance_mask(records["adj_pvalue"], tool, get_threshold(config, tool))
+    if term_dictionary is not None:
+        records.insert(1, "term_id", term_dictionary.get_ids(normalize_terms(records["term"], tool)))
+    records.insert(0, "feature_set", feature_set)
+    records.insert(1, "group", groups.get(feature_set))
+    records.insert(2, "tool", tool)
+    records.insert(3, "db", db)
+    records["significant"] = significant.astype(int)
+    return records
+
+# (re)build the index from scratch into a temporary file that replaces the previous index at the end,
+# the harmonized term dictionary (term_id, name) is saved as table terms and, optionally, as CSV
+def build_index(result_paths, index_path, config, annotation_path, project_adjp_path=None, term_dictionary_path=None):
+    groups = pd.read_csv(annotation_path, index_col='name')['group'].to_dict()
+    method, scope = get_settings(config)
+    project_pvalues = ProjectPvalues(project_adjp_path) if method != "tool" and scope == "project" else None
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    term_dictionary = TermDictionary()
+    con = sqlite3.connect(tmp_path)
+    con.executescript(SCHEMA)
+    for path in result_paths:
+        feature_set, tool, db = parse_result_path(path)
+        n_results = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            records = load_result(path, feature_set, tool, db, config, groups, project_pvalues, term_dictionary)
+            records.to_sql("results", con, if_exists="append", index=False)
+            n_results = records.shape[0]
+        con.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?)", (os.path.abspath(path), feature_set, tool, db, n_results))
+    term_dictionary.to_frame().to_sql("terms", con, if_exists="append", index=False)
+    con.executescript(INDEXES)
+    con.commit()
+    con.execute("ANALYZE")
+    con.close()
+    os.replace(tmp_path, index_path)
+    if term_dictionary_path is not None:
+        term_dictionary.save(term_dictionary_path)
+
+# query the index with the given filters (all optional), most significant results first
+def query_index(index_path, term=None, feature_set=None, group=None, tool=None, db=None, significant=False, max_adjp=None, limit=100):
+    conditions, values = [], []
+    if term is not None:
+        conditions.append("term LIKE ?" if "%" in term else "term = ?")
+        values.append(term)
+    for column, value in [("feature_set", feature_set), ('"group"', group), ("tool", tool), ("db", db)]:
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            values.append(value)
+    if significant:
+        conditions.append("significant = 1")
+    if max_adjp is not None:
+        conditions.append("adj_pvalue <= ?")
+        values.append(max_adjp)
+
+    sql = "SELECT * FROM results"
+    if len(conditions) > 0:
+        sql += " WHERE " + " AND ".join(conditions)
+    # motif tools report NES (greater is more significant) as adjusted p-value
+    sql += " ORDER BY significant DESC, CASE WHEN tool IN ({}) THEN -adj_pvalue ELSE adj_pvalue END ASC".format(", ".join(f"'{tool}'" for tool in MOTIF_TOOLS))
+    if limit is not None and limit > 0:
+        sql += f" LIMIT {int(limit)}"
+
+    with sqlite3.connect(f"file:{index_path}?mode=ro", uri=True) as con:
+        return pd.read_sql_query(sql, con, params=values)
+
+# joint summary of all tools per harmonized term (joined on term IDs): number of (significant) feature sets per term and tool
+def joint_summary(index_path, feature_set=None, group=None, db=None, significant=True):
+    conditions, values = [], []
+    for column, value in [("feature_set", feature_set), ('"group"', group), ("db", db)]:
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            values.append(value)
+    if significant:
+        conditions.append("significant = 1")
+    sql = "SELECT term_id, tool, COUNT(DISTINCT feature_set) AS n FROM results"
+    if len(conditions) > 0:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " GROUP BY term_id, tool"
+
+    with sqlite3.connect(f"file:{index_path}?mode=ro", uri=True) as con:
+        counts = pd.read_sql_query(sql, con, params=values)
+        terms = pd.read_sql_query("SELECT term_id, name FROM terms", con, index_col="term_id")["name"]
+    summary = counts.pivot(index="term_id", columns="tool", values="n").fillna(0).astype(int)
+    summary.columns.name = None
+    summary.insert(0, "n_tools", (summary > 0).sum(axis=1))
+    summary.insert(0, "name", terms.reindex(summary.index).to_numpy())
+    return summary.sort_values(["n_tools", "name"], ascending=[False, True]).reset_index()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the project-wide result index (SQLite).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build the index from per feature set result files.")
+    build_parser.add_argument("--results", nargs='+', required=True, help="Result files ({result_path}/{feature_set}/{tool}/{db}/{feature_set}_{db}.csv).")
+    build_parser.add_argument("--index", required=True, help="Path of the index (SQLite).")
+    build_parser.add_argument("--config", required=True, help="Path to the config file.")
+    build_parser.add_argument("--project_adjp", default=None, help="Path to the project-wide adjusted p-values (NPZ, significance scope: project).")
+    build_parser.add_argument("--term_dictionary", default=None, help="Optional path to save the harmonized term dictionary (CSV).")
+
+    query_parser = subparsers.add_parser("query", help="Query the index, e.g., which feature sets are enriched for a term across all tools.")
+    query_parser.add_argument("--index", required=True, help="Path of the index (SQLite).")
+    query_parser.add_argument("--term", default=None, help="Term (exact, or SQL LIKE pattern if it contains %%).")
+    query_parser.add_argument("--feature_set", default=None, help="Feature set (i.e., query) name.")
+    query_parser.add_argument("--group", default=None, help="Group name.")
+    query_parser.add_argument("--tool", default=None, help="Tool name (e.g., ORA_GSEApy).")
+    query_parser.add_argument("--db", default=None, help="Database name.")
+    query_parser.add_argument("--significant", action='store_true', help="Only statistically significant results (per tool adjp_th).")
+    query_parser.add_argument("--max_adjp", type=float, default=None, help="Maximum adjusted p-value.")
+    query_parser.add_argument("--limit", type=int, default=100, help="Maximum number of results (0 for all).")
+    query_parser.add_argument("--sql", default=None, help="Custom SQL query on the tables results and files (other filters are ignored).")
+    query_parser.add_argument("--output", default=None, help="Save the results as CSV instead of printing them.")
+
+    joint_parser = subparsers.add_parser("joint", help="Joint summary of all tools per harmonized term: number of (significant) feature sets per tool.")
+    joint_parser.add_argument("--index", required=True, help="Path of the index (SQLite).")
+    joint_parser.add_argument("--feature_set", default=None, help="Feature set (i.e., query) name.")
+    joint_parser.add_argument("--group", default=None, help="Group name.")
+    joint_parser.add_argument("--db", default=None, help="Database name.")
+    joint_parser.add_argument("--all", action='store_true', help="Count all results instead of only statistically significant ones.")
+    joint_parser.add_argument("--output", default=None, help="Save the summary as CSV instead of printing it.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.config, 'r') as file:
+            config = yaml.safe_load(file)
+        build_index(args.results, args.index, config, config["annotation"], args.project_adjp, args.term_dictionary)
+        return
+
+    if not os.path.exists(args.index):
+        sys.exit(f"Result index {args.index} not found.")
+    if args.command == "joint":
+        res = joint_summary(args.index, args.feature_set, args.group, args.db, not args.all)
+    elif args.sql is not None:
+        with sqlite3.connect(f"file:{args.index}?mode=ro", uri=True) as con:
+            res = pd.read_sql_query(args.sql, con)
+    else:
+        res = query_index(args.index, args.term, args.feature_set, args.group, args.tool, args.db, args.significant, args.max_adjp, args.limit)
+
+    if args.output is not None:
+        res.to_csv(args.output, index=False)
+    else:
+        print(res.to_string(index=False))
+
+if __name__ == "__main__":
+    if "snakemake" in globals():
+        build_index(list(snakemake.input["results"]), snakemake.output["result_index"], snakemake.config, snakemake.config["annotation"],
+                    snakemake.input.get("project_adjp", None) or None, snakemake.output["term_dictionary"])
+    else:
+        main()
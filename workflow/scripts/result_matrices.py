@@ -0,0 +1,79 @@
+#!/bin/env python
+
+# sparse term x feature set matrices of the aggregated results (written by aggregate.py)
+# adjusted p-values, effect-sizes and overlaps share one CSR structure (indptr, indices), missing entries are not tested,
+# the row (term) and column (feature set) names are saved as line based index files
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+VALUES = ["adjp", "effect", "overlap"]
+
+# numeric overlap: counts are kept, fractions like "12/250" (e.g., ORA_GSEApy Overlap or preranked_GSEApy Tag) are reduced to the hits
+def get_overlap(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=float)
+    return pd.to_numeric(values.astype(str).str.split('/').str[0], errors='coerce').to_numpy(dtype=float)
+
+# term x feature set matrices of a long format result table (one row per term and feature set)
+def make_result_matrices(result_df, tool, config):
+    term_col = config["column_names"][tool]["term"]
+    columns = {"adjp": config["column_names"][tool]["adj_pvalue"],
+               "effect": config["column_names"][tool]["effect_size"],
+               "overlap": config["column_names"][tool]["overlap"],
+              }
+
+    # remove empty terms and keep the first result of each term per feature set
+    result_df = result_df.loc[result_df[term_col].notna() & (result_df[term_col] != ""), :]
+    result_df = result_df.drop_duplicates(subset=[term_col, 'name'], keep='first')
+
+    terms = pd.Index(result_df[term_col].unique())
+    feature_sets = pd.Index(result_df['name'].unique())
+    rows = terms.get_indexer(result_df[term_col])
+    cols = feature_sets.get_indexer(result_df['name'])
+    order = np.lexsort((cols, rows))
+
+    matrices = {
+        'terms': terms.to_numpy(dtype=str),
+        'feature_sets': feature_sets.to_numpy(dtype=str),
+        'indptr': np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(terms)))]).astype(np.int64),
+        'indices': cols[order].astype(np.int32),
+    }
+    for value, column in columns.items():
+        data = get_overlap(result_df[column]) if value == "overlap" else result_df[column].to_numpy(dtype=float)
+        matrices[value] = data[order]
+    return matrices
+
+# save the matrices (NPZ) and the term and feature set index files
+def save_result_matrices(matrices, matrices_path, terms_path, feature_sets_path):
+    np.savez_compressed(matrices_path, shape=np.array([len(matrices['terms']), len(matrices['feature_sets'])]),
+                        **{key: matrices[key] for key in ['indptr', 'indices'] + VALUES})
+    for path, names in [(terms_path, matrices['terms']), (feature_sets_path, matrices['feature_sets'])]:
+        with open(path, 'w') as f:
+            f.writelines(name + "\n" for name in names)
+
+# load saved matrices with their term and feature set names
+def load_result_matrices(matrices_path, terms_path, feature_sets_path):
+    with np.load(matrices_path, allow_pickle=False) as data:
+        matrices = {key: data[key] for key in ['indptr', 'indices'] + VALUES}
+    for key, path in [('terms', terms_path), ('feature_sets', feature_sets_path)]:
+        with open(path) as f:
+            matrices[key] = np.array([line.rstrip('\n') for line in f], dtype=str)
+    return matrices
+
+# one value (adjp, effect or overlap) as scipy CSR matrix
+def to_sparse(matrices, value):
+    return sparse.csr_matrix((matrices[value], matrices['indices'], matrices['indptr']),
+                             shape=(len(matrices['terms']), len(matrices['feature_sets'])))
+
+# one value of selected terms (row positions, default all) as dense array, with NaN for missing (i.e., untested) entries
+def to_dense(matrices, value, rows=None):
+    # 1-based positions of the stored entries, so that explicit zeros and missing entries can be distinguished
+    positions = sparse.csr_matrix((np.arange(1, len(matrices['indices']) + 1), matrices['indices'], matrices['indptr']),
+                                  shape=(len(matrices['terms']), len(matrices['feature_sets'])))
+    if rows is not None:
+        positions = positions[rows]
+    positions = positions.toarray()
+    values = np.append(matrices[value].astype(float), np.nan)
+    return values[np.where(positions > 0, positions - 1, -1)]
@@ -0,0 +1,207 @@
+#!/bin/env python
+
+# node-local shared memory store of read-only database arrays (e.g., the sparse term index of a prepared database)
+# enabled by the Snakefile (config: shared_databases) via the environment variable below, pointing to the node-local store directory.
+# the first job on a node that needs a database loads it into one shared memory segment, concurrent jobs on the same node attach
+# to it read-only and zero-copy. references are tracked as process IDs in a lock file per segment (dead processes are pruned),
+# the segment is removed when its last job detaches, so memory does not scale with the number of concurrent jobs.
+
+import os
+import sys
+import json
+import fcntl
+import atexit
+import hashlib
+import argparse
+from multiprocessing import shared_memory, resource_tracker
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+SHARED_MEMORY_ENV = "ENRICHMENT_ANALYSIS_SHARED_MEMORY"
+
+# segment layout: 8 byte header length, JSON header (name, dtype, shape and offset of each array), arrays aligned to 64 bytes
+ALIGNMENT = 64
+
+def get_store_dir():
+    return os.environ.get(SHARED_MEMORY_ENV, "")
+
+# segment name of a file version (path, modification time and size), i.e., changed databases get a new segment
+def get_segment_name(path):
+    stat = os.stat(path)
+    key = "{}|{}|{}".format(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    return "ea_" + hashlib.sha1(key.encode()).hexdigest()[:20]
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# the resource tracker would remove segments when the first attached process exits (before Python 3.13), references are tracked by the store instead
+def untrack(segment):
+    try:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+
+# SharedMemory.unlink also unregisters the segment from the resource tracker, register it again to keep the tracker consistent
+def unlink(segment):
+    resource_tracker.register(segment._name, "shared_memory")
+    segment.unlink()
+
+def unlink_segment(name):
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    untrack(segment)
+    segment.close()
+    unlink(segment)
+
+def write_segment(name, arrays):
+    header, offset = [], 0
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError("Array {} of dtype object can not be shared.".format(key))
+        header.append({"name": key, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode()
+    start = -(-(8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    segment = shared_memory.SharedMemory(name=name, create=True, size=max(start + offset, 1))
+    untrack(segment)
+    segment.buf[:8] = len(header_bytes).to_bytes(8, 'little')
+    segment.buf[8:8 + len(header_bytes)] = header_bytes
+    for entry, array in zip(header, arrays.values()):
+        view = np.ndarray(entry["shape"], dtype=entry["dtype"], buffer=segment.buf, offset=start + entry["offset"])
+        view[...] = array
+    return segment
+
+# read-only arrays backed by the segment (no copies)
+def read_segment(segment):
+    n = int.from_bytes(bytes(segment.buf[:8]), 'little')
+    header = json.loads(bytes(segment.buf[8:8 + n]).decode())
+    start = -(-(8 + n) // ALIGNMENT) * ALIGNMENT
+    arrays = {}
+    for entry in header:
+        array = np.ndarray(entry["shape"], dtype=entry["dtype"], buffer=segment.buf, offset=start + entry["offset"])
+        array.flags.writeable = False
+        arrays[entry["name"]] = array
+    return arrays
+
+class SharedStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = {}
+        os.makedirs(directory, exist_ok=True)
+
+    # update the references (process IDs) of a segment under its lock
+    def _update_references(self, name, update):
+        with open(os.path.join(self.directory, name + ".lock"), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            content = f.read()
+            pids = [pid for pid in (json.loads(content)["pids"] if content else []) if alive(pid)]
+            result = update(pids)
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps({"pids": result}))
+
+    # arrays of a file from the store; the first process on the node loads them with loader() (a dictionary of arrays) into the store
+    def attach(self, path, loader):
+        name = get_segment_name(path)
+        if name in self.segments:
+            return self.segments[name][1]
+
+        def add_reference(pids):
+            # no live references: (re)create the segment, e.g., removing a stale one left by a killed job
+            if len(pids) == 0:
+                unlink_segment(name)
+                self.segments[name] = (write_segment(name, loader()), None)
+            return sorted(set(pids) | {os.getpid()})
+
+        self._update_references(name, add_reference)
+        if name in self.segments:
+            segment = self.segments[name][0]
+        else:
+            segment = shared_memory.SharedMemory(name=name)
+            untrack(segment)
+        self.segments[name] = (segment, read_segment(segment))
+        return self.segments[name][1]
+
+    # release all references of this process, removing segments without references (under the lock, lock files are kept)
+    def close(self):
+        for name, (segment, _) in self.segments.items():
+            def remove_reference(pids):
+                remaining = [pid for pid in pids if pid != os.getpid()]
+                if len(remaining) == 0:
+                    try:
+                        unlink(segment)
+                    except FileNotFoundError:
+                        pass
+                return remaining
+
+            self._update_references(name, remove_reference)
+            try:
+                segment.close()
+            except BufferError:
+                # arrays are still referenced, the mapping is released at exit
+                pass
+        self.segments = {}
+
+_store = None
+
+# arrays of a file from the node-local store if enabled, otherwise loaded by this process
+def load_shared(path, loader):
+    global _store
+    if get_store_dir() == "":
+        return loader()
+    if _store is None:
+        _store = SharedStore(get_store_dir())
+        atexit.register(_store.close)
+    return _store.attach(path, loader)
+
+# segments of a store directory with their live references
+def get_status(directory):
+    status = []
+    for lock in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if not lock.endswith(".lock"):
+            continue
+        name = lock[:-len(".lock")]
+        with open(os.path.join(directory, lock)) as f:
+            content = f.read()
+        pids = [pid for pid in (json.loads(content)["pids"] if content else []) if alive(pid)]
+        try:
+            segment = shared_memory.SharedMemory(name=name)
+            untrack(segment)
+            size = segment.size
+            segment.close()
+        except FileNotFoundError:
+            size = None
+        status.append({"segment": name, "size_mb": size / 1e6 if size is not None else None, "pids": pids})
+    return status
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clean up the node-local shared memory database store.")
+    parser.add_argument("command", choices=["status", "cleanup"], help="status: list segments and their live references; cleanup: remove segments without live references.")
+    parser.add_argument("--directory", default=get_store_dir(), help="Store directory (default: ${}).".format(SHARED_MEMORY_ENV))
+    parser.add_argument("--all", action='store_true', help="cleanup: also remove segments with live references.")
+    args = parser.parse_args()
+
+    if args.directory == "":
+        sys.exit("No store directory provided.")
+    for entry in get_status(args.directory):
+        if args.command == "status":
+            print(json.dumps(entry))
+        elif args.all or len(entry["pids"]) == 0:
+            unlink_segment(entry["segment"])
+            os.remove(os.path.join(args.directory, entry["segment"] + ".lock"))
+            print("removed {}".format(entry["segment"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/bin/env python
+
+# shared significance layer of all tools (config: significance): multiple testing correction and significance filtering
+# method "tool" keeps the adjusted p-values reported by each tool (GSEApy, LOLA qValue, GREAT p.adjust), BH or BY recomputes them
+# from the raw p-values per query and database (scope: query) or per tool across all queries and databases of the project (scope: project).
+# motif tools report NES instead of p-values (greater is more significant), they are never corrected, only filtered by adjp_th.
+
+import os
+import argparse
+import yaml
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# tools reporting NES as statistic (greater is more significant)
+MOTIF_TOOLS = ["pycisTarget", "RcisTarget"]
+
+METHODS = ["tool", "BH", "BY"]
+SCOPES = ["query", "project"]
+
+# configured correction method and scope
+def get_settings(config):
+    settings = config.get("significance", None) or {}
+    method = settings.get("method", "tool")
+    scope = settings.get("scope", "query")
+    if method not in METHODS:
+        raise ValueError("Unsupported multiple testing correction method: {} (supported: {}).".format(method, ", ".join(METHODS)))
+    if scope not in SCOPES:
+        raise ValueError("Unsupported multiple testing correction scope: {} (supported: {}).".format(scope, ", ".join(SCOPES)))
+    return method, scope
+
+def get_threshold(config, tool):
+    return float(config["adjp_th"][tool])
+
+# significance of adjusted p-values (or NES of motif tools) as one mask, works on arrays, Series and DataFrames (missing values are not significant)
+def get_significance_mask(values, tool, threshold):
+    return values >= threshold if tool in MOTIF_TOOLS else values <= threshold
+
+# Benjamini-Hochberg (BH) or Benjamini-Yekutieli (BY) adjusted p-values of many families (e.g., queries) at once:
+# sorted once by family and p-value, missing p-values are not tested (NaN)
+def adjust_pvalues(pvalues, method="BH", families=None):
+    pvalues = np.asarray(pvalues, dtype=float)
+    result = np.full(len(pvalues), np.nan)
+    valid = np.flatnonzero(~np.isnan(pvalues))
+    if len(valid) == 0:
+        return result
+
+    p = pvalues[valid]
+    family = np.zeros(len(valid), dtype=np.int64) if families is None else pd.factorize(np.asarray(families)[valid])[0]
+    order = np.lexsort((p, family))
+    family = family[order]
+    sizes = np.bincount(family)
+    m = sizes[family]
+    rank = np.arange(len(order)) - np.concatenate([[0], np.cumsum(sizes)[:-1]])[family] + 1
+
+    adjusted = np.minimum(p[order] * m / rank, 1)
+    if method == "BY":
+        # harmonic number of each family size
+        adjusted = np.minimum(adjusted * np.cumsum(1 / np.arange(1, sizes.max() + 1))[m - 1], 1)
+    elif method != "BH":
+        raise ValueError("Unsupported multiple testing correction method: {}.".format(method))
+
+    # monotone: cumulative minimum from the largest p-value downwards within each family
+    adjusted = pd.Series(adjusted[::-1]).groupby(family[::-1]).cummin().to_numpy()[::-1]
+    result[valid[order]] = adjusted
+    return result
+
+# project-wide adjusted p-values (written by the project scope rule) of one result file, in the row order of the file
+class ProjectPvalues:
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            self.paths = {os.path.normpath(str(result_path)): i for i, result_path in enumerate(data['paths'])}
+            self.offsets = data['offsets']
+            self.adjp = data['adjp']
+
+    def get(self, result_path):
+        i = self.paths.get(os.path.normpath(result_path))
+        if i is None:
+            raise KeyError("No project-wide adjusted p-values of {}.".format(result_path))
+        return self.adjp[self.offsets[i]:self.offsets[i+1]]
+
+# adjusted p-values of a long-format result table (one row per term, families per query in column family_col) according to the config,
+# the adjusted p-values of the tool are kept as {adj_pvalue}_tool; project scope: the table contains the project-wide values in column project_col
+def adjust_results(result_df, tool, config, family_col=None, project_col=None):
+    method, scope = get_settings(config)
+    if method == "tool" or tool in MOTIF_TOOLS or result_df.shape[0] == 0:
+        return result_df
+
+    adjp_col = config["column_names"][tool]["adj_pvalue"]
+    result_df = result_df.copy()
+    result_df[adjp_col + "_tool"] = result_df[adjp_col] if adjp_col in result_df.columns else np.nan
+    if scope == "project":
+        result_df[adjp_col] = result_df[project_col].to_numpy()
+        return result_df.drop(columns=[project_col])
+
+    pvalues = pd.to_numeric(result_df[config["column_names"][tool]["p_value"]], errors='coerce').to_numpy()
+    result_df[adjp_col] = adjust_pvalues(pvalues, method, result_df[family_col].to_numpy() if family_col is not None else None)
+    return result_df
+
+# project scope: adjust the p-values of all result files per tool in one pass (families: tools) and save them per file
+def adjust_project(result_paths, output_path, config):
+    method, _ = get_settings(config)
+    paths, pvalues, tools = [], [], []
+    for path in result_paths:
+        tool = os.path.basename(os.path.dirname(os.path.dirname(path)))
+        if tool in MOTIF_TOOLS:
+            continue
+        values = np.zeros(0)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            p_col = config["column_names"][tool]["p_value"]
+            res = pd.read_csv(path, index_col=0)
+            values = pd.to_numeric(res[p_col], errors='coerce').to_numpy(dtype=float) if p_col in res.columns else np.full(res.shape[0], np.nan)
+        paths.append(os.path.normpath(path))
+        pvalues.append(values)
+        tools.append(np.repeat(tool, len(values)))
+
+    offsets = np.cumsum([0] + [len(values) for values in pvalues]).astype(np.int64)
+    adjp = adjust_pvalues(np.concatenate(pvalues + [np.zeros(0)]), "BH" if method == "tool" else method, np.concatenate(tools + [np.zeros(0, dtype=str)]))
+    np.savez_compressed(output_path, paths=np.array(paths, dtype=str), offsets=offsets, adjp=adjp)
+
+def main():
+    parser = argparse.ArgumentParser(description="Adjust the p-values of all result files per tool across the project (significance scope: project).")
+    parser.add_argument("--results", nargs='+', required=True, help="Result files ({result_path}/{feature_set}/{tool}/{db}/{feature_set}_{db}.csv).")
+    parser.add_argument("--output", required=True, help="Path of the project-wide adjusted p-values (NPZ).")
+    parser.add_argument("--config", required=True, help="Path to the config file.")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+    adjust_project(args.results, args.output, config)
+
+if __name__ == "__main__":
+    if "snakemake" in globals():
+        adjust_project(list(snakemake.input["results"]), snakemake.output["project_adjp"], snakemake.config)
+    else:
+        main()
@@ -0,0 +1,48 @@
+#!/bin/env python
+import os
+import glob
+import json
+import argparse
+import pandas as pd
+
+# load all recorded spans of a run
+def load_spans(profiling_dir):
+    records = []
+    for path in glob.glob(os.path.join(profiling_dir, '*', '*.jsonl')):
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip() != "")
+    return pd.DataFrame(records)
+
+# roll up the spans per tool, database and span name
+def summarize(spans):
+    summary = spans.groupby(['tool', 'db', 'span'], sort=False).agg(jobs=('job', 'nunique'),
+                                                                    total_s=('s', 'sum'),
+                                                                    mean_s=('s', 'mean'),
+                                                                    max_s=('s', 'max'),
+                                                                    cpu_s=('cpu_s', 'sum'),
+                                                                    max_rss_mb=('max_rss_mb', 'max'),
+                                                                   ).reset_index()
+    # share of each span in the total runtime of its tool
+    summary['tool_share'] = summary['total_s'] / summary.groupby('tool')['total_s'].transform('sum')
+    return summary.sort_values('total_s', ascending=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the profiling spans of a run per tool, database and span.")
+    parser.add_argument("--profiling_dir", required=True, help="Profiling directory containing {tool}/{job}_{db}.jsonl files.")
+    parser.add_argument("--output", required=True, help="Path of the summary table (CSV).")
+    parser.add_argument("--top", type=int, default=10, help="Number of hot paths to print.")
+    args = parser.parse_args()
+
+    spans = load_spans(args.profiling_dir)
+    if spans.shape[0] == 0:
+        print(f"No profiling spans found in {args.profiling_dir}.")
+        return
+
+    summary = summarize(spans)
+    summary.round(3).to_csv(args.output, index=False)
+
+    print(f"Profiling summary saved in {args.output}. Hot paths:")
+    print(summary.head(args.top).round(3).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
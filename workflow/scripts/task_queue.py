@@ -0,0 +1,358 @@
+#!/bin/env python
+
+# distributed execution of the gene set enrichment engines (ORA_GSEApy incl. region-weighted ORA, preranked_GSEApy) via a task queue, for projects with many queries
+# where one Snakemake job per query x database does not scale: the query x database combinations are partitioned into chunks (tasks),
+# workers pull tasks from a shared queue directory and write the result files of the workflow (merged as usual by aggregate.py).
+# the queue is a directory on a shared file system with one JSON file per task in pending/, running/, done/ and failed/:
+# a task is claimed by an atomic rename from pending/ to running/, its lease is renewed by a background thread (modification time) and
+# tasks of preempted or crashed workers are put back to pending/ once their lease expired (failed/ after max_attempts).
+# workers keep database indexes and the gene normalizer in memory across tasks, result files are written atomically (.part + rename).
+# the local mode runs the workers as processes on one machine (stand-in for cluster workers started with the worker command).
+# run from the working directory of the workflow, after the region sets were mapped to genes (GREAT) and the resources were prepared:
+#   python workflow/scripts/task_queue.py local --config config/config.yaml --queue .queue --workers 4
+#   python workflow/scripts/task_queue.py submit --config config/config.yaml --queue /shared/queue --chunk_size 50
+#   python workflow/scripts/task_queue.py worker --queue /shared/queue   (e.g., one per cluster job)
+#   python workflow/scripts/task_queue.py status --queue /shared/queue
+
+import os
+import json
+import time
+import socket
+import argparse
+import traceback
+import threading
+import contextlib
+import multiprocessing
+import yaml
+from instrumentation import Profiler
+from lazy_imports import lazy_import
+from gene_normalization import GeneNormalizer, load_database_index
+from gene_ORA_multi_db import ora_multi_db
+from region_ORA_weighted import ora_weighted
+from prepare_ranks_GSEApy import prepare_ranks
+from gene_preranked_GSEApy import preranked_gsea
+
+pd = lazy_import("pandas")
+
+STATES = ["pending", "running", "done", "failed"]
+TOOLS = ["ORA_GSEApy", "preranked_GSEApy"]
+
+# write JSON atomically (readers never see partial files)
+def write_json(data, path):
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+# file system queue of tasks (JSON files), safe for concurrent workers on a shared file system with atomic renames
+class TaskQueue:
+    def __init__(self, directory):
+        self.directory = directory
+        for state in STATES:
+            os.makedirs(os.path.join(directory, state), exist_ok=True)
+
+    def get_path(self, state, task_id):
+        return os.path.join(self.directory, state, "{}.json".format(task_id))
+
+    def list(self, state):
+        return sorted(name[:-len(".json")] for name in os.listdir(os.path.join(self.directory, state)) if name.endswith(".json"))
+
+    def submit(self, tasks):
+        for task in tasks:
+            write_json(task, self.get_path("pending", task["task_id"]))
+
+    # claim the next pending task (None if there is none), losing a race to another worker moves on to the next task
+    def claim(self, worker_id):
+        for task_id in self.list("pending"):
+            path = self.get_path("running", task_id)
+            try:
+                os.rename(self.get_path("pending", task_id), path)
+                # start the lease right away (the rename keeps the modification time of the submission)
+                os.utime(path)
+            except FileNotFoundError:
+                continue
+            with open(path) as file:
+                task = json.load(file)
+            task["worker"] = worker_id
+            task["attempts"] = task.get("attempts", 0) + 1
+            write_json(task, path)
+            return task
+        return None
+
+    # renew the lease of a running task
+    def heartbeat(self, task):
+        try:
+            os.utime(self.get_path("running", task["task_id"]))
+        except FileNotFoundError:
+            pass
+
+    # renew the lease from a background thread while the task runs (single items may take longer than the lease)
+    @contextlib.contextmanager
+    def keep_alive(self, task, interval):
+        stop = threading.Event()
+        def renew():
+            while not stop.wait(interval):
+                self.heartbeat(task)
+        thread = threading.Thread(target=renew, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    # move a running task to done/ or failed/ (with the errors of its items)
+    def finish(self, task, errors):
+        task = dict(task, errors=errors)
+        write_json(task, self.get_path("failed" if len(errors) > 0 else "done", task["task_id"]))
+        try:
+            os.remove(self.get_path("running", task["task_id"]))
+        except FileNotFoundError:
+            pass
+
+    # put running tasks with an expired lease back to pending (or failed after max_attempts), returns their number
+    def requeue_expired(self, lease, max_attempts):
+        now = time.time()
+        requeued = 0
+        for task_id in self.list("running"):
+            path = self.get_path("running", task_id)
+            try:
+                if now - os.path.getmtime(path) < lease:
+                    continue
+                with open(path) as file:
+                    task = json.load(file)
+            except (FileNotFoundError, ValueError):
+                continue
+            if task.get("attempts", 0) >= max_attempts:
+                self.finish(task, ["lease expired after {} attempts (last worker: {})".format(task["attempts"], task.get("worker"))])
+                continue
+            try:
+                os.rename(path, self.get_path("pending", task_id))
+                requeued += 1
+            except FileNotFoundError:
+                pass
+        return requeued
+
+    def counts(self):
+        return {state: len(self.list(state)) for state in STATES}
+
+# queries of the annotation per query type (same rules as the Snakemake workflow: gene sets .txt, region sets .bed, ranked genes .csv)
+def load_queries(config):
+    annot = pd.read_csv(config["annotation"], index_col='name')
+    genes = annot.loc[annot['features_path'].str.endswith('.txt'), :].to_dict('index')
+    regions = annot.loc[annot['features_path'].str.endswith('.bed'), :].to_dict('index')
+    rnk = annot.loc[annot['features_path'].str.endswith('.csv'), :].to_dict('index')
+    return genes, regions, rnk
+
+# work items of a tool: ORA tests one query against all databases at once (region sets with the region-weighted engine if ora_weighted,
+# same as the Snakemake rules), preranked GSEA one query x database (ordered by query, i.e., the items of a task share the ranked vector
+# and its null distributions)
+def get_items(config, tool):
+    genes, regions, rnk = load_queries(config)
+    dbs = [db for db, path in config["local_databases"].items() if path != ""]
+    if len(dbs) == 0:
+        return []
+    if tool == "ORA_GSEApy":
+        region_engine = "weighted" if int(config.get("ora_weighted", 0)) else "genes"
+        return [{"feature_set": feature_set, "engine": "genes"} for feature_set in genes] + [{"feature_set": feature_set, "engine": region_engine} for feature_set in regions]
+    if tool == "preranked_GSEApy":
+        return [{"feature_set": feature_set, "db": db} for feature_set in rnk for db in dbs]
+    raise ValueError("Unsupported tool: {} (supported: {}).".format(tool, ", ".join(TOOLS)))
+
+# tasks of at most chunk_size items per tool
+def get_tasks(config, config_path, tools, chunk_size):
+    tasks = []
+    for tool in tools:
+        items = get_items(config, tool)
+        for i, start in enumerate(range(0, len(items), chunk_size)):
+            tasks.append({
+                "task_id": "{}_{:06d}".format(tool, i),
+                "tool": tool,
+                "config": os.path.abspath(config_path),
+                "items": items[start:start + chunk_size],
+                "attempts": 0,
+            })
+    return tasks
+
+# runs the items of tasks with the in-memory state shared across tasks (database indexes, gene normalizer)
+class Worker:
+    def __init__(self, config):
+        self.config = config
+        self.project = config["project_name"]
+        self.result_path = os.path.join(config["result_path"], "enrichment_analysis")
+        self.genes, self.regions, self.rnk = load_queries(config)
+        self.dbs = [db for db, path in config["local_databases"].items() if path != ""]
+        self.normalization_table_path = None
+        if int(config.get("gene_normalization", {}).get("enabled", 0)):
+            self.normalization_table_path = os.path.join("resources", self.project, "gene_normalization_{}.csv".format(config["genome"]))
+        self.null_cache_config = config.get("prerank_null_cache", None) or {}
+        self.normalizer = None
+        self.indexes = {}
+
+    def get_normalizer(self):
+        if self.normalizer is None:
+            self.normalizer = GeneNormalizer(self.normalization_table_path)
+        return self.normalizer
+
+    def load_index(self, path):
+        if path not in self.indexes:
+            self.indexes[path] = load_database_index(path)
+        return self.indexes[path]
+
+    def get_database_index_path(self, db):
+        return os.path.join("resources", self.project, "{}.npz".format(db))
+
+    def get_result_path(self, feature_set, tool, db):
+        return os.path.join(self.result_path, feature_set, tool, db, "{}_{}.csv".format(feature_set, db))
+
+    def run(self, tool, item):
+        if tool == "ORA_GSEApy" and item.get("engine") == "weighted":
+            self.run_ora_weighted(item["feature_set"])
+        elif tool == "ORA_GSEApy":
+            self.run_ora(item["feature_set"])
+        elif tool == "preranked_GSEApy":
+            self.run_prerank(item["feature_set"], item["db"])
+        else:
+            raise ValueError("Unsupported tool: {}.".format(tool))
+
+    # same inputs as the rule gene_ORA_GSEApy (region sets: genes of their GREAT associations)
+    def run_ora(self, feature_set):
+        if feature_set in self.genes:
+            query_genes_path = self.genes[feature_set]['features_path']
+            background_genes_path = self.genes[feature_set]['background_path']
+        else:
+            query_genes_path = os.path.join(self.result_path, feature_set, 'GREAT', 'genes.txt')
+            background_genes_path = os.path.join(self.result_path, self.regions[feature_set]['background_name'], 'GREAT', 'genes.txt')
+        result_paths = [self.get_result_path(feature_set, "ORA_GSEApy", db) for db in self.dbs]
+        part_paths = [path + ".part" for path in result_paths]
+
+        ora_multi_db(query_genes_path, background_genes_path, [self.get_database_index_path(db) for db in self.dbs], self.dbs, part_paths,
+                     Profiler("ORA_GSEApy", feature_set, "multi_db"), self.normalization_table_path,
+                     normalizer=self.get_normalizer(), load_index=self.load_index)
+        for part_path, result_path in zip(part_paths, result_paths):
+            if os.path.exists(part_path):
+                os.replace(part_path, result_path)
+
+    # same inputs as the rule region_ORA_weighted (GREAT associations of the region set and of its background region set)
+    def run_ora_weighted(self, feature_set):
+        associations_path = os.path.join(self.result_path, feature_set, 'GREAT', 'region_gene_associations.csv')
+        background_associations_path = os.path.join(self.result_path, self.regions[feature_set]['background_name'], 'GREAT', 'region_gene_associations.csv')
+        result_paths = [self.get_result_path(feature_set, "ORA_GSEApy", db) for db in self.dbs]
+        part_paths = [path + ".part" for path in result_paths]
+
+        ora_weighted(associations_path, background_associations_path, [self.get_database_index_path(db) for db in self.dbs], self.dbs, part_paths,
+                     Profiler("ORA_GSEApy", feature_set, "weighted"), self.normalization_table_path,
+                     normalizer=self.get_normalizer(), load_index=self.load_index)
+        for part_path, result_path in zip(part_paths, result_paths):
+            os.replace(part_path, result_path)
+
+    # same steps as the rules prepare_ranks_GSEApy and gene_preranked_GSEApy (GSEApy or the null distribution cache, as configured)
+    def run_prerank(self, feature_set, db):
+        ranks_path = os.path.join(self.result_path, feature_set, 'preranked_GSEApy', '{}_ranks.npz'.format(feature_set))
+        if not os.path.exists(ranks_path):
+            rnk_path = self.rnk[feature_set]['features_path']
+            os.makedirs(os.path.dirname(ranks_path), exist_ok=True)
+            prepare_ranks(rnk_path, ranks_path + ".part.npz", self.normalization_table_path)
+            os.replace(ranks_path + ".part.npz", ranks_path)
+
+        result_path = self.get_result_path(feature_set, "preranked_GSEApy", db)
+        part_path = result_path + ".part"
+        preranked_gsea(ranks_path, os.path.join("resources", self.project, "normalized", "{}.gmt".format(db)), self.get_database_index_path(db), part_path, db,
+                       Profiler("preranked_GSEApy", feature_set, db), os.path.join("resources", self.project, "prerank_null_cache"),
+                       self.null_cache_config, load_index=self.load_index)
+        os.replace(part_path, result_path)
+
+# pull and run tasks until the queue is drained (no pending and no running tasks), returns the number of completed tasks
+def run_worker(queue_dir, lease=600, max_attempts=3, poll=10, worker_id=None):
+    queue = TaskQueue(queue_dir)
+    worker_id = worker_id or "{}:{}".format(socket.gethostname(), os.getpid())
+    workers = {}
+    completed = 0
+    while True:
+        queue.requeue_expired(lease, max_attempts)
+        task = queue.claim(worker_id)
+        if task is None:
+            if len(queue.list("pending")) == 0 and len(queue.list("running")) == 0:
+                return completed
+            time.sleep(poll)
+            continue
+
+        # one worker state per config (tasks carry the path of their config)
+        if task["config"] not in workers:
+            with open(task["config"], 'r') as file:
+                workers[task["config"]] = Worker(yaml.safe_load(file))
+        worker = workers[task["config"]]
+
+        errors = []
+        with queue.keep_alive(task, lease / 4):
+            for item in task["items"]:
+                try:
+                    worker.run(task["tool"], item)
+                except Exception:
+                    errors.append({"item": item, "error": traceback.format_exc()})
+        queue.finish(task, errors)
+        completed += 1
+        print("{} {}: {} items, {} failed".format(worker_id, task["task_id"], len(task["items"]), len(errors)), flush=True)
+
+def submit(config_path, queue_dir, chunk_size, tools):
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file)
+    tasks = get_tasks(config, config_path, tools, max(chunk_size, 1))
+    TaskQueue(queue_dir).submit(tasks)
+    print("submitted {} tasks ({} items) to {}".format(len(tasks), sum(len(task["items"]) for task in tasks), queue_dir))
+    return tasks
+
+def status(queue_dir):
+    queue = TaskQueue(queue_dir)
+    print(", ".join("{}: {}".format(state, count) for state, count in queue.counts().items()))
+    for task_id in queue.list("failed"):
+        with open(queue.get_path("failed", task_id)) as file:
+            task = json.load(file)
+        for error in task.get("errors", []):
+            if isinstance(error, dict):
+                print("{} {}:\n{}".format(task_id, json.dumps(error["item"]), error["error"]))
+            else:
+                print("{}: {}".format(task_id, error))
+    return queue.counts()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the gene set enrichment engines (ORA_GSEApy, preranked_GSEApy) via a task queue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = argparse.ArgumentParser(add_help=False)
+    submit_parser.add_argument("--config", required=True, help="Path to the config file.")
+    submit_parser.add_argument("--chunk_size", type=int, default=50, help="Number of work items (ORA: queries, preranked: query x database) per task.")
+    submit_parser.add_argument("--tools", nargs='+', choices=TOOLS, default=TOOLS, help="Tools to run.")
+    worker_parser = argparse.ArgumentParser(add_help=False)
+    worker_parser.add_argument("--lease", type=float, default=600, help="Seconds without a heartbeat of its worker after which a running task is requeued (renewed every lease/4 seconds).")
+    worker_parser.add_argument("--max_attempts", type=int, default=3, help="Attempts per task before it is failed.")
+    worker_parser.add_argument("--poll", type=float, default=10, help="Seconds between polls while other workers hold the remaining tasks.")
+
+    for name, parents, description in [("submit", [submit_parser], "Partition the queries x databases into tasks and add them to the queue."),
+                                       ("worker", [worker_parser], "Pull and run tasks until the queue is drained."),
+                                       ("local", [submit_parser, worker_parser], "Submit and run the tasks with local worker processes."),
+                                       ("status", [], "Show the number of tasks per state and the errors of failed tasks.")]:
+        subparser = subparsers.add_parser(name, parents=parents, help=description)
+        subparser.add_argument("--queue", required=True, help="Queue directory (on a file system shared by all workers).")
+        if name == "local":
+            subparser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of local worker processes.")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        submit(args.config, args.queue, args.chunk_size, args.tools)
+    elif args.command == "worker":
+        run_worker(args.queue, args.lease, args.max_attempts, args.poll)
+    elif args.command == "local":
+        submit(args.config, args.queue, args.chunk_size, args.tools)
+        processes = [multiprocessing.Process(target=run_worker, args=(args.queue, args.lease, args.max_attempts, min(args.poll, 1)))
+                     for _ in range(max(args.workers, 1))]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        status(args.queue)
+    else:
+        status(args.queue)
+
+if __name__ == "__main__":
+    main()
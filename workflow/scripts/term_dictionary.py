@@ -0,0 +1,42 @@
+#!/bin/env python
+
+# harmonized term dictionary across tools and databases: every term of the results is mapped to a normalized name and an integer term ID,
+# so that results of different tools can be joined on integers instead of matching (long) term strings.
+# motif tools (pycisTarget, RcisTarget) describe a term as "motif (TF annotation)", their terms are identified by the motif ID only.
+
+import os
+from significance import MOTIF_TOOLS
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+# normalized names of terms (case-insensitive; whitespace, underscores and dashes are equivalent), normalized once per distinct term
+def normalize_terms(terms, tool):
+    codes, uniques = pd.factorize(pd.Series(terms, dtype=object).fillna("").astype(str))
+    names = pd.Series(uniques, dtype=object)
+    if tool in MOTIF_TOOLS:
+        names = names.str.split("(", n=1).str[0]
+    names = names.str.casefold().str.replace(r"[\s_\-]+", " ", regex=True).str.strip()
+    return names.to_numpy()[codes]
+
+class TermDictionary:
+    def __init__(self):
+        self.names = pd.Index([], dtype=object)
+
+    # integer IDs of normalized names, unseen names get the next IDs (in order of appearance)
+    def get_ids(self, names):
+        names = pd.Index(names, dtype=object)
+        ids = self.names.get_indexer(names)
+        missing = names[ids < 0].unique()
+        if len(missing) > 0:
+            ids[ids < 0] = missing.get_indexer(names[ids < 0]) + len(self.names)
+            self.names = self.names.append(missing)
+        return ids
+
+    def to_frame(self):
+        return pd.DataFrame({"term_id": range(len(self.names)), "name": self.names.to_numpy()})
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        self.to_frame().to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# paginated static HTML report of large projects, an alternative to snakemake --report (which embeds every plot into one file):
+# an index of all groups and one (paginated) page per group with its summary plots and the enrichment plots of its queries per tool and database.
+# plots are referenced as lazily loaded images instead of embedded; pages are rebuilt incrementally, i.e., only if the files they reference changed
+
+import os
+import json
+import html
+import hashlib
+import argparse
+from urllib.parse import quote
+import yaml
+from scheduler import get_group_combinations
+
+# bump to rebuild all pages after changes of the page layout
+REPORT_VERSION = 1
+
+STYLE = """
+body { font-family: sans-serif; margin: 2em; }
+.cards { display: flex; flex-wrap: wrap; gap: 1em; }
+figure { margin: 0; width: 320px; }
+figure img { width: 320px; border: 1px solid #ddd; }
+figure.missing { height: 120px; border: 1px dashed #bbb; color: #777; padding: 0.5em; box-sizing: border-box; }
+nav a { margin-right: 0.5em; }
+table { border-collapse: collapse; }
+td, th { border: 1px solid #ddd; padding: 0.3em 0.6em; text-align: left; }
+"""
+
+# card of one plot: image (if rendered) with links to its data
+def make_card(title, plot_path, links, report_dir):
+    links_html = " ".join(f'<a href="{quote(os.path.relpath(path, report_dir))}">{html.escape(name)}</a>' for name, path in links if os.path.exists(path))
+    if os.path.exists(plot_path) and os.path.getsize(plot_path) > 0:
+        src = quote(os.path.relpath(plot_path, report_dir))
+        return f'<figure><a href="{src}"><img src="{src}" loading="lazy" alt="{html.escape(title)}"></a><figcaption>{html.escape(title)} {links_html}</figcaption></figure>'
+    return f'<figure class="missing">{html.escape(title)}: not rendered (empty result or lazy_plots, see workflow/render_plots.py) {links_html}</figure>'
+
+# cards of one group: summary plots and enrichment plots of its queries per tool and database, with all referenced files
+def get_group_cards(result_path, group, combinations):
+    cards = []
+    for tool, db, feature_sets in sorted(combinations):
+        group_dir = os.path.join(result_path, group, tool, db)
+        summary = {name: os.path.join(group_dir, f"{group}_{db}_{name}") for name in ["summary.png", "adjp_heatmap.pdf", "effect_heatmap.pdf", "all.csv", "sig.csv", "plot_data.csv"]}
+        cards.append((f"{tool} - {db}", "summary", summary["summary.png"], [(name, path) for name, path in summary.items() if name != "summary.png"]))
+        for feature_set in feature_sets:
+            output_dir = os.path.join(result_path, feature_set, tool, db)
+            cards.append((f"{tool} - {db}", feature_set, os.path.join(output_dir, f"{feature_set}_{db}.png"),
+                          [("table", os.path.join(output_dir, f"{feature_set}_{db}.csv"))]))
+    return cards
+
+# signature of a page: layout version, its content and state (modification time, size) of all referenced files
+def get_signature(items, paths):
+    state = [(path, os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else (path, None, None) for path in paths]
+    return hashlib.sha256(json.dumps([REPORT_VERSION, items, state]).encode()).hexdigest()
+
+def page_name(prefix, page):
+    return f"{prefix}.html" if page == 1 else f"{prefix}_{page}.html"
+
+def write_page(path, title, navigation, body):
+    with open(path, 'w') as f:
+        f.write(f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{html.escape(title)}</title><style>{STYLE}</style></head>\n'
+                f'<body><h1>{html.escape(title)}</h1>\n<nav>{navigation}</nav>\n{body}\n<nav>{navigation}</nav></body></html>\n')
+
+# links to all pages of a paginated page, e.g., 1 2 3
+def make_navigation(prefix, n_pages, index=None):
+    links = [f'<a href="{index}">index</a>'] if index is not None else []
+    if n_pages > 1:
+        links += [f'<a href="{quote(page_name(prefix, page))}">{page}</a>' for page in range(1, n_pages + 1)]
+    return " ".join(links)
+
+def build_report(config, report_dir, page_size=50, force=False):
+    result_path = os.path.join(os.path.abspath(config['result_path']), "enrichment_analysis")
+    os.makedirs(report_dir, exist_ok=True)
+    manifest_path = os.path.join(report_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    groups = {}
+    for group, tool, db, feature_sets in get_group_combinations(config):
+        groups.setdefault(group, []).append((tool, db, feature_sets))
+
+    # group pages: page_size plots per page, sections (tool - database) are continued on the next page
+    pages, written, index_rows = {}, 0, []
+    for group in sorted(groups):
+        cards = get_group_cards(result_path, group, groups[group])
+        chunks = [cards[i:i + page_size] for i in range(0, len(cards), page_size)]
+        prefix = f"group_{group}"
+        for page, chunk in enumerate(chunks, start=1):
+            name = page_name(prefix, page)
+            paths = [path for _, _, plot_path, links in chunk for path in [plot_path] + [link for _, link in links]]
+            pages[name] = get_signature([prefix, page, len(chunks), [card[:2] for card in chunk]], paths)
+            if manifest.get(name) == pages[name] and os.path.exists(os.path.join(report_dir, name)):
+                continue
+            body, section = [], None
+            for card_section, card_name, plot_path, links in chunk:
+                if card_section != section:
+                    body.append(("</div>\n" if section is not None else "") + f'<h2>{html.escape(card_section)}</h2>\n<div class="cards">')
+                    section = card_section
+                body.append(make_card(card_name, plot_path, links, report_dir))
+            body.append("</div>")
+            write_page(os.path.join(report_dir, name), f"{group} ({page}/{len(chunks)})", make_navigation(prefix, len(chunks), "index.html"), "\n".join(body))
+            written += 1
+        sections = ", ".join(f"{tool} - {db}" for tool, db, _ in sorted(groups[group]))
+        index_rows.append(f'<tr><td><a href="{quote(page_name(prefix, 1))}">{html.escape(group)}</a></td><td>{len(chunks)}</td><td>{html.escape(sections)}</td></tr>')
+
+    # index pages: page_size groups per page
+    chunks = [index_rows[i:i + page_size] for i in range(0, len(index_rows), page_size)] or [[]]
+    for page, chunk in enumerate(chunks, start=1):
+        name = page_name("index", page)
+        pages[name] = get_signature([page, len(chunks), chunk], [])
+        if manifest.get(name) == pages[name] and os.path.exists(os.path.join(report_dir, name)):
+            continue
+        body = "<table><tr><th>group</th><th>pages</th><th>tool - database</th></tr>\n" + "\n".join(chunk) + "\n</table>"
+        write_page(os.path.join(report_dir, name), f"{config['project_name']} enrichment analysis", make_navigation("index", len(chunks)), body)
+        written += 1
+
+    # remove pages that are not part of the report anymore (e.g., removed groups or fewer pages)
+    for name in set(manifest) - set(pages):
+        if os.path.exists(os.path.join(report_dir, name)):
+            os.remove(os.path.join(report_dir, name))
+
+    with open(manifest_path, 'w') as f:
+        json.dump(pages, f, indent=1)
+    print(f"Report {os.path.join(report_dir, 'index.html')}: {written} of {len(pages)} pages (re)built.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build (incrementally) a paginated static HTML report of all groups, referencing instead of embedding the plots.")
+    parser.add_argument('--config', default='test/config/example_enrichment_analysis_config.yaml', help="Path to the config file of the run.")
+    parser.add_argument('--output', default=None, help="Report directory (default: {result_path}/enrichment_analysis/report).")
+    parser.add_argument('--page_size', type=int, default=50, help="Maximum number of plots (groups on index pages) per page.")
+    parser.add_argument('--force', action='store_true', help="Rebuild all pages.")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file)
+    report_dir = args.output if args.output is not None else os.path.join(os.path.abspath(config['result_path']), "enrichment_analysis", "report")
+    build_report(config, os.path.abspath(report_dir), max(args.page_size, 1), args.force)
+
+if __name__ == "__main__":
+    main()
@@ -1,71 +1,46 @@
 #!/usr/bin/env python3
 
 import os
-import subprocess
+import argparse
 import yaml
-import pandas as pd
+from scheduler import get_group_combinations, run_jobs
 
 # 加载配置文件
 config_path = os.path.abspath('test/config/example_enrichment_analysis_config.yaml')
 with open(config_path, 'r') as file:
     config = yaml.safe_load(file)
 
-result_path = os.path.abspath(config['result_path'])
-
-# 自动获取 group、tool 和 db 的函数
-def get_groups_tools_dbs(config):
-    annotation_path = os.path.abspath(config['annotation'])
-    annot = pd.read_csv(annotation_path, index_col='name')
-
-    groups = annot['group'].unique().tolist()
-    tools = list(config["column_names"].keys())
-    databases = list(config["local_databases"].keys())
-
-    return groups, tools, databases
+result_path = os.path.join(os.path.abspath(config['result_path']), "enrichment_analysis")
+
+# 构建一个 group/tool/db 汇总图的渲染任务（名称、命令、日志文件），从预先计算的绘图数据渲染
+def visualize_job(conda_env, group, tool, db):
+    output_dir = os.path.join(result_path, group, tool, db)
+    log_file = os.path.join("logs", f"visualize_{group}_{tool}_{db}.log")
+
+    # 调用 R 脚本生成可视化
+    script_path = os.path.abspath("workflow/scripts/overview_plot.R")
+    command = [
+        'conda', 'run', '--no-capture-output', '--name', conda_env,
+        'Rscript', script_path,
+        os.path.join(output_dir, f"{group}_{db}_plot_data.csv"),
+        os.path.join(output_dir, f"{group}_{db}_summary.png"),
+        os.path.join(output_dir, f"{group}_{db}_adjp_heatmap.pdf"),
+        os.path.join(output_dir, f"{group}_{db}_effect_heatmap.pdf"),
+        tool, db, group, config_path
+    ]
+    return (f"Visualization of group '{group}', tool '{tool}', and database '{db}'", command, log_file), output_dir
 
 # 主函数
 def main():
-    conda_env = 'visualization'
-    if conda_env is None:
-        raise RuntimeError("Conda environment not found. Ensure the script is run within a Snakemake conda environment.")
-
-    groups, tools, databases = get_groups_tools_dbs(config)
+    parser = argparse.ArgumentParser(description="Render the group summary plots from the precomputed plot data.")
+    parser.add_argument('--cores', type=int, default=os.cpu_count(), help="Number of summary plots rendered in parallel.")
+    args = parser.parse_args()
 
-    for group in groups:
-        for tool in tools:
-            for db in databases:
-                results_all = os.path.join(result_path, "enrichment_analysis", group, tool, db, f"{group}_{db}_all.csv")
-                summary_plot = os.path.join(result_path, "enrichment_analysis", group, tool, db, f"{group}_{db}_summary.png")
-                adjp_hm = os.path.join(result_path, "enrichment_analysis", group, tool, db, f"{group}_{db}_adjp_heatmap.pdf")
-                effect_hm = os.path.join(result_path, "enrichment_analysis", group, tool, db, f"{group}_{db}_effect_heatmap.pdf")
-                log_file = os.path.join("logs", f"visualize_{group}_{tool}_{db}.log")
-
-                # 创建日志和输出目录
-                os.makedirs(os.path.dirname(summary_plot), exist_ok=True)
-                os.makedirs(os.path.dirname(adjp_hm), exist_ok=True)
-                os.makedirs(os.path.dirname(effect_hm), exist_ok=True)
-                os.makedirs(os.path.dirname(log_file), exist_ok=True)
-
-                # 调用 R 脚本生成可视化
-                script_path = os.path.abspath("workflow/scripts/overview_plot.R")
-                command = [
-                    'conda', 'run', '--no-capture-output', '--name', conda_env,
-                    'Rscript', script_path,
-                    results_all, summary_plot, adjp_hm, effect_hm,
-                    tool, db, group, config_path
-                ]
-
-                with open(log_file, 'w') as log:
-                    result = subprocess.run(command, stdout=log, stderr=log, text=True)
+    conda_env = 'visualization'
 
-                # 检查执行结果
-                if result.returncode != 0:
-                    print(f"Visualization failed for group '{group}', tool '{tool}', and database '{db}'. Check the log file {log_file} for details.")
-                else:
-                    print(f"Visualization completed successfully for group '{group}', tool '{tool}', and database '{db}'.")
-                    print(f"Summary plot saved in {summary_plot}")
-                    print(f"AdjP heatmap saved in {adjp_hm}")
-                    print(f"Effect heatmap saved in {effect_hm}")
+    # 只枚举有效的 group/tool/db 组合，每个 R 进程独立渲染，事件循环只负责调度并写入日志
+    combinations = [visualize_job(conda_env, group, tool, db) for group, tool, db, _ in get_group_combinations(config)]
+    run_jobs([job for job, _ in combinations], args.cores, [directory for _, directory in combinations])
 
 if __name__ == "__main__":
     main()